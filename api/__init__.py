@@ -1,10 +1,27 @@
-from fastapi import FastAPI, HTTPException
+import datetime
+import gzip
+
+from fastapi import FastAPI, HTTPException, Request, Response, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
-from db import Session
-from db.models import Dataset
+from etc.config import config
+from ingest.metrics import read_latest_run_report, get_prometheus_metrics
 from somisana.version import VERSION
-from .models import DatasetMetadata, Variable, Threshold
+from tiles import TileStore, LruTileCache
+from .metadata_cache import DatasetMetadataCache
+from .tile_cache import TileCache
+from .models import DatasetMetadata, PointTimeSeries, VerticalProfile
+from .ocean_data import PointNotFound, read_point_time_series, read_vertical_profile
+
+TILE_CACHE_DIR = config.get('TILES', 'CACHE_DIR', fallback=None)
+TILE_MEMORY_CACHE_MB = config.getint('TILES', 'MEMORY_CACHE_MB', fallback=256)
+TILE_GENERATION_TTL_SECONDS = config.getint('TILES', 'GENERATION_TTL_SECONDS', fallback=30)
+TILE_MAX_AGE_SECONDS = config.getint('TILES', 'MAX_AGE_SECONDS', fallback=86400)
+METRICS_REPORT_DIR = config.get('METRICS', 'REPORT_DIR', fallback='ingest_reports')
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4'
 
 app = FastAPI(
     title="SOMISANA API",
@@ -19,32 +36,105 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
+)
+
+dataset_metadata_cache = DatasetMetadataCache()
+tile_cache = TileCache(
+    LruTileCache(TILE_MEMORY_CACHE_MB * 2 ** 20),
+    TileStore(TILE_CACHE_DIR) if TILE_CACHE_DIR else None,
+    TILE_GENERATION_TTL_SECONDS
 )
 
 
-@app.get("/dataset_meta/{dataset_id}")
-async def get_dataset_metadata(dataset_id: str) -> DatasetMetadata:
-    dataset = Session.get(Dataset, dataset_id)
+@app.get("/dataset_meta/{dataset_id}", response_model=DatasetMetadata)
+async def get_dataset_metadata(dataset_id: str, request: Request) -> Response:
+    cached_metadata = await run_in_threadpool(dataset_metadata_cache.get, dataset_id)
 
-    if not dataset:
+    if not cached_metadata:
         raise HTTPException(status_code=404, detail=f"Dataset {dataset_id} not found")
 
-    return DatasetMetadata(
-        start_date=dataset.start_date,
-        end_date=dataset.end_date,
-        time_step_minutes=dataset.time_step_minutes,
-        variables=[
-            Variable(
-                name=variable.variable_name,
-                thresholds=[
-                    Threshold(
-                        min_value=threshold.min_value,
-                        max_value=threshold.max_value,
-                        dependant_value=threshold.dependent_variable_value
-                    )
-                    for threshold in variable.thresholds
-                ]
-            )
-            for variable in dataset.variables
-        ],
-    )
+    # Clients revalidate on every request, and only get the metadata again once a new generation was ingested
+    headers = {'ETag': cached_metadata.etag, 'Cache-Control': 'no-cache'}
+    if request.headers.get('if-none-match') == cached_metadata.etag:
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=cached_metadata.body, media_type='application/json', headers=headers)
+
+
+def accepts_gzip(accept_encoding: str | None) -> bool:
+    """
+    Whether an Accept-Encoding header accepts gzip, explicitly or through a wildcard, without a q=0 that refuses it.
+    """
+    accepted = {}
+    for coding in (accept_encoding or '').split(','):
+        name, *params = [part.strip() for part in coding.split(';')]
+        quality = next((param[2:] for param in params if param.startswith('q=')), '1')
+        try:
+            accepted[name.lower()] = float(quality) > 0
+        except ValueError:
+            accepted[name.lower()] = False
+    return accepted.get('gzip', accepted.get('*', False))
+
+
+@app.get("/tiles/{dataset_id}/{z}/{x}/{y}.mvt")
+async def get_tile(dataset_id: str, z: int, x: int, y: int, date_time: datetime.datetime, depth: float,
+                   request: Request) -> Response:
+    cached_tile = await run_in_threadpool(tile_cache.get_tile, dataset_id, date_time, depth, z, x, y)
+
+    if not cached_tile:
+        raise HTTPException(status_code=404, detail=f"Dataset {dataset_id} not found")
+
+    # Tiles are stored gzip compressed, and only change when a new generation of the dataset is ingested.
+    # Clients that don't accept gzip get them decompressed, which shared caches keep apart by the Vary header.
+    tile_key, tile = cached_tile
+    gzip_accepted = accepts_gzip(request.headers.get('accept-encoding'))
+    headers = {
+        'ETag': f'"{tile_key.generation}"' if gzip_accepted else f'"{tile_key.generation}-identity"',
+        'Cache-Control': f'public, max-age={TILE_MAX_AGE_SECONDS}',
+        'Vary': 'Accept-Encoding',
+    }
+    if gzip_accepted:
+        headers['Content-Encoding'] = 'gzip'
+    if request.headers.get('if-none-match') == headers['ETag']:
+        return Response(status_code=304, headers=headers)
+
+    if not gzip_accepted:
+        tile = gzip.decompress(tile)
+
+    return Response(content=tile, media_type='application/vnd.mapbox-vector-tile', headers=headers)
+
+
+@app.get("/time_series/{dataset_id}", response_model=PointTimeSeries)
+async def get_point_time_series(dataset_id: str, lat: float, lon: float, depth: float | None = None) -> PointTimeSeries:
+    """
+    Gets the values at a point over all time steps, at a single depth or all of them.
+    """
+    try:
+        return await run_in_threadpool(read_point_time_series, dataset_id, lat, lon, depth)
+    except PointNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@app.get("/profile/{dataset_id}", response_model=VerticalProfile)
+async def get_vertical_profile(dataset_id: str, lat: float, lon: float, date_time: datetime.datetime,
+                               depths: list[float] | None = Query(None)) -> VerticalProfile:
+    """
+    Gets the values at a point and time over all depth levels, or interpolated to the given depths.
+    """
+    try:
+        return await run_in_threadpool(read_vertical_profile, dataset_id, lat, lon, date_time, depths)
+    except PointNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics() -> Response:
+    """
+    Exposes the metrics of the latest ingest run and the tile cache for Prometheus to scrape.
+    """
+    metrics = tile_cache.get_prometheus_metrics()
+    run_report = await run_in_threadpool(read_latest_run_report, METRICS_REPORT_DIR)
+    if run_report is not None:
+        metrics += get_prometheus_metrics(run_report)
+    return PlainTextResponse(content=metrics, media_type=PROMETHEUS_CONTENT_TYPE)
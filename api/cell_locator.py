@@ -0,0 +1,67 @@
+import threading
+
+import numpy as np
+from scipy.spatial import cKDTree
+from sqlalchemy import text
+
+from db import Session
+
+
+class CellLocator:
+    """
+    Locates the cell of a grid that a point falls in, with a KD-tree over the centers of the grid's cells.
+    Centers are placed on the unit sphere, so that the nearest center is found without any distortion of lon/lat
+    distances. Points that are further from the nearest center than the cells are apart, like points on land, aren't
+    in any cell.
+    """
+    cell_ids: np.ndarray
+    tree: cKDTree
+    max_distance: float
+
+    def __init__(self, cell_ids: np.ndarray, lons: np.ndarray, lats: np.ndarray):
+        self.cell_ids = cell_ids
+        self.tree = cKDTree(to_unit_vectors(lons, lats))
+
+        # The distance between neighbouring cells, taken as the typical distance to a cell's nearest neighbour
+        neighbour_distances, _ = self.tree.query(self.tree.data, k=2)
+        self.max_distance = float(np.median(neighbour_distances[:, 1])) if len(cell_ids) > 1 else np.inf
+
+    def locate(self, lon: float, lat: float) -> int | None:
+        distance, index = self.tree.query(to_unit_vectors(np.array([lon]), np.array([lat]))[0])
+        if distance > self.max_distance:
+            return None
+        return int(self.cell_ids[index])
+
+
+def to_unit_vectors(lons: np.ndarray, lats: np.ndarray) -> np.ndarray:
+    lons, lats = np.radians(lons), np.radians(lats)
+    return np.stack([np.cos(lats) * np.cos(lons), np.cos(lats) * np.sin(lons), np.sin(lats)], axis=-1)
+
+
+__CELL_LOCATORS: dict[str, CellLocator] = dict()
+__CELL_LOCATORS_LOCK = threading.Lock()
+
+
+def get_cell_locator(grid_id: str) -> CellLocator | None:
+    """
+    Gets the cell locator of a grid, which is built from the grid_cell table the first time and kept in memory,
+    since the cells of a grid never change.
+    Blocks on the database, so it should be run in a threadpool.
+    """
+    with __CELL_LOCATORS_LOCK:
+        if grid_id in __CELL_LOCATORS:
+            return __CELL_LOCATORS[grid_id]
+
+    cells = Session.execute(
+        text("""SELECT cell_id, ST_X(ST_Centroid(cell_points)), ST_Y(ST_Centroid(cell_points))
+            FROM grid_cell WHERE grid_id = :grid_id"""),
+        {"grid_id": grid_id}
+    ).all()
+    if not cells:
+        return None
+
+    cell_ids, lons, lats = (np.array(column) for column in zip(*cells))
+    cell_locator = CellLocator(cell_ids, lons.astype(np.float64), lats.astype(np.float64))
+    with __CELL_LOCATORS_LOCK:
+        __CELL_LOCATORS[grid_id] = cell_locator
+    return cell_locator
@@ -0,0 +1,104 @@
+import threading
+
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from db import Session
+from db.models import Dataset, DatasetVariable
+from .models import DatasetMetadata, Variable, Threshold, Histogram
+
+
+class CachedDatasetMetadata:
+    generation: int
+    etag: str
+    body: bytes
+
+    def __init__(self, generation: int, etag: str, body: bytes):
+        self.generation = generation
+        self.etag = etag
+        self.body = body
+
+
+class DatasetMetadataCache:
+    """
+    Keeps the serialized metadata of each dataset, until the dataset's generation is bumped by an ingest.
+    Checking the generation is a single primary key lookup, rather than loading the dataset with its variables and
+    thresholds.
+    """
+    cached_metadata: dict[str, CachedDatasetMetadata]
+
+    def __init__(self):
+        self.cached_metadata = dict()
+        self.lock = threading.Lock()
+
+    def get(self, dataset_id: str) -> CachedDatasetMetadata | None:
+        """
+        Blocks on the database, so it should be run in a threadpool.
+        Returns None if the dataset doesn't exist.
+        """
+        try:
+            generation = Session.execute(
+                select(Dataset.generation).where(Dataset.id == dataset_id)
+            ).scalar_one_or_none()
+            if generation is None:
+                return None
+
+            cached_metadata = self.cached_metadata.get(dataset_id)
+            if cached_metadata is not None and cached_metadata.generation == generation:
+                return cached_metadata
+
+            dataset = Session.execute(
+                select(Dataset)
+                .where(Dataset.id == dataset_id)
+                .options(selectinload(Dataset.variables).selectinload(DatasetVariable.thresholds))
+            ).scalar_one()
+
+            cached_metadata = CachedDatasetMetadata(
+                dataset.generation,
+                f'"{dataset_id}-{dataset.generation}"',
+                get_dataset_metadata(dataset).json().encode()
+            )
+            with self.lock:
+                self.cached_metadata[dataset_id] = cached_metadata
+            return cached_metadata
+        finally:
+            # Threadpool threads are reused, so don't keep their sessions' identity maps around
+            Session.remove()
+
+
+def get_dataset_metadata(dataset: Dataset) -> DatasetMetadata:
+    return DatasetMetadata(
+        start_date=dataset.start_date,
+        end_date=dataset.end_date,
+        time_step_minutes=dataset.time_step_minutes,
+        variables=[
+            Variable(
+                name=variable.variable_name,
+                thresholds=[
+                    Threshold(
+                        min_value=threshold.min_value,
+                        max_value=threshold.max_value,
+                        dependant_value=threshold.dependent_variable_value,
+                        percentiles=threshold.percentiles,
+                        histogram=get_histogram(threshold.histogram)
+                    )
+                    for threshold in variable.thresholds
+                ]
+            )
+            for variable in dataset.variables
+        ],
+    )
+
+
+def get_histogram(histogram: dict | None) -> Histogram | None:
+    """
+    Histograms are stored as an offset into the fixed bins of their variable, and served with the value their first
+    bin starts at.
+    """
+    if not histogram:
+        return None
+    return Histogram(
+        bin_start=histogram['range_min'] + histogram['offset'] * histogram['bin_width'],
+        bin_width=histogram['bin_width'],
+        counts=histogram['counts'],
+    )
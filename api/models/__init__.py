@@ -2,10 +2,18 @@ from datetime import datetime
 from pydantic import BaseModel
 
 
+class Histogram(BaseModel):
+    bin_start: float
+    bin_width: float
+    counts: list[int]
+
+
 class Threshold(BaseModel):
     dependant_value: float
     min_value: float
     max_value: float
+    percentiles: dict[str, float] | None
+    histogram: Histogram | None
 
 
 class Variable(BaseModel):
@@ -18,3 +26,32 @@ class DatasetMetadata(BaseModel):
     end_date: datetime
     time_step_minutes: int
     variables: list[Variable]
+
+
+class CellValues(BaseModel):
+    date_time: datetime
+    depth: float
+    temperature: float
+    salinity: float
+    u_velocity: float
+    v_velocity: float
+    zeta: float | None
+    # Derived at ingest, and missing from the values of earlier ingests
+    current_speed: float | None
+    current_direction: float | None
+    vorticity: float | None
+
+
+class PointTimeSeries(BaseModel):
+    cell_id: int
+    values: list[CellValues]
+
+
+class VerticalProfile(BaseModel):
+    cell_id: int
+    date_time: datetime
+    depths: list[float]
+    temperature: list[float | None]
+    salinity: list[float | None]
+    u_velocity: list[float | None]
+    v_velocity: list[float | None]
@@ -0,0 +1,135 @@
+import datetime
+
+import numpy as np
+from sqlalchemy import text
+
+from db import Session
+from db.models import Dataset
+from db.ocean_dataset_data_table_orchestrator import STORAGE_LAYOUT_TABLE_MODELS
+from etc.const import StorageLayout
+from .cell_locator import get_cell_locator
+from .models import CellValues, PointTimeSeries, VerticalProfile
+
+PROFILE_VARIABLES = ['temperature', 'salinity', 'u_velocity', 'v_velocity']
+CELL_VALUE_COLUMNS = [
+    'date_time', 'depth', 'temperature', 'salinity', 'u_velocity', 'v_velocity', 'zeta',
+    'current_speed', 'current_direction', 'vorticity'
+]
+
+
+class PointNotFound(Exception):
+    pass
+
+
+def locate_dataset_cell(dataset_id: str, lon: float, lat: float) -> tuple[Dataset, int]:
+    """
+    Gets the dataset and the cell of its grid that the point falls in.
+    Raises PointNotFound if either the dataset or the cell doesn't exist.
+    """
+    dataset = Session.get(Dataset, dataset_id)
+    if not dataset or not dataset.grid_id:
+        raise PointNotFound(f"Dataset {dataset_id} not found")
+
+    cell_locator = get_cell_locator(dataset.grid_id)
+    cell_id = cell_locator.locate(lon, lat) if cell_locator else None
+    if cell_id is None:
+        raise PointNotFound(f"No cell of dataset {dataset_id} at {lat}, {lon}")
+
+    return dataset, cell_id
+
+
+def get_cell_values(dataset: Dataset, cell_id: int, filters: dict = None) -> list[CellValues]:
+    """
+    Gets the values of a cell ordered by time and depth, which the cell_id index serves in a single range scan.
+    The slab storage layout has no rows per cell, its values are taken from the arrays of each slab instead.
+    filters: optional values of the CELL_VALUE_COLUMNS to filter on.
+    """
+    filters = filters or dict()
+    storage_layout = StorageLayout(dataset.storage_layout)
+    table_name = STORAGE_LAYOUT_TABLE_MODELS[storage_layout].get_table_name(dataset.id)
+
+    if storage_layout == StorageLayout.SLAB:
+        cell_values = Session.execute(
+            text(f"""SELECT {', '.join(CELL_VALUE_COLUMNS)} FROM get_ocean_data_slab_cell_values(
+                :table_name, :cell_id, CAST(:date_time AS timestamp), CAST(:depth AS float)
+            )"""),
+            {
+                "table_name": table_name,
+                "cell_id": cell_id,
+                "date_time": filters.get('date_time'),
+                "depth": filters.get('depth'),
+            }
+        ).all()
+        return [CellValues(**dict(zip(CELL_VALUE_COLUMNS, values))) for values in cell_values]
+
+    filter_conditions = ''.join(f' AND {column} = :{column}' for column in filters)
+
+    cell_values = Session.execute(
+        text(f"""SELECT {', '.join(CELL_VALUE_COLUMNS)} FROM {table_name}
+            WHERE cell_id = :cell_id{filter_conditions}
+            ORDER BY date_time, depth"""),
+        {"cell_id": cell_id, **filters}
+    ).all()
+
+    return [CellValues(**dict(zip(CELL_VALUE_COLUMNS, values))) for values in cell_values]
+
+
+def read_point_time_series(dataset_id: str, lat: float, lon: float, depth: float | None) -> PointTimeSeries:
+    """
+    Blocks on the database, so it should be run in a threadpool.
+    """
+    try:
+        dataset, cell_id = locate_dataset_cell(dataset_id, lon, lat)
+        return PointTimeSeries(
+            cell_id=cell_id,
+            values=get_cell_values(dataset, cell_id, {'depth': depth} if depth is not None else None)
+        )
+    finally:
+        # Threadpool threads are reused, so don't keep their sessions' identity maps around
+        Session.remove()
+
+
+def read_vertical_profile(dataset_id: str, lat: float, lon: float, date_time: datetime.datetime,
+                          depths: list[float] | None) -> VerticalProfile:
+    """
+    Gets the values at a point and time over all the depth levels, or interpolated linearly to the given depths.
+    Depths outside of the levels with values aren't extrapolated, and have no values.
+    Blocks on the database, so it should be run in a threadpool.
+    """
+    # The data is stored by naive UTC time, which a time with a timezone is converted to
+    if date_time.tzinfo is not None:
+        date_time = date_time.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+    try:
+        dataset, cell_id = locate_dataset_cell(dataset_id, lon, lat)
+        cell_values = get_cell_values(dataset, cell_id, {'date_time': date_time})
+    finally:
+        # Threadpool threads are reused, so don't keep their sessions' identity maps around
+        Session.remove()
+
+    if not cell_values:
+        raise PointNotFound(f"No values of dataset {dataset_id} at {lat}, {lon} at {date_time}")
+
+    level_depths = np.array([values.depth for values in cell_values])
+    profile = {
+        variable: np.array([getattr(values, variable) for values in cell_values]) for variable in PROFILE_VARIABLES
+    }
+
+    if depths is not None:
+        # np.interp needs the levels in increasing order
+        level_order = np.argsort(level_depths)
+        profile = {
+            variable: np.interp(depths, level_depths[level_order], values[level_order], left=np.nan, right=np.nan)
+            for variable, values in profile.items()
+        }
+        level_depths = np.array(depths, dtype=np.float64)
+
+    return VerticalProfile(
+        cell_id=cell_id,
+        date_time=date_time,
+        depths=level_depths.tolist(),
+        **{
+            variable: [None if np.isnan(value) else value for value in values.tolist()]
+            for variable, values in profile.items()
+        }
+    )
@@ -0,0 +1,95 @@
+import datetime
+import threading
+import time
+
+from sqlalchemy import select
+
+from db import Session
+from db.models import Dataset
+from tiles import TileKey, TileStore, LruTileCache, render_tile
+
+
+class TileCache:
+    """
+    Serves tiles from memory, then from the tile store, and only renders them with PostGIS when neither has them.
+    The generation of each dataset is kept for a short while, so that repeated requests don't touch the database.
+    """
+    memory_cache: LruTileCache
+    tile_store: TileStore | None
+    generation_ttl_seconds: float
+    dataset_generations: dict[str, tuple[int, float]]
+    request_counts: dict[str, int]
+
+    def __init__(self, memory_cache: LruTileCache, tile_store: TileStore | None, generation_ttl_seconds: float):
+        self.memory_cache = memory_cache
+        self.tile_store = tile_store
+        self.generation_ttl_seconds = generation_ttl_seconds
+        self.dataset_generations = dict()
+        self.request_counts = {'memory': 0, 'store': 0, 'render': 0}
+        self.lock = threading.Lock()
+
+    def get_tile(self, dataset_id: str, date_time: datetime.datetime, depth: float,
+                 z: int, x: int, y: int) -> tuple[TileKey, bytes] | None:
+        """
+        Blocks on the database and disk, so it should be run in a threadpool.
+        Returns None if the dataset doesn't exist.
+        """
+        try:
+            generation = self.get_dataset_generation(dataset_id)
+            if generation is None:
+                return None
+
+            tile_key = TileKey(dataset_id, generation, date_time, depth, z, x, y)
+
+            tile = self.memory_cache.get(tile_key)
+            if tile is not None:
+                self.count_request('memory')
+                return tile_key, tile
+
+            if self.tile_store is not None:
+                tile = self.tile_store.get(tile_key)
+
+            if tile is None:
+                tile = render_tile(tile_key)
+                self.count_request('render')
+                if self.tile_store is not None:
+                    self.tile_store.put(tile_key, tile)
+            else:
+                self.count_request('store')
+
+            self.memory_cache.put(tile_key, tile)
+            return tile_key, tile
+        finally:
+            # Threadpool threads are reused, so don't keep their sessions' identity maps around
+            Session.remove()
+
+    def count_request(self, result: str):
+        with self.lock:
+            self.request_counts[result] += 1
+
+    def get_prometheus_metrics(self) -> str:
+        """
+        Formats the tile request counts by where the tile was served from, in the Prometheus text exposition format.
+        """
+        with self.lock:
+            request_counts = dict(self.request_counts)
+        lines = [
+            '# HELP tile_cache_requests_total The tile requests by where the tile was served from.',
+            '# TYPE tile_cache_requests_total counter',
+            *[f'tile_cache_requests_total{{result="{result}"}} {count}' for result, count in request_counts.items()],
+        ]
+        return '\n'.join(lines) + '\n'
+
+    def get_dataset_generation(self, dataset_id: str) -> int | None:
+        with self.lock:
+            cached_generation = self.dataset_generations.get(dataset_id)
+        if cached_generation is not None and time.monotonic() - cached_generation[1] < self.generation_ttl_seconds:
+            return cached_generation[0]
+
+        generation = Session.execute(
+            select(Dataset.generation).where(Dataset.id == dataset_id)
+        ).scalar_one_or_none()
+        if generation is not None:
+            with self.lock:
+                self.dataset_generations[dataset_id] = (generation, time.monotonic())
+        return generation
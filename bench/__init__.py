@@ -0,0 +1,2 @@
+from .harness import BenchmarkConfig, BenchmarkResult, BENCHMARK_CONFIGS, run_benchmarks, compare_with_baseline
+from .synthetic_roms import write_synthetic_roms_file
@@ -0,0 +1,49 @@
+import argparse
+import json
+import logging
+import os
+import sys
+
+from .harness import BENCHMARK_CONFIGS, SINKS, NULL_SINK, run_benchmarks, read_baseline, write_baseline, \
+    compare_with_baseline
+
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    logger = logging.getLogger(__name__)
+
+    parser = argparse.ArgumentParser(
+        prog='python -m bench',
+        description='Benchmarks the ingest of synthetic ROMS files, and compares the results with a baseline.'
+    )
+    parser.add_argument('--sink', choices=SINKS, default=NULL_SINK)
+    parser.add_argument('--config', action='append', choices=[config.name for config in BENCHMARK_CONFIGS],
+                        help='The benchmark configs to run, all of them by default')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH)
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='The fraction throughput may drop, or peak memory may grow, by before it regresses')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='Store the results as the baseline, rather than comparing with it')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    args = parser.parse_args()
+
+    benchmark_configs = [config for config in BENCHMARK_CONFIGS if not args.config or config.name in args.config]
+    benchmark_results = run_benchmarks(benchmark_configs, args.sink)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                benchmark_result.config_name: benchmark_result.to_dict() for benchmark_result in benchmark_results
+            }, f, indent=2)
+
+    baseline = read_baseline(args.baseline)
+    if args.update_baseline:
+        write_baseline(args.baseline, baseline, benchmark_results)
+        logger.info(f"Stored the results as the baseline in {args.baseline}")
+        sys.exit(0)
+
+    regressions = compare_with_baseline(benchmark_results, baseline, args.tolerance)
+    for regression in regressions:
+        logger.error(f"Regression: {regression}")
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,253 @@
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import xarray as xr
+
+from db import Session
+from db.models import Dataset
+from etc.const import DatasetType, IngestMode
+from ingest.metrics import IngestMetrics
+from ingest.ingesters.ocean_dataset.cell_geometry_cache import get_cell_geometry_cache
+from ingest.ingesters.ocean_dataset.ocean_dataset_ingester import OceanDatasetIngester
+from ingest.ingesters.ocean_dataset.ocean_dataset_processor import OceanDatasetProcessor, get_netcdf_file_data, \
+    READ_MODE, STORAGE_LAYOUT, WORKERS
+from ingest.ingesters.ocean_dataset.sinks import NullSink
+from ingest.ingesters.ocean_dataset.slab_ingester_pool import SlabIngesterPool
+from .synthetic_roms import write_synthetic_roms_file
+
+logger = logging.getLogger(__name__)
+
+NULL_SINK = 'null'
+POSTGRES_SINK = 'postgres'
+SINKS = [NULL_SINK, POSTGRES_SINK]
+
+
+class BenchmarkConfig:
+    """
+    The shape of the synthetic file ingested by a benchmark.
+    """
+    name: str
+    num_times: int
+    num_depths: int
+    num_eta: int
+    num_xi: int
+    land_fraction: float
+    nan_rate: float
+    seed: int
+
+    def __init__(self, name: str, num_times: int, num_depths: int, num_eta: int, num_xi: int,
+                 land_fraction: float = 0.2, nan_rate: float = 0.0, seed: int = 0):
+        self.name = name
+        self.num_times = num_times
+        self.num_depths = num_depths
+        self.num_eta = num_eta
+        self.num_xi = num_xi
+        self.land_fraction = land_fraction
+        self.nan_rate = nan_rate
+        self.seed = seed
+
+
+BENCHMARK_CONFIGS = [
+    BenchmarkConfig('small', num_times=2, num_depths=3, num_eta=100, num_xi=120),
+    BenchmarkConfig('medium', num_times=5, num_depths=10, num_eta=300, num_xi=400),
+    BenchmarkConfig('land_heavy', num_times=5, num_depths=10, num_eta=300, num_xi=400, land_fraction=0.6),
+    BenchmarkConfig('nan_heavy', num_times=5, num_depths=10, num_eta=300, num_xi=400, nan_rate=0.1),
+    BenchmarkConfig('deep', num_times=2, num_depths=40, num_eta=300, num_xi=400),
+]
+
+
+class BenchmarkResult:
+    config_name: str
+    sink: str
+    num_rows: int
+    duration_seconds: float
+    peak_memory_mb: float
+    stage_seconds: dict[str, float]
+
+    def __init__(self, config_name: str, sink: str, num_rows: int, duration_seconds: float, peak_memory_mb: float,
+                 stage_seconds: dict[str, float]):
+        self.config_name = config_name
+        self.sink = sink
+        self.num_rows = num_rows
+        self.duration_seconds = duration_seconds
+        self.peak_memory_mb = peak_memory_mb
+        self.stage_seconds = stage_seconds
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.num_rows / self.duration_seconds if self.duration_seconds else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            'num_rows': self.num_rows,
+            'duration_seconds': round(self.duration_seconds, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+            'peak_memory_mb': round(self.peak_memory_mb, 1),
+            'stage_seconds': {stage: round(seconds, 3) for stage, seconds in self.stage_seconds.items()},
+        }
+
+
+def run_benchmarks(benchmark_configs: list[BenchmarkConfig], sink: str) -> list[BenchmarkResult]:
+    """
+    Each benchmark generates its file up front, and ingests it in a freshly spawned process of its own, so that the
+    peak memory of a benchmark isn't that of the file generation or of the benchmarks before it.
+    """
+    benchmark_results = []
+    for benchmark_config in benchmark_configs:
+        with tempfile.TemporaryDirectory(prefix=f'bench_{benchmark_config.name}_') as work_dir:
+            nc_path = os.path.join(work_dir, f'{benchmark_config.name}.nc')
+            write_synthetic_roms_file(
+                nc_path, benchmark_config.num_times, benchmark_config.num_depths, benchmark_config.num_eta,
+                benchmark_config.num_xi, benchmark_config.land_fraction, benchmark_config.nan_rate,
+                benchmark_config.seed
+            )
+
+            logger.info(f"Running the {benchmark_config.name} benchmark against the {sink} sink")
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                benchmark_result = executor.submit(run_benchmark, benchmark_config, sink, nc_path, work_dir).result()
+
+        logger.info(
+            f"{benchmark_config.name}: {benchmark_result.num_rows} rows in {benchmark_result.duration_seconds:.2f} "
+            f"seconds ({benchmark_result.rows_per_second:.0f} rows/s), peak memory "
+            f"{benchmark_result.peak_memory_mb:.0f} MiB"
+        )
+        benchmark_results.append(benchmark_result)
+
+    return benchmark_results
+
+
+def run_benchmark(benchmark_config: BenchmarkConfig, sink: str, nc_path: str, work_dir: str) -> BenchmarkResult:
+    dataset_id = f'bench_{benchmark_config.name}'
+    start_time = time.perf_counter()
+    if sink == NULL_SINK:
+        ingest_metrics = ingest_into_null_sink(dataset_id, nc_path, benchmark_config.num_times, work_dir)
+    else:
+        ingest_metrics = ingest_into_postgres(dataset_id, nc_path)
+    duration_seconds = time.perf_counter() - start_time
+
+    # ru_maxrss is in KiB on Linux
+    peak_memory_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+
+    return BenchmarkResult(
+        benchmark_config.name, sink, ingest_metrics.num_rows, duration_seconds, peak_memory_mb,
+        ingest_metrics.stage_seconds
+    )
+
+
+def ingest_into_null_sink(dataset_id: str, nc_path: str, num_times: int, geometry_cache_dir: str) -> IngestMetrics:
+    """
+    Ingests the file the way the processor does in the vectorized ingest mode, into a null sink, so that only reading
+    the slabs and building their cells is measured. Nothing is read from or written to the database, and no
+    overviews are built.
+    """
+    ingest_metrics = IngestMetrics()
+    with ingest_metrics.time_stage('open_netcdf'):
+        netcdf_file_data = get_netcdf_file_data(nc_path, READ_MODE)
+
+    try:
+        with ingest_metrics.time_stage('geometry_cache'):
+            cell_geometry_cache = get_cell_geometry_cache(netcdf_file_data, geometry_cache_dir)
+
+        netcdf_dataset_ingester = OceanDatasetIngester(
+            dataset_id, netcdf_file_data, IngestMode.VECTORIZED, STORAGE_LAYOUT, num_times
+        )
+        netcdf_dataset_ingester.set_metrics(ingest_metrics)
+        netcdf_dataset_ingester.set_cell_geometry_cache(cell_geometry_cache)
+        netcdf_dataset_ingester.add_sink(NullSink())
+
+        if WORKERS > 1:
+            netcdf_dataset_ingester.set_slab_ingester_pool(SlabIngesterPool(
+                WORKERS, dataset_id, nc_path, IngestMode.VECTORIZED, STORAGE_LAYOUT, geometry_cache_dir,
+                None, '', 0, sinks=[NullSink()]
+            ))
+
+        with ingest_metrics.time_stage('ingest_data'):
+            netcdf_dataset_ingester.ingest_slabs()
+    finally:
+        netcdf_file_data.close()
+
+    return ingest_metrics
+
+
+def ingest_into_postgres(dataset_id: str, nc_path: str) -> IngestMetrics:
+    """
+    Ingests the file end to end with the processor, as configured in config.ini, into the configured database.
+    The dataset is created if it doesn't exist yet.
+    """
+    with xr.open_dataset(nc_path) as ds:
+        bounds = {
+            'west_bound': float(ds['lon_rho'].min()),
+            'east_bound': float(ds['lon_rho'].max()),
+            'south_bound': float(ds['lat_rho'].min()),
+            'north_bound': float(ds['lat_rho'].max()),
+        }
+    try:
+        Session.merge(Dataset(id=dataset_id, dataset_type=DatasetType.OCEAN.value, **bounds))
+        Session.commit()
+    finally:
+        Session.remove()
+
+    ocean_dataset_processor = OceanDatasetProcessor()
+    if not ocean_dataset_processor.process_dataset(dataset_id, nc_path):
+        raise RuntimeError(f'Failed to ingest the {dataset_id} benchmark dataset')
+    return ocean_dataset_processor.get_ingest_metrics()
+
+
+def read_baseline(baseline_path: str) -> dict:
+    """
+    Baselines are kept per sink, then per benchmark config.
+    """
+    if not os.path.isfile(baseline_path):
+        return dict()
+    with open(baseline_path) as f:
+        return json.load(f)
+
+
+def write_baseline(baseline_path: str, baseline: dict, benchmark_results: list[BenchmarkResult]):
+    for benchmark_result in benchmark_results:
+        baseline.setdefault(benchmark_result.sink, dict())[benchmark_result.config_name] = {
+            'num_rows': benchmark_result.num_rows,
+            'rows_per_second': round(benchmark_result.rows_per_second, 1),
+            'peak_memory_mb': round(benchmark_result.peak_memory_mb, 1),
+        }
+    with open(baseline_path, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare_with_baseline(benchmark_results: list[BenchmarkResult], baseline: dict, tolerance: float) -> list[str]:
+    """
+    Gets the regressions of the results against the baseline: throughput that dropped, or peak memory that grew, by
+    more than the tolerance, or a different number of rows, which means the ingest itself changed.
+    Results without a baseline are not compared. Baselines are specific to the machine and config.ini they were
+    stored with.
+    """
+    regressions = []
+    for benchmark_result in benchmark_results:
+        config_baseline = baseline.get(benchmark_result.sink, dict()).get(benchmark_result.config_name)
+        name = f'{benchmark_result.sink}/{benchmark_result.config_name}'
+        if config_baseline is None:
+            logger.warning(f"{name} has no baseline to compare with, store one with --update-baseline")
+            continue
+
+        if benchmark_result.num_rows != config_baseline['num_rows']:
+            regressions.append(
+                f"{name}: wrote {benchmark_result.num_rows} rows, the baseline wrote {config_baseline['num_rows']}"
+            )
+        if benchmark_result.rows_per_second < config_baseline['rows_per_second'] * (1 - tolerance):
+            regressions.append(
+                f"{name}: {benchmark_result.rows_per_second:.0f} rows/s, down from the baseline's "
+                f"{config_baseline['rows_per_second']:.0f} rows/s"
+            )
+        if benchmark_result.peak_memory_mb > config_baseline['peak_memory_mb'] * (1 + tolerance):
+            regressions.append(
+                f"{name}: peak memory of {benchmark_result.peak_memory_mb:.0f} MiB, up from the baseline's "
+                f"{config_baseline['peak_memory_mb']:.0f} MiB"
+            )
+    return regressions
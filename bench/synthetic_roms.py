@@ -0,0 +1,86 @@
+import numpy as np
+import xarray as xr
+
+from ingest.ingesters.ocean_dataset.models import LAND_MASK
+
+SEA_MASK = 1
+
+# The corner of the grid, off the west coast of South Africa like the SOMISANA models
+GRID_WEST = 15.0
+GRID_SOUTH = -35.0
+GRID_RESOLUTION_DEGREES = 1 / 36
+
+
+def write_synthetic_roms_file(path: str, num_times: int, num_depths: int, num_eta: int, num_xi: int,
+                              land_fraction: float = 0.2, nan_rate: float = 0.0, seed: int = 0):
+    """
+    Writes a NetCDF file shaped like the ROMS output of the ocean datasets, with the variables read by the ingest:
+    lon_rho, lat_rho and mask on a slightly curvilinear grid, temp, salt, u and v over (time, depth, eta_rho, xi_rho),
+    and zeta over (time, eta_rho, xi_rho).
+    land_fraction: the fraction of the grid that is masked as land, as a coastline along the east of the grid.
+    nan_rate: the fraction of the remaining sea values of each variable that are NaN.
+    The file is fully determined by its arguments.
+    """
+    rng = np.random.default_rng(seed)
+
+    eta, xi = np.meshgrid(np.arange(num_eta), np.arange(num_xi), indexing='ij')
+    lons = GRID_WEST + xi * GRID_RESOLUTION_DEGREES + 0.05 * np.sin(eta / max(num_eta, 1) * np.pi)
+    lats = GRID_SOUTH + eta * GRID_RESOLUTION_DEGREES + 0.05 * np.sin(xi / max(num_xi, 1) * np.pi)
+
+    # A wavy coastline, with the land to the east of it
+    coastline = xi + 0.1 * num_xi * np.sin(eta / max(num_eta, 1) * 4 * np.pi)
+    is_land = coastline >= np.quantile(coastline, 1 - land_fraction) if land_fraction > 0 else np.zeros_like(eta, bool)
+    mask = np.where(is_land, LAND_MASK, SEA_MASK).astype(np.float64)
+
+    times = np.datetime64('2024-01-01T00:00:00') + np.arange(num_times) * np.timedelta64(1, 'h')
+    depths = get_depths(num_depths)
+
+    var_shape = (num_times, num_depths, num_eta, num_xi)
+    depth_decay = np.exp(depths / 200.0)[None, :, None, None]
+    temps = 8.0 + 12.0 * depth_decay + rng.normal(0.0, 0.5, var_shape)
+    salts = 34.5 + 0.8 * depth_decay + rng.normal(0.0, 0.05, var_shape)
+    us = rng.normal(0.0, 0.3, var_shape) * depth_decay
+    vs = rng.normal(0.0, 0.3, var_shape) * depth_decay
+    zetas = 0.5 * np.sin(np.arange(num_times) / 12.4 * 2 * np.pi)[:, None, None] + rng.normal(
+        0.0, 0.05, (num_times, num_eta, num_xi)
+    )
+
+    variables = dict()
+    for name, values, dims in (
+            ('temp', temps, ('time', 'depth', 'eta_rho', 'xi_rho')),
+            ('salt', salts, ('time', 'depth', 'eta_rho', 'xi_rho')),
+            ('u', us, ('time', 'depth', 'eta_rho', 'xi_rho')),
+            ('v', vs, ('time', 'depth', 'eta_rho', 'xi_rho')),
+            ('zeta', zetas, ('time', 'eta_rho', 'xi_rho')),
+    ):
+        values = values.astype(np.float32)
+        values[..., is_land] = np.nan
+        if nan_rate > 0:
+            values[rng.random(values.shape) < nan_rate] = np.nan
+        variables[name] = (dims, values)
+
+    ds = xr.Dataset(
+        data_vars={
+            **variables,
+            'lon_rho': (('eta_rho', 'xi_rho'), lons),
+            'lat_rho': (('eta_rho', 'xi_rho'), lats),
+            'mask': (('eta_rho', 'xi_rho'), mask),
+        },
+        coords={
+            'time': times,
+            'depth': depths,
+            'eta_rho': np.arange(num_eta),
+            'xi_rho': np.arange(num_xi),
+        },
+    )
+    ds.to_netcdf(path)
+    ds.close()
+
+
+def get_depths(num_depths: int) -> np.ndarray:
+    """
+    Gets depth levels from the surface down to 1000m, spaced further apart with depth like the ocean datasets'.
+    """
+    if num_depths == 1:
+        return np.array([0.0])
+    return -np.round(np.concatenate([[0.0], np.geomspace(5.0, 1000.0, num_depths - 1)]))
@@ -1,6 +1,7 @@
 import os
+import threading
+from contextlib import contextmanager
 
-import psycopg2
 from sqlalchemy import create_engine
 from sqlalchemy.orm import declarative_base, scoped_session, sessionmaker
 
@@ -8,25 +9,67 @@ from etc.config import config
 
 db_url = f"postgresql://{config['DB']['USER']}:{os.getenv('PGPASSWORD', config['DB']['PASS'])}@{config['DB']['HOST']}:{config['DB']['PORT']}/{config['DB']['NAME']}"
 
-conn_str = f"host={config['DB']['HOST']} port={config['DB']['PORT']} dbname={config['DB']['NAME']} user={config['DB']['USER']} password={config['DB']['PASS']}"
-conn = psycopg2.connect(conn_str)
-curr = conn.cursor()
+POOL_SIZE = config.getint('DB', 'POOL_SIZE', fallback=5)
+POOL_MAX_OVERFLOW = config.getint('DB', 'POOL_MAX_OVERFLOW', fallback=10)
 
-engine = create_engine(
-    db_url,
-    echo=config['DB']['ECHO'] and config['DB']['ECHO'] == 'True',
-    isolation_level=config['DB']['ISOLATION_LEVEL'],
+# The engine, and with it the connection pool, is only created on first use, so importing db doesn't connect
+__engine = None
+# Threads that use the db at the same time, such as the dataset workers, must all get the same engine
+__engine_lock = threading.Lock()
+
+
+def get_engine():
+    global __engine
+    if __engine is None:
+        with __engine_lock:
+            if __engine is None:
+                __engine = create_engine(
+                    db_url,
+                    echo=config['DB']['ECHO'] and config['DB']['ECHO'] == 'True',
+                    isolation_level=config['DB']['ISOLATION_LEVEL'],
+                    pool_size=POOL_SIZE,
+                    max_overflow=POOL_MAX_OVERFLOW,
+                    pool_pre_ping=True,
+                    future=True,
+                )
+    return __engine
+
+
+def __reset_engine_after_fork():
+    """
+    A forked process can't use the connections of its parent's pool, so it starts with an empty pool of its own,
+    without closing the parent's connections.
+    The lock may have been held by another thread of the parent when it forked, so the child gets a new one.
+    """
+    global __engine_lock
+    __engine_lock = threading.Lock()
+    if __engine is not None:
+        __engine.dispose(close=False)
+
+
+os.register_at_fork(after_in_child=__reset_engine_after_fork)
+
+
+@contextmanager
+def checkout_connection():
+    """
+    Checks a DBAPI connection out of the pool for a unit of work, and returns it to the pool afterwards.
+    Uncommitted work is rolled back when the connection is returned.
+    """
+    connection = get_engine().raw_connection()
+    try:
+        yield connection
+    finally:
+        connection.close()
+
+
+__session_factory = sessionmaker(
+    autocommit=False,
+    autoflush=True,
     future=True,
 )
 
-Session = scoped_session(
-    sessionmaker(
-        bind=engine,
-        autocommit=False,
-        autoflush=True,
-        future=True,
-    )
-)
+Session = scoped_session(lambda: __session_factory(bind=get_engine()))
 
 
 class _Base:
@@ -1,4 +1,93 @@
+-- Functions for expanding the rows of the slab storage layout, which hold the values of all the cells of a grid at
+-- a time and depth as arrays, with the value of a cell at its cell_id + 1, and NULL for cells without values.
+
+-- Their result columns can't be changed by CREATE OR REPLACE
+DROP FUNCTION IF EXISTS get_ocean_data_slab_cells(TEXT, TIMESTAMP WITH TIME ZONE, FLOAT);
+DROP FUNCTION IF EXISTS get_ocean_data_slab_cell_values(TEXT, INTEGER, TIMESTAMP, FLOAT);
+
+-- The cells with values of the slab at a time and depth.
+CREATE OR REPLACE
+    FUNCTION get_ocean_data_slab_cells(table_name TEXT, slab_date_time TIMESTAMP WITH TIME ZONE, slab_depth FLOAT)
+    RETURNS TABLE (
+      cell_id INTEGER, temperature REAL, salinity REAL, u_velocity REAL, v_velocity REAL, zeta REAL,
+      current_speed REAL, current_direction REAL, vorticity REAL
+    ) AS $$
+BEGIN
+  RETURN QUERY EXECUTE format('
+    SELECT
+      (cell.ordinality - 1)::integer,
+      cell.temperature,
+      cell.salinity,
+      cell.u_velocity,
+      cell.v_velocity,
+      cell.zeta,
+      cell.current_speed,
+      cell.current_direction,
+      cell.vorticity
+    FROM %I AS slab,
+    unnest(
+      slab.temperature, slab.salinity, slab.u_velocity, slab.v_velocity, slab.zeta,
+      slab.current_speed, slab.current_direction, slab.vorticity
+    ) WITH ORDINALITY AS cell(
+      temperature, salinity, u_velocity, v_velocity, zeta, current_speed, current_direction, vorticity, ordinality
+    )
+    WHERE
+      slab.date_time = $1
+      AND slab.depth = $2
+      AND cell.temperature IS NOT NULL
+  ', table_name)
+  USING slab_date_time, slab_depth;
+END
+$$
+LANGUAGE plpgsql STABLE ROWS 100000;
+
+-- The values of a cell over time and depth, optionally at only a time or a depth.
+CREATE OR REPLACE
+    FUNCTION get_ocean_data_slab_cell_values(
+      table_name TEXT,
+      slab_cell_id INTEGER,
+      slab_date_time TIMESTAMP DEFAULT NULL,
+      slab_depth FLOAT DEFAULT NULL
+    )
+    RETURNS TABLE (
+      date_time TIMESTAMP, depth NUMERIC,
+      temperature REAL, salinity REAL, u_velocity REAL, v_velocity REAL, zeta REAL,
+      current_speed REAL, current_direction REAL, vorticity REAL
+    ) AS $$
+BEGIN
+  RETURN QUERY EXECUTE format('
+    SELECT
+      slab.date_time,
+      slab.depth,
+      slab.temperature[$1 + 1],
+      slab.salinity[$1 + 1],
+      slab.u_velocity[$1 + 1],
+      slab.v_velocity[$1 + 1],
+      slab.zeta[$1 + 1],
+      slab.current_speed[$1 + 1],
+      slab.current_direction[$1 + 1],
+      slab.vorticity[$1 + 1]
+    FROM %I AS slab
+    WHERE
+      ($2 IS NULL OR slab.date_time = $2)
+      AND ($3 IS NULL OR slab.depth = $3)
+      AND slab.temperature[$1 + 1] IS NOT NULL
+    ORDER BY slab.date_time, slab.depth
+  ', table_name)
+  USING slab_cell_id, slab_date_time, slab_depth;
+END
+$$
+LANGUAGE plpgsql STABLE;
+
+-- ################################################################################################
+
 -- Function for querying the ocean dataset cells as mvt (mapbox vector tiles).
+-- Besides the values, the cells have the current speed, direction and vorticity derived at ingest, for styling.
+-- Datasets with the normalized and slab storage layouts join their values to the cells of their grid in grid_cell,
+-- so that the spatial filter only has to be done on the grid.
+-- At low zoom levels the cells are read from the overview table of the coarsest aggregation factor that suits the
+-- zoom level and has the requested time, falling back to finer overviews and then the native cells. The time steps
+-- each overview table has, over all depths, are looked up in dataset_overview, which the ingest keeps up to date.
 
 CREATE OR REPLACE
     FUNCTION get_ocean_data_tile(z integer, x integer, y integer, query jsonb)
@@ -6,8 +95,138 @@ CREATE OR REPLACE
 DECLARE
   mvt bytea;
   dataset_table_name TEXT;
+  dataset_storage_layout TEXT;
+  dataset_grid_id TEXT;
   sql_query TEXT;
+  overview_factor INTEGER;
 BEGIN
+  overview_factor := CASE WHEN z <= 5 THEN 8 WHEN z = 6 THEN 4 WHEN z = 7 THEN 2 END;
+
+  IF overview_factor IS NOT NULL AND to_regclass('dataset_overview') IS NOT NULL THEN
+    SELECT max(factor)
+    INTO overview_factor
+    FROM dataset_overview
+    WHERE
+      dataset_id = (query ->> 'dataset_id')
+      AND date_time = (query ->> 'date_time')::timestamp WITH TIME ZONE
+      AND factor IN (2, 4, 8)
+      AND factor <= overview_factor;
+
+    IF overview_factor IS NOT NULL THEN
+      dataset_table_name := (query ->> 'dataset_id') || '_ocean_dataset_data_o' || overview_factor;
+
+      sql_query := format('
+        SELECT ST_AsMVT(tile, ''get_ocean_data_tile'', 4096, ''geom'') FROM (
+          SELECT
+            ST_AsMVTGeom(
+              ST_Transform(cell_points, 3857),
+              ST_TileEnvelope($1, $2, $3)
+            ) AS geom,
+            id,
+            dataset_id,
+            temperature,
+            salinity,
+            u_velocity,
+            v_velocity,
+            zeta,
+            current_speed,
+            current_direction,
+            vorticity
+          FROM %I
+          WHERE
+            cell_points && ST_Transform(ST_TileEnvelope($1, $2, $3), 4326)
+            AND date_time = $4::timestamp WITH TIME ZONE
+            AND depth = $5::float
+        ) AS tile
+      ', dataset_table_name);
+
+      EXECUTE sql_query
+      INTO mvt
+      USING z, x, y, (query ->> 'date_time'), (query ->> 'depth');
+
+      RETURN mvt;
+    END IF;
+  END IF;
+
+  SELECT storage_layout, grid_id
+  INTO dataset_storage_layout, dataset_grid_id
+  FROM dataset
+  WHERE id = (query ->> 'dataset_id');
+
+  IF dataset_storage_layout = 'slab' THEN
+    dataset_table_name := (query ->> 'dataset_id') || '_ocean_dataset_slab';
+
+    sql_query := '
+      SELECT ST_AsMVT(tile, ''get_ocean_data_tile'', 4096, ''geom'') FROM (
+        SELECT
+          ST_AsMVTGeom(
+            ST_Transform(grid_cell.cell_points, 3857),
+            ST_TileEnvelope($1, $2, $3)
+          ) AS geom,
+          slab_cell.cell_id AS id,
+          $6 AS dataset_id,
+          slab_cell.temperature,
+          slab_cell.salinity,
+          slab_cell.u_velocity,
+          slab_cell.v_velocity,
+          slab_cell.zeta,
+          slab_cell.current_speed,
+          slab_cell.current_direction,
+          slab_cell.vorticity
+        FROM grid_cell
+        JOIN get_ocean_data_slab_cells($8, $4::timestamp WITH TIME ZONE, $5::float) AS slab_cell
+          ON slab_cell.cell_id = grid_cell.cell_id
+        WHERE
+          grid_cell.grid_id = $7
+          AND grid_cell.cell_points && ST_Transform(ST_TileEnvelope($1, $2, $3), 4326)
+      ) AS tile
+    ';
+
+    EXECUTE sql_query
+    INTO mvt
+    USING z, x, y, (query ->> 'date_time'), (query ->> 'depth'), (query ->> 'dataset_id'), dataset_grid_id,
+      dataset_table_name;
+
+    RETURN mvt;
+  END IF;
+
+  IF dataset_storage_layout = 'normalized' THEN
+    dataset_table_name := (query ->> 'dataset_id') || '_ocean_dataset_value';
+
+    sql_query := format('
+      SELECT ST_AsMVT(tile, ''get_ocean_data_tile'', 4096, ''geom'') FROM (
+        SELECT
+          ST_AsMVTGeom(
+            ST_Transform(grid_cell.cell_points, 3857),
+            ST_TileEnvelope($1, $2, $3)
+          ) AS geom,
+          ocean_dataset_value.cell_id AS id,
+          $6 AS dataset_id,
+          ocean_dataset_value.temperature,
+          ocean_dataset_value.salinity,
+          ocean_dataset_value.u_velocity,
+          ocean_dataset_value.v_velocity,
+          ocean_dataset_value.zeta,
+          ocean_dataset_value.current_speed,
+          ocean_dataset_value.current_direction,
+          ocean_dataset_value.vorticity
+        FROM grid_cell
+        JOIN %I AS ocean_dataset_value ON ocean_dataset_value.cell_id = grid_cell.cell_id
+        WHERE
+          grid_cell.grid_id = $7
+          AND grid_cell.cell_points && ST_Transform(ST_TileEnvelope($1, $2, $3), 4326)
+          AND ocean_dataset_value.date_time = $4::timestamp WITH TIME ZONE
+          AND ocean_dataset_value.depth = $5::float
+      ) AS tile
+    ', dataset_table_name);
+
+    EXECUTE sql_query
+    INTO mvt
+    USING z, x, y, (query ->> 'date_time'), (query ->> 'depth'), (query ->> 'dataset_id'), dataset_grid_id;
+
+    RETURN mvt;
+  END IF;
+
   dataset_table_name := (query ->> 'dataset_id') || '_ocean_dataset_data';
 
   sql_query := format('
@@ -23,7 +242,10 @@ BEGIN
         salinity,
         u_velocity,
         v_velocity,
-        zeta
+        zeta,
+        current_speed,
+        current_direction,
+        vorticity
       FROM %I
       WHERE
         date_time = $4::timestamp WITH TIME ZONE
@@ -50,6 +272,7 @@ DECLARE
     idx_name TEXT;
     pk_name TEXT;
     seq_name TEXT;
+    partition_name TEXT;
 BEGIN
     EXECUTE 'LOCK TABLE ' || current_table_name || ', ' || temp_table_name || ' IN ACCESS EXCLUSIVE MODE';
 
@@ -75,8 +298,87 @@ BEGIN
         EXECUTE 'ALTER INDEX ' || idx_name || ' RENAME TO ' || replace(idx_name, temp_table_name, current_table_name);
     END LOOP;
 
+    -- The partitions of a partitioned table are renamed too, so that they don't clash with those of the next temp table
+    FOR partition_name IN
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON pg_inherits.inhparent = parent.oid
+        JOIN pg_class child ON pg_inherits.inhrelid = child.oid
+        WHERE parent.relname = current_table_name
+        AND position(temp_table_name IN child.relname) > 0
+    LOOP
+        EXECUTE 'ALTER TABLE ' || partition_name || ' RENAME TO ' || replace(partition_name, temp_table_name, current_table_name);
+    END LOOP;
+
     IF seq_name IS NOT NULL THEN
         EXECUTE 'ALTER SEQUENCE ' || seq_name || ' RENAME TO ' || current_table_name || '_id_seq';
     END IF;
 END;
 $$ LANGUAGE plpgsql;
+
+-- ################################################################################################
+
+CREATE OR REPLACE FUNCTION swap_partitions(
+    current_table_name TEXT,
+    temp_table_name TEXT
+) RETURNS VOID AS $$
+DECLARE
+    temp_partition RECORD;
+    current_partition_name TEXT;
+    partition_name TEXT;
+BEGIN
+    EXECUTE 'LOCK TABLE ' || current_table_name || ', ' || temp_table_name || ' IN ACCESS EXCLUSIVE MODE';
+
+    FOR temp_partition IN
+        SELECT child.relname AS name, pg_get_expr(child.relpartbound, child.oid) AS bound
+        FROM pg_inherits
+        JOIN pg_class parent ON pg_inherits.inhparent = parent.oid
+        JOIN pg_class child ON pg_inherits.inhrelid = child.oid
+        WHERE parent.relname = temp_table_name
+    LOOP
+        EXECUTE 'ALTER TABLE ' || temp_table_name || ' DETACH PARTITION ' || temp_partition.name;
+
+        -- Drop the current partition with the same bounds, it's replaced by the temp partition
+        FOR current_partition_name IN
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class parent ON pg_inherits.inhparent = parent.oid
+            JOIN pg_class child ON pg_inherits.inhrelid = child.oid
+            WHERE parent.relname = current_table_name
+            AND pg_get_expr(child.relpartbound, child.oid) = temp_partition.bound
+        LOOP
+            EXECUTE 'DROP TABLE ' || current_partition_name;
+        END LOOP;
+
+        partition_name := replace(temp_partition.name, temp_table_name, current_table_name);
+        EXECUTE 'ALTER TABLE ' || temp_partition.name || ' RENAME TO ' || partition_name;
+        EXECUTE 'ALTER TABLE ' || current_table_name || ' ATTACH PARTITION ' || partition_name || ' ' || temp_partition.bound;
+    END LOOP;
+
+    -- The detached partitions no longer depend on the temp table, other than for the default of their id
+    EXECUTE 'DROP TABLE ' || temp_table_name || ' CASCADE';
+END;
+$$ LANGUAGE plpgsql;
+
+-- ################################################################################################
+
+CREATE OR REPLACE FUNCTION prune_partitions(
+    table_name TEXT,
+    oldest_date_time TIMESTAMP
+) RETURNS VOID AS $$
+DECLARE
+    table_partition RECORD;
+BEGIN
+    FOR table_partition IN
+        SELECT child.relname AS name, pg_get_expr(child.relpartbound, child.oid) AS bound
+        FROM pg_inherits
+        JOIN pg_class parent ON pg_inherits.inhparent = parent.oid
+        JOIN pg_class child ON pg_inherits.inhrelid = child.oid
+        WHERE parent.relname = table_name
+    LOOP
+        IF substring(table_partition.bound FROM 'TO \(''([^'']*)''\)')::timestamp <= oldest_date_time THEN
+            EXECUTE 'DROP TABLE ' || table_partition.name;
+        END IF;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
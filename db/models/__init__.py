@@ -1,2 +1,5 @@
 from .dataset import Dataset
 from .variable import DatasetVariable, VariableThresholds
+from .grid_cell import GridCell
+from .ingest_manifest import IngestManifest
+from .dataset_overview import DatasetOverview
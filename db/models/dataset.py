@@ -20,5 +20,9 @@ class Dataset(Base):
     start_date = Column(DateTime)
     end_date = Column(DateTime)
     time_step_minutes = Column(Integer)
+    storage_layout = Column(String, nullable=False, server_default='wide')
+    grid_id = Column(String)
+    # Bumped whenever newly ingested data is switched in, which invalidates anything cached about the dataset
+    generation = Column(Integer, nullable=False, server_default='0')
 
     variables = relationship("DatasetVariable", back_populates="dataset")
@@ -0,0 +1,16 @@
+from sqlalchemy import Column, String, Integer, DateTime, ForeignKey
+
+from db import Base
+
+
+class DatasetOverview(Base):
+    """
+    A Dataset Overview records a time step that the overview table of an aggregation factor of a dataset has, over
+    all depths, so that get_ocean_data_tile finds the overview to read from without probing each overview table.
+    """
+
+    __tablename__ = 'dataset_overview'
+
+    dataset_id = Column(String, ForeignKey('dataset.id'), primary_key=True)
+    date_time = Column(DateTime, primary_key=True)
+    factor = Column(Integer, primary_key=True)
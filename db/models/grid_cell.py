@@ -0,0 +1,21 @@
+from sqlalchemy import Column, String, Integer
+from geoalchemy2 import Geometry
+
+from db import Base
+
+GRID_CELL_COLUMNS = ['grid_id', 'cell_id', 'eta', 'xi', 'cell_points']
+
+
+class GridCell(Base):
+    """
+    A Grid Cell is a static cell of an ocean model grid, shared by the datasets on that grid.
+    Grids are identified by the fingerprint of their coordinates and land mask.
+    """
+
+    __tablename__ = 'grid_cell'
+
+    grid_id = Column(String, primary_key=True)
+    cell_id = Column(Integer, primary_key=True)
+    eta = Column(Integer, nullable=False)
+    xi = Column(Integer, nullable=False)
+    cell_points = Column(Geometry('POLYGON', srid=4326), nullable=False)
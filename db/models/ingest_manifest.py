@@ -0,0 +1,47 @@
+from sqlalchemy import Column, String, BigInteger, Float, DateTime, ForeignKey
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from db import Base
+
+
+class IngestManifest(Base):
+    """
+    An Ingest Manifest records the source file a dataset was last ingested from, and the time steps loaded from it
+    with a hash of the values of each
+    """
+
+    __tablename__ = 'ingest_manifest'
+
+    dataset_id = Column(String, ForeignKey('dataset.id'), primary_key=True)
+    source_path = Column(String, nullable=False)
+    source_size = Column(BigInteger, nullable=False)
+    source_mtime = Column(Float, nullable=False)
+    source_hash = Column(String)
+    grid_id = Column(String, nullable=False)
+    storage_layout = Column(String, nullable=False)
+    loaded_times = Column(ARRAY(DateTime), nullable=False)
+    loaded_time_hashes = Column(ARRAY(String))
+    updated_at = Column(DateTime, nullable=False)
+
+    _repr_ = ['dataset_id', 'source_path', 'source_size', 'source_mtime', 'grid_id']
+
+    def is_source_unchanged(self, source_path: str, source_size: int, source_mtime: float,
+                            source_hash: str | None) -> bool:
+        """
+        The source is unchanged if it's the same file, of the same size and modification time, or content.
+        """
+        if self.source_path != source_path or self.source_size != source_size:
+            return False
+        if source_hash is not None and self.source_hash is not None:
+            return self.source_hash == source_hash
+        return self.source_mtime == source_mtime
+
+    def get_loaded_time_hashes(self) -> dict:
+        """
+        The hashes of the loaded time steps by time, without those of manifests saved before they were recorded.
+        """
+        return {
+            loaded_time: loaded_time_hash
+            for loaded_time, loaded_time_hash in zip(self.loaded_times, self.loaded_time_hashes or [])
+            if loaded_time_hash is not None
+        }
@@ -10,6 +10,18 @@ BULK_SELECT_SQL = "SELECT cell_points, temperature FROM ocean_dataset_data"
 
 __BASE_TABLE_NAME = 'ocean_dataset_data'
 
+INGEST_COLUMNS = [
+    'dataset_id', 'cell_id', 'date_time', 'depth', 'cell_points', 'temperature', 'salinity', 'u_velocity', 'v_velocity', 'zeta',
+    'current_speed', 'current_direction', 'vorticity'
+]
+
+
+# The secondary indexes of the table, by the suffix of their name
+__INDEXES = {
+    'idx_date_time_depth': ['date_time', 'depth'],
+    'idx_cell_id_date_time_depth': ['cell_id', 'date_time', 'depth'],
+}
+
 
 def get_table_name(dataset_id: str) -> str:
     return f'{dataset_id}_{__BASE_TABLE_NAME}'
@@ -19,22 +31,63 @@ def get_temp_table_name(dataset_id: str) -> str:
     return f'{dataset_id}_temp_{__BASE_TABLE_NAME}'
 
 
-def get_attributes(table_name: str):
+def get_overview_table_name(dataset_id: str, factor: int) -> str:
+    """
+    Overview tables hold the data aggregated over blocks of factor x factor cells, for low zoom levels.
+    """
+    return f'{get_table_name(dataset_id)}_o{factor}'
+
+
+def get_temp_overview_table_name(dataset_id: str, factor: int) -> str:
+    return f'{get_temp_table_name(dataset_id)}_o{factor}'
+
+
+def get_attributes(table_name: str, partitioned: bool = False, deferred_indexes: bool = False, unlogged: bool = False):
+    """
+    Partitioned tables are partitioned by date_time, which therefore has to be part of the primary key.
+    The cell_id index serves the values of a cell over time and depth in a single range scan.
+    Tables that are bulk loaded can defer their secondary indexes, which are then built with
+    get_create_index_sqls once the table is loaded, and can be unlogged, which partitioned tables can't be.
+    """
     return {
         '__tablename__': table_name,
 
         '__table_args__': (
-            Index(f'{table_name}_idx_date_time_depth', 'date_time', 'depth'),
+            *([] if deferred_indexes else [
+                Index(f'{table_name}_{index_name}', *index_columns) for index_name, index_columns in __INDEXES.items()
+            ]),
+            {
+                **({'postgresql_partition_by': 'RANGE (date_time)'} if partitioned else {}),
+                **({'prefixes': ['UNLOGGED']} if unlogged else {}),
+            },
         ),
 
-        'id': Column(Integer, primary_key=True),
+        'id': Column(Integer, primary_key=True, autoincrement=True),
         'dataset_id': Column(String, nullable=False),
-        'date_time': Column(DateTime, nullable=False),
+        'cell_id': Column(Integer, nullable=False),
+        'date_time': Column(DateTime, primary_key=partitioned, nullable=False),
         'depth': Column(Numeric, nullable=False),
-        'cell_points': Column(Geometry('POLYGON', srid=4326), nullable=False),
+        'cell_points': Column(Geometry('POLYGON', srid=4326, spatial_index=not deferred_indexes), nullable=False),
         'temperature': Column(Numeric, nullable=False),
         'salinity': Column(Numeric, nullable=False),
         'u_velocity': Column(Numeric, nullable=False),
         'v_velocity': Column(Numeric, nullable=False),
         'zeta': Column(Numeric, nullable=True),
+        # Derived from the velocities at ingest
+        'current_speed': Column(Numeric, nullable=True),
+        'current_direction': Column(Numeric, nullable=True),
+        'vorticity': Column(Numeric, nullable=True),
     }
+
+
+def get_create_index_sqls(table_name: str) -> list[str]:
+    """
+    The statements that build the secondary indexes of a table that was created with deferred indexes.
+    """
+    create_index_sqls = [
+        f'CREATE INDEX IF NOT EXISTS {table_name}_{index_name} ON {table_name} ({", ".join(index_columns)})'
+        for index_name, index_columns in __INDEXES.items()
+    ]
+    # Named like the spatial index geoalchemy2 creates
+    create_index_sqls.append(f'CREATE INDEX IF NOT EXISTS idx_{table_name}_cell_points ON {table_name} USING gist (cell_points)')
+    return create_index_sqls
@@ -0,0 +1,69 @@
+from sqlalchemy import Column, Integer, DateTime, Numeric, Index, REAL
+from sqlalchemy.dialects.postgresql import ARRAY
+
+__BASE_TABLE_NAME = 'ocean_dataset_slab'
+
+INGEST_COLUMNS = [
+    'date_time', 'depth', 'temperature', 'salinity', 'u_velocity', 'v_velocity', 'zeta',
+    'current_speed', 'current_direction', 'vorticity'
+]
+
+
+# The secondary indexes of the table, by the suffix of their name
+__INDEXES = {
+    'idx_date_time_depth': ['date_time', 'depth'],
+}
+
+
+def get_table_name(dataset_id: str) -> str:
+    return f'{dataset_id}_{__BASE_TABLE_NAME}'
+
+
+def get_temp_table_name(dataset_id: str) -> str:
+    return f'{dataset_id}_temp_{__BASE_TABLE_NAME}'
+
+
+def get_attributes(table_name: str, partitioned: bool = False, deferred_indexes: bool = False, unlogged: bool = False):
+    """
+    The values of the slab storage layout, with a row per time and depth that holds the values of all the cells of
+    the grid as float4 arrays. The value of a cell is at its cell_id + 1, and is NULL for cells without values.
+    The cell geometries are kept once in the grid_cell table, like the normalized storage layout's.
+    The arrays are expanded by the get_ocean_data_slab_cells and get_ocean_data_slab_cell_values SQL functions.
+    """
+    return {
+        '__tablename__': table_name,
+
+        '__table_args__': (
+            *([] if deferred_indexes else [
+                Index(f'{table_name}_{index_name}', *index_columns) for index_name, index_columns in __INDEXES.items()
+            ]),
+            {
+                **({'postgresql_partition_by': 'RANGE (date_time)'} if partitioned else {}),
+                **({'prefixes': ['UNLOGGED']} if unlogged else {}),
+            },
+        ),
+
+        'id': Column(Integer, primary_key=True, autoincrement=True),
+        'date_time': Column(DateTime, primary_key=partitioned, nullable=False),
+        'depth': Column(Numeric, nullable=False),
+        'temperature': Column(ARRAY(REAL), nullable=False),
+        'salinity': Column(ARRAY(REAL), nullable=False),
+        'u_velocity': Column(ARRAY(REAL), nullable=False),
+        'v_velocity': Column(ARRAY(REAL), nullable=False),
+        'zeta': Column(ARRAY(REAL), nullable=True),
+        # Derived from the velocities at ingest
+        'current_speed': Column(ARRAY(REAL), nullable=True),
+        'current_direction': Column(ARRAY(REAL), nullable=True),
+        'vorticity': Column(ARRAY(REAL), nullable=True),
+    }
+
+
+def get_create_index_sqls(table_name: str) -> list[str]:
+    """
+    The statements that build the secondary indexes of a table that was created with deferred indexes.
+    """
+    create_index_sqls = [
+        f'CREATE INDEX IF NOT EXISTS {table_name}_{index_name} ON {table_name} ({", ".join(index_columns)})'
+        for index_name, index_columns in __INDEXES.items()
+    ]
+    return create_index_sqls
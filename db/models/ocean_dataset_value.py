@@ -0,0 +1,71 @@
+from sqlalchemy import Column, Integer, DateTime, Numeric, Index
+
+__BASE_TABLE_NAME = 'ocean_dataset_value'
+
+INGEST_COLUMNS = [
+    'cell_id', 'date_time', 'depth', 'temperature', 'salinity', 'u_velocity', 'v_velocity', 'zeta',
+    'current_speed', 'current_direction', 'vorticity'
+]
+
+
+# The secondary indexes of the table, by the suffix of their name
+__INDEXES = {
+    'idx_date_time_depth': ['date_time', 'depth'],
+    'idx_cell_id_date_time_depth': ['cell_id', 'date_time', 'depth'],
+}
+
+
+def get_table_name(dataset_id: str) -> str:
+    return f'{dataset_id}_{__BASE_TABLE_NAME}'
+
+
+def get_temp_table_name(dataset_id: str) -> str:
+    return f'{dataset_id}_temp_{__BASE_TABLE_NAME}'
+
+
+def get_attributes(table_name: str, partitioned: bool = False, deferred_indexes: bool = False, unlogged: bool = False):
+    """
+    The values of the normalized storage layout, where the cell geometries are kept once in the grid_cell table.
+    Partitioned tables are partitioned by date_time, which therefore has to be part of the primary key.
+    The cell_id index serves the values of a cell over time and depth in a single range scan.
+    Tables that are bulk loaded can defer their secondary indexes, which are then built with
+    get_create_index_sqls once the table is loaded, and can be unlogged, which partitioned tables can't be.
+    """
+    return {
+        '__tablename__': table_name,
+
+        '__table_args__': (
+            *([] if deferred_indexes else [
+                Index(f'{table_name}_{index_name}', *index_columns) for index_name, index_columns in __INDEXES.items()
+            ]),
+            {
+                **({'postgresql_partition_by': 'RANGE (date_time)'} if partitioned else {}),
+                **({'prefixes': ['UNLOGGED']} if unlogged else {}),
+            },
+        ),
+
+        'id': Column(Integer, primary_key=True, autoincrement=True),
+        'cell_id': Column(Integer, nullable=False),
+        'date_time': Column(DateTime, primary_key=partitioned, nullable=False),
+        'depth': Column(Numeric, nullable=False),
+        'temperature': Column(Numeric, nullable=False),
+        'salinity': Column(Numeric, nullable=False),
+        'u_velocity': Column(Numeric, nullable=False),
+        'v_velocity': Column(Numeric, nullable=False),
+        'zeta': Column(Numeric, nullable=True),
+        # Derived from the velocities at ingest
+        'current_speed': Column(Numeric, nullable=True),
+        'current_direction': Column(Numeric, nullable=True),
+        'vorticity': Column(Numeric, nullable=True),
+    }
+
+
+def get_create_index_sqls(table_name: str) -> list[str]:
+    """
+    The statements that build the secondary indexes of a table that was created with deferred indexes.
+    """
+    create_index_sqls = [
+        f'CREATE INDEX IF NOT EXISTS {table_name}_{index_name} ON {table_name} ({", ".join(index_columns)})'
+        for index_name, index_columns in __INDEXES.items()
+    ]
+    return create_index_sqls
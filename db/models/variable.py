@@ -1,4 +1,5 @@
-from sqlalchemy import Column, String, Integer, Numeric, DateTime, ForeignKey
+from sqlalchemy import Column, String, Integer, Numeric, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 
 from db import Base, Session
@@ -10,6 +11,9 @@ class DatasetVariable(Base):
     """
 
     __tablename__ = 'dataset_variable'
+    __table_args__ = (
+        UniqueConstraint('dataset_id', 'variable_name'),
+    )
 
     id = Column(Integer, primary_key=True)
     dataset_id = Column(String, ForeignKey('dataset.id'), nullable=False)
@@ -33,11 +37,16 @@ class VariableThresholds(Base):
     """
 
     __tablename__ = 'variable_thresholds'
+    __table_args__ = (
+        UniqueConstraint('dataset_variable_id', 'dependent_variable_value'),
+    )
 
     id = Column(Integer, primary_key=True)
     dataset_variable_id = Column(Integer, ForeignKey('dataset_variable.id'), nullable=False)
     min_value = Column(Numeric, nullable=False)
     max_value = Column(Numeric, nullable=False)
     dependent_variable_value = Column(Numeric, nullable=False)
+    percentiles = Column(JSONB)
+    histogram = Column(JSONB)
 
     dataset_variable = relationship("DatasetVariable", back_populates="thresholds")
@@ -1,16 +1,55 @@
-from db.utils import switch_tables, BulkInserter, create_table, table_exists
-from db.models import ocean_dataset_data
+import datetime
+
+from sqlalchemy import text
+
+from db import Session
+from db.utils import switch_tables, swap_partitions, prune_partitions, CopyBulkInserter, create_table, table_exists, \
+    table_is_partitioned
+from db.models import ocean_dataset_data, ocean_dataset_value, ocean_dataset_slab, Dataset, DatasetOverview, GridCell
+from db.models.grid_cell import GRID_CELL_COLUMNS
+from etc.const import StorageLayout
+
+STORAGE_LAYOUT_TABLE_MODELS = {
+    StorageLayout.WIDE: ocean_dataset_data,
+    StorageLayout.NORMALIZED: ocean_dataset_value,
+    StorageLayout.SLAB: ocean_dataset_slab,
+}
 
 
 class OceanDatasetDataTableOrchestrator:
     dataset_id: str
+    storage_layout: StorageLayout
+    partitioned: bool
     ocean_dataset_data_table_exists: bool
-    ingest_into_table_name: str
+    ocean_dataset_data_table_is_partitioned: bool
+    ingest_into_table_name: str = None
     ingest_into_table_attributes: {}
+    ingest_into_current_table = False
+    ingest_date_times: list[datetime.datetime] = None
+    tables_switched = False
+    overview_tables: dict[int, tuple[str, str]]
+    deferred_indexes: bool
+    unlogged: bool
+    staging_tables: dict[str, object]
 
-    def __init__(self, dataset_id):
+    def __init__(self, dataset_id, storage_layout: StorageLayout = StorageLayout.WIDE, partitioned: bool = False,
+                 deferred_indexes: bool = False, unlogged: bool = False):
+        """
+        deferred_indexes, unlogged: the tables that are created to ingest into are staging tables, which are loaded
+        without their secondary indexes, or unlogged, until finish_staging_tables is called.
+        """
         self.dataset_id = dataset_id
-        self.ocean_dataset_data_table_exists = table_exists(ocean_dataset_data.get_table_name(dataset_id))
+        self.storage_layout = storage_layout
+        self.partitioned = partitioned
+        self.deferred_indexes = deferred_indexes
+        self.unlogged = unlogged
+        self.staging_tables = dict()
+        self.table_model = STORAGE_LAYOUT_TABLE_MODELS[storage_layout]
+        self.ocean_dataset_data_table_exists = table_exists(self.table_model.get_table_name(dataset_id))
+        self.ocean_dataset_data_table_is_partitioned = (
+                self.ocean_dataset_data_table_exists and table_is_partitioned(self.table_model.get_table_name(dataset_id))
+        )
+        self.overview_tables = dict()
 
     def create_ingest_into_table(self) -> str:
         """
@@ -19,25 +58,285 @@ class OceanDatasetDataTableOrchestrator:
         If one doesn't exist, create one
         """
         if self.ocean_dataset_data_table_exists:
-            self.ingest_into_table_name = ocean_dataset_data.get_temp_table_name(self.dataset_id)
+            self.ingest_into_table_name = self.table_model.get_temp_table_name(self.dataset_id)
         else:
-            self.ingest_into_table_name = ocean_dataset_data.get_table_name(self.dataset_id)
+            self.ingest_into_table_name = self.table_model.get_table_name(self.dataset_id)
 
-        self.ingest_into_table_attributes = ocean_dataset_data.get_attributes(self.ingest_into_table_name)
+        self.ingest_into_table_attributes = self.table_model.get_attributes(
+            self.ingest_into_table_name, self.partitioned, self.deferred_indexes, self.unlogged and not self.partitioned
+        )
         create_table(self.ingest_into_table_attributes, self.ingest_into_table_name)
+        self.staging_tables[self.ingest_into_table_name] = self.table_model
+
+        return self.ingest_into_table_name
 
+    def use_current_table(self, date_times: list[datetime.datetime]) -> str:
+        """
+        Ingest the given time steps straight into the current table, which is kept rather than switched out.
+        """
+        self.ingest_into_current_table = True
+        self.ingest_date_times = date_times
+        self.ingest_into_table_name = self.table_model.get_table_name(self.dataset_id)
         return self.ingest_into_table_name
 
-    def switch_tables(self):
+    def create_overview_tables(self, factors: list[int]):
+        """
+        Create the overview tables of the given aggregation factors to ingest into, alongside the ingest into table.
+        Overview tables are partitioned like the ingest into table, so that the overviews of the forecast days that
+        are kept when partitions are swapped are kept too.
+        """
+        DatasetOverview.__table__.create(Session.connection(), checkfirst=True)
+        Session.commit()
+
+        for factor in factors:
+            overview_table_name = ocean_dataset_data.get_overview_table_name(self.dataset_id, factor)
+            ingest_into_name = overview_table_name
+            if table_exists(overview_table_name) and not self.ingest_into_current_table:
+                ingest_into_name = ocean_dataset_data.get_temp_overview_table_name(self.dataset_id, factor)
+
+            if table_exists(ingest_into_name):
+                create_table(ocean_dataset_data.get_attributes(ingest_into_name), ingest_into_name)
+            else:
+                create_table(
+                    ocean_dataset_data.get_attributes(
+                        ingest_into_name, self.partitioned, self.deferred_indexes,
+                        self.unlogged and not self.partitioned
+                    ),
+                    ingest_into_name
+                )
+                self.staging_tables[ingest_into_name] = ocean_dataset_data
+            self.overview_tables[factor] = (overview_table_name, ingest_into_name)
+
+    def create_partitions(self, dates: list[datetime.date]):
+        """
+        Partitioned tables have a partition per forecast day, which has to exist before its day is ingested.
+        A partitioned table can't be unlogged, so the partitions of a staging table are instead.
+        The overview tables get partitions too, unless they were created before overviews were partitioned.
+        """
+        table_names = [self.ingest_into_table_name] + [
+            ingest_into_overview_table_name for _, ingest_into_overview_table_name in self.overview_tables.values()
+            if table_is_partitioned(ingest_into_overview_table_name)
+        ]
+        for table_name in table_names:
+            unlogged = 'UNLOGGED' if self.unlogged and table_name in self.staging_tables else ''
+            for date in dates:
+                Session.execute(text(
+                    f"""CREATE {unlogged} TABLE IF NOT EXISTS {get_partition_name(table_name, date)}
+                    PARTITION OF {table_name}
+                    FOR VALUES FROM ('{date.isoformat()}') TO ('{(date + datetime.timedelta(days=1)).isoformat()}')"""
+                ))
+        Session.commit()
+
+    def prune_partitions(self, oldest_date: datetime.date):
+        """
+        Drops the partitions of the forecast days before oldest_date.
+        """
+        if self.partitioned:
+            prune_partitions(self.table_model.get_table_name(self.dataset_id), oldest_date.isoformat())
+
+            for overview_table_name, _ in self.overview_tables.values():
+                if table_is_partitioned(overview_table_name):
+                    prune_partitions(overview_table_name, oldest_date.isoformat())
+                else:
+                    Session.execute(
+                        text(f'DELETE FROM {overview_table_name} WHERE date_time < :oldest_date'),
+                        {"oldest_date": oldest_date}
+                    )
+            if table_exists(DatasetOverview.__tablename__):
+                Session.execute(
+                    text('DELETE FROM dataset_overview WHERE dataset_id = :dataset_id AND date_time < :oldest_date'),
+                    {"dataset_id": self.dataset_id, "oldest_date": oldest_date}
+                )
+            Session.commit()
+
+    def save_grid_cells(self, grid_id: str, grid_cell_columns: list, batch_size: int):
+        """
+        The normalized and slab storage layouts keep the cells of a grid in the grid_cell table, which only needs to be
+        written the first time a grid is ingested.
+        grid_cell_columns: the columns of GRID_CELL_COLUMNS.
+        """
+        GridCell.__table__.create(Session.connection(), checkfirst=True)
+        Session.commit()
+
+        grid_exists = Session.execute(
+            text("SELECT EXISTS (SELECT 1 FROM grid_cell WHERE grid_id = :grid_id)"),
+            {"grid_id": grid_id}
+        ).scalar()
+        if grid_exists:
+            return
+
+        grid_cell_inserter = CopyBulkInserter(
+            copy_sql=f"COPY grid_cell ({', '.join(GRID_CELL_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            batch_size=batch_size
+        )
+        grid_cell_inserter.add_columns(grid_cell_columns)
+        grid_cell_inserter.flush()
+
+    def finish_staging_tables(self, index_build_workers: int, index_build_memory_mb: int):
+        """
+        Finishes the staging tables once they're loaded, before they're switched in: builds their deferred indexes
+        in a single pass per index with parallel maintenance workers, analyzes them, and makes the unlogged ones logged.
+        """
+        if not self.staging_tables:
+            return
+
+        Session.execute(text(f'SET LOCAL max_parallel_maintenance_workers = {int(index_build_workers)}'))
+        Session.execute(text(f"SET LOCAL maintenance_work_mem = '{int(index_build_memory_mb)}MB'"))
+        for table_name, table_model in self.staging_tables.items():
+            if self.deferred_indexes:
+                for create_index_sql in table_model.get_create_index_sqls(table_name):
+                    Session.execute(text(create_index_sql))
+
+            Session.execute(text(f'ANALYZE {table_name}'))
+
+            if self.unlogged:
+                for unlogged_table_name in self.get_unlogged_table_names(table_name):
+                    Session.execute(text(f'ALTER TABLE {unlogged_table_name} SET LOGGED'))
+        Session.commit()
+
+    def get_unlogged_table_names(self, table_name: str) -> list[str]:
+        """
+        The tables that hold the rows of a table: the table itself, or the partitions of a partitioned table.
+        """
+        return Session.execute(
+            text("""SELECT c.relname FROM pg_class c
+            WHERE c.relpersistence = 'u'
+            AND (c.relname = :table_name OR c.oid IN (
+                SELECT inhrelid FROM pg_inherits WHERE inhparent = CAST(:table_name AS regclass)
+            ))"""),
+            {"table_name": table_name}
+        ).scalars().all()
+
+    def switch_tables(self, grid_id: str, date_times: list[datetime.datetime]):
+        """
+        Only switch out the tables if a temp table was needed, and not when ingesting into the current table.
+        When both tables are partitioned, only the partitions of the ingested days are swapped into the current
+        table, and the partitions of the other days are kept. The same goes for each of the overview tables.
+        The switches are committed together with the dataset's storage layout and grid, and the time steps each
+        overview table has, so that readers like get_ocean_data_tile always find the tables of the storage layout the
+        dataset has, and only the overviews that have the time steps they read.
+        Only then are the tables of the other storage layouts, and the overview tables that weren't ingested, dropped,
+        since the dataset no longer uses them.
+        date_times: the ingested time steps.
+        """
+        save_overview_times = table_exists(DatasetOverview.__tablename__)
+        if save_overview_times and not self.ingest_into_current_table:
+            # The overview tables that weren't ingested are dropped below
+            Session.execute(
+                text('DELETE FROM dataset_overview WHERE dataset_id = :dataset_id AND NOT factor = ANY(:factors)'),
+                {"dataset_id": self.dataset_id, "factors": list(self.overview_tables)}
+            )
+
+        for factor, (overview_table_name, ingest_into_overview_table_name) in self.overview_tables.items():
+            # The time steps that the overview table no longer has once the ingested ones are switched in
+            replaced_overview_times_condition = 'date_time = ANY(:date_times)'
+            if overview_table_name != ingest_into_overview_table_name:
+                if self.partitioned and table_is_partitioned(overview_table_name):
+                    swap_partitions(overview_table_name, ingest_into_overview_table_name, commit=False)
+                    replaced_overview_times_condition = 'CAST(date_time AS date) = ANY(:dates)'
+                else:
+                    switch_tables(overview_table_name, ingest_into_overview_table_name, commit=False)
+                    replaced_overview_times_condition = 'TRUE'
+            elif not self.ingest_into_current_table:
+                # A new overview table
+                replaced_overview_times_condition = 'TRUE'
+
+            if save_overview_times:
+                self.save_overview_times(factor, date_times, replaced_overview_times_condition)
+
+        if self.ocean_dataset_data_table_exists and not self.ingest_into_current_table:
+            table_name = self.table_model.get_table_name(self.dataset_id)
+            if self.partitioned and self.ocean_dataset_data_table_is_partitioned:
+                swap_partitions(table_name, self.ingest_into_table_name, commit=False)
+            else:
+                switch_tables(table_name, self.ingest_into_table_name, commit=False)
+
+        dataset = Session.get(Dataset, self.dataset_id)
+        dataset.storage_layout = self.storage_layout.value
+        dataset.grid_id = grid_id
+        Session.commit()
+        self.tables_switched = True
+
+        for storage_layout, table_model in STORAGE_LAYOUT_TABLE_MODELS.items():
+            if storage_layout != self.storage_layout:
+                Session.execute(text(f'DROP TABLE IF EXISTS {table_model.get_table_name(self.dataset_id)}'))
+
+        if not self.ingest_into_current_table:
+            for overview_table_name in self.get_existing_overview_table_names():
+                if overview_table_name not in [names[0] for names in self.overview_tables.values()]:
+                    Session.execute(text(f'DROP TABLE IF EXISTS {overview_table_name}'))
+        Session.commit()
+
+    def save_overview_times(self, factor: int, date_times: list[datetime.datetime],
+                            replaced_overview_times_condition: str):
+        """
+        Records the ingested time steps as the ones the overview table of the factor has, instead of the time steps
+        that match the condition, without committing.
+        """
+        Session.execute(
+            text(f"""DELETE FROM dataset_overview
+                WHERE dataset_id = :dataset_id AND factor = :factor AND {replaced_overview_times_condition}"""),
+            {
+                "dataset_id": self.dataset_id,
+                "factor": factor,
+                "date_times": date_times,
+                "dates": sorted({date_time.date() for date_time in date_times}),
+            }
+        )
+        Session.execute(
+            text("""INSERT INTO dataset_overview (dataset_id, date_time, factor)
+                SELECT :dataset_id, date_time, :factor FROM unnest(CAST(:date_times AS timestamp[])) AS date_time"""),
+            {"dataset_id": self.dataset_id, "factor": factor, "date_times": date_times}
+        )
+
+    def drop_ingest_into_table(self):
         """
-        Only switch out the tables if a temp table was needed.
+        Aborts an ingest by dropping the table that was being ingested into, without switching any tables.
+        When ingesting into the current table, only the time steps that were being ingested are deleted.
         """
-        if not self.ocean_dataset_data_table_exists:
+        if self.ingest_into_table_name is None or self.tables_switched:
             return
 
-        switch_tables(ocean_dataset_data.get_table_name(self.dataset_id), self.ingest_into_table_name)
+        Session.rollback()
+        ingest_into_table_names = [self.ingest_into_table_name] + [
+            ingest_into_overview_table_name for _, ingest_into_overview_table_name in self.overview_tables.values()
+        ]
+        for ingest_into_table_name in ingest_into_table_names:
+            if self.ingest_into_current_table:
+                Session.execute(
+                    text(f'DELETE FROM {ingest_into_table_name} WHERE date_time = ANY(:date_times)'),
+                    {"date_times": self.ingest_date_times}
+                )
+            else:
+                Session.execute(text(f'DROP TABLE IF EXISTS {ingest_into_table_name}'))
+        Session.commit()
+
+    def get_existing_overview_table_names(self) -> list[str]:
+        return Session.execute(
+            text("SELECT tablename FROM pg_tables WHERE tablename ~ :pattern"),
+            {"pattern": f'^{ocean_dataset_data.get_overview_table_name(self.dataset_id, "")}[0-9]+$'}
+        ).scalars().all()
 
     def get_bulk_insert_sql(self) -> str:
         return f"""INSERT INTO {self.ingest_into_table_name} (
-            dataset_id, date_time, depth, cell_points, temperature, salinity, u_velocity, v_velocity, zeta
+            {', '.join(self.table_model.INGEST_COLUMNS)}
         ) VALUES %s"""
+
+    def get_bulk_copy_sql(self) -> str:
+        return f"""COPY {self.ingest_into_table_name} (
+            {', '.join(self.table_model.INGEST_COLUMNS)}
+        ) FROM STDIN WITH (FORMAT csv)"""
+
+    def get_overview_bulk_copy_sql(self, factor: int) -> str:
+        return f"""COPY {self.overview_tables[factor][1]} (
+            {', '.join(ocean_dataset_data.INGEST_COLUMNS)}
+        ) FROM STDIN WITH (FORMAT csv)"""
+
+    def get_overview_bulk_insert_sql(self, factor: int) -> str:
+        return f"""INSERT INTO {self.overview_tables[factor][1]} (
+            {', '.join(ocean_dataset_data.INGEST_COLUMNS)}
+        ) VALUES %s"""
+
+
+def get_partition_name(table_name: str, date: datetime.date) -> str:
+    return f'{table_name}_p{date.strftime("%Y%m%d")}'
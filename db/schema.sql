@@ -0,0 +1,106 @@
+-- Changes to the schema of existing databases, in the order they were made.
+
+ALTER TABLE dataset ADD COLUMN IF NOT EXISTS storage_layout TEXT NOT NULL DEFAULT 'wide';
+ALTER TABLE dataset ADD COLUMN IF NOT EXISTS grid_id TEXT;
+
+CREATE TABLE IF NOT EXISTS ingest_manifest (
+    dataset_id TEXT PRIMARY KEY REFERENCES dataset (id),
+    source_path TEXT NOT NULL,
+    source_size BIGINT NOT NULL,
+    source_mtime DOUBLE PRECISION NOT NULL,
+    source_hash TEXT,
+    grid_id TEXT NOT NULL,
+    storage_layout TEXT NOT NULL,
+    loaded_times TIMESTAMP WITHOUT TIME ZONE[] NOT NULL,
+    loaded_time_hashes TEXT[],
+    updated_at TIMESTAMP WITHOUT TIME ZONE NOT NULL
+);
+
+ALTER TABLE ingest_manifest ADD COLUMN IF NOT EXISTS loaded_time_hashes TEXT[];
+
+ALTER TABLE dataset ADD COLUMN IF NOT EXISTS generation INTEGER NOT NULL DEFAULT 0;
+
+-- The wide ocean dataset data tables of every dataset, which are otherwise only recreated by a full ingest
+DO $$
+DECLARE
+    table_name TEXT;
+BEGIN
+    FOR table_name IN
+        SELECT tablename FROM pg_tables
+        WHERE tablename ~ '_ocean_dataset_data(_o[0-9]+)?$' AND tablename !~ '_p[0-9]{8}$'
+    LOOP
+        EXECUTE format('ALTER TABLE %I ADD COLUMN IF NOT EXISTS cell_id INTEGER', table_name);
+        EXECUTE format(
+            'CREATE INDEX IF NOT EXISTS %I ON %I (cell_id, date_time, depth)',
+            table_name || '_idx_cell_id_date_time_depth', table_name
+        );
+    END LOOP;
+END
+$$;
+
+DO $$
+DECLARE
+    table_name TEXT;
+BEGIN
+    FOR table_name IN
+        SELECT tablename FROM pg_tables WHERE tablename ~ '_ocean_dataset_value$'
+    LOOP
+        EXECUTE format(
+            'CREATE INDEX IF NOT EXISTS %I ON %I (cell_id, date_time, depth)',
+            table_name || '_idx_cell_id_date_time_depth', table_name
+        );
+    END LOOP;
+END
+$$;
+
+ALTER TABLE variable_thresholds ADD COLUMN IF NOT EXISTS percentiles JSONB;
+ALTER TABLE variable_thresholds ADD COLUMN IF NOT EXISTS histogram JSONB;
+CREATE UNIQUE INDEX IF NOT EXISTS dataset_variable_dataset_id_variable_name_key
+    ON dataset_variable (dataset_id, variable_name);
+CREATE UNIQUE INDEX IF NOT EXISTS variable_thresholds_dataset_variable_id_dependent_variable_value_key
+    ON variable_thresholds (dataset_variable_id, dependent_variable_value);
+
+-- The current speed, direction and vorticity derived at ingest, which the tables of earlier ingests don't have
+DO $$
+DECLARE
+    table_name TEXT;
+    column_type TEXT;
+BEGIN
+    FOR table_name IN
+        SELECT tablename FROM pg_tables
+        WHERE tablename ~ '_ocean_dataset_(data(_o[0-9]+)?|value|slab)$' AND tablename !~ '_p[0-9]{8}$'
+    LOOP
+        column_type := CASE WHEN table_name ~ '_ocean_dataset_slab$' THEN 'REAL[]' ELSE 'NUMERIC' END;
+        EXECUTE format(
+            'ALTER TABLE %I ADD COLUMN IF NOT EXISTS current_speed %s, '
+            'ADD COLUMN IF NOT EXISTS current_direction %s, ADD COLUMN IF NOT EXISTS vorticity %s',
+            table_name, column_type, column_type, column_type
+        );
+    END LOOP;
+END
+$$;
+
+-- The time steps that the overview tables have, which get_ocean_data_tile looks up rather than probing each of them
+CREATE TABLE IF NOT EXISTS dataset_overview (
+    dataset_id TEXT NOT NULL REFERENCES dataset (id),
+    date_time TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    factor INTEGER NOT NULL,
+    PRIMARY KEY (dataset_id, date_time, factor)
+);
+
+DO $$
+DECLARE
+    table_name TEXT;
+BEGIN
+    FOR table_name IN
+        SELECT tablename FROM pg_tables
+        WHERE tablename ~ '_ocean_dataset_data_o[0-9]+$' AND tablename !~ '_temp_ocean_dataset_data_o[0-9]+$'
+    LOOP
+        EXECUTE format(
+            'INSERT INTO dataset_overview (dataset_id, date_time, factor) '
+            'SELECT DISTINCT dataset_id, date_time, %s FROM %I ON CONFLICT DO NOTHING',
+            substring(table_name FROM '_o([0-9]+)$'), table_name
+        );
+    END LOOP;
+END
+$$;
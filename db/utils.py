@@ -1,9 +1,13 @@
+import io
+import itertools
 import logging
+import time
 
+import numpy as np
 from psycopg2 import extras
 from sqlalchemy import text
 
-from db import conn, curr, Session, Base
+from db import Session, Base, checkout_connection
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +23,14 @@ def table_exists(table_name: str):
     return Session.bind.dialect.has_table(Session.connection(), table_name)
 
 
+def table_is_partitioned(table_name: str):
+    partitioned_table_sql = """SELECT EXISTS (
+        SELECT 1 FROM pg_partitioned_table JOIN pg_class ON pg_partitioned_table.partrelid = pg_class.oid
+        WHERE pg_class.relname = :table_name
+    )"""
+    return Session.execute(text(partitioned_table_sql), {"table_name": table_name}).scalar()
+
+
 def create_empty_mirrored_temp_table(
         source_table_name: str,
         temp_table_name: str
@@ -30,46 +42,269 @@ def create_empty_mirrored_temp_table(
 
 def switch_tables(
         current_table_name: str,
-        temp_table_name: str
+        temp_table_name: str,
+        commit: bool = True
 ):
     """
     This function will drop the current table and rename the temp table to the current one.
     Refer to the switch_tables function in functions.sql.
+    commit: whether to commit the switch, rather than leaving it to the caller's transaction.
     """
     switch_tables_sql = "SELECT switch_tables(:current_table_name, :temp_table_name);"
     Session.execute(
         text(switch_tables_sql),
         {"current_table_name": current_table_name, "temp_table_name": temp_table_name}
     )
+    if commit:
+        Session.commit()
+
+
+def swap_partitions(
+        current_table_name: str,
+        temp_table_name: str,
+        commit: bool = True
+):
+    """
+    This function will swap the partitions of the temp table into the current table, replacing the partitions
+    with the same bounds, and drop the temp table.
+    Refer to the swap_partitions function in functions.sql.
+    commit: whether to commit the swap, rather than leaving it to the caller's transaction.
+    """
+    swap_partitions_sql = "SELECT swap_partitions(:current_table_name, :temp_table_name);"
+    Session.execute(
+        text(swap_partitions_sql),
+        {"current_table_name": current_table_name, "temp_table_name": temp_table_name}
+    )
+    if commit:
+        Session.commit()
+
+
+def prune_partitions(
+        table_name: str,
+        oldest_date_time: str
+):
+    """
+    This function will drop the partitions of the table that end before oldest_date_time.
+    Refer to the prune_partitions function in functions.sql.
+    """
+    prune_partitions_sql = "SELECT prune_partitions(:table_name, CAST(:oldest_date_time AS timestamp));"
+    Session.execute(
+        text(prune_partitions_sql),
+        {"table_name": table_name, "oldest_date_time": oldest_date_time}
+    )
     Session.commit()
 
 
 class BulkInserter:
     insert_sql = ''
     batch_size = 50000
-    records_to_insert = []
+    records_to_insert: list
     total_inserted_records = 0
+    metrics = None
 
-    def __init__(self, insert_sql, batch_size):
+    def __init__(self, insert_sql, batch_size, connection=None):
         self.insert_sql = insert_sql
         self.batch_size = batch_size
+        self.connection = connection
+        self.records_to_insert = []
+
+    @property
+    def num_pending_records(self) -> int:
+        return len(self.records_to_insert)
 
     def add_record(self, record):
         self.records_to_insert.append(record)
 
+    def add_records(self, records):
+        """
+        Add many records at once, inserting batches as they fill up.
+        """
+        self.records_to_insert.extend(records)
+        self.insert_batch_records()
+
+    def add_columns(self, columns: list):
+        """
+        Add a batch of records given as columns, in the order of the insert sql.
+        A column is either an array with a value per record, or a single value shared by all records.
+        NaN values are inserted as NULL.
+        """
+        num_records = get_num_records(columns)
+        self.add_records(zip(*[to_record_values(column, num_records) for column in columns]))
+
     def insert_batch_records(self):
-        if len(self.records_to_insert) >= self.batch_size:
+        if self.num_pending_records >= self.batch_size:
             self.insert_records()
 
     def flush(self):
         self.insert_records()
 
+    def set_metrics(self, metrics):
+        """
+        Records the time spent encoding and writing each batch, and the rows and bytes written, in the metrics.
+        metrics: an ingest.metrics.IngestMetrics, or anything with the same add_stage_seconds and record_batch.
+        """
+        self.metrics = metrics
+
     def insert_records(self):
-        extras.execute_values(curr, self.insert_sql, self.records_to_insert, page_size=self.batch_size)
-        conn.commit()
-        self.total_inserted_records += len(self.records_to_insert)
-        logger.info(f"Inserted {len(self.records_to_insert)} records. Total: {self.total_inserted_records}")
+        """
+        Without a connection of its own, each batch is inserted with a connection checked out of the pool.
+        """
+        num_records = self.num_pending_records
+        if not num_records:
+            return
+
+        encode_start_time = time.perf_counter()
+        pending_records = self.encode_pending_records()
+        write_start_time = time.perf_counter()
+        num_bytes = self.send_records(pending_records)
+
+        if self.metrics is not None:
+            write_seconds = time.perf_counter() - write_start_time
+            self.metrics.add_stage_seconds('encode', write_start_time - encode_start_time)
+            self.metrics.add_stage_seconds('db_write', write_seconds)
+            self.metrics.record_batch(num_records, num_bytes, write_seconds)
+
+        self.total_inserted_records += num_records
+        logger.info(f"Inserted {num_records} records. Total: {self.total_inserted_records}")
+
+    def send_records(self, pending_records) -> int:
+        """
+        Writes the encoded records in a transaction of their own, and returns the number of bytes sent.
+        """
+        if self.connection is not None:
+            return self.commit_records(self.connection, pending_records)
+
+        with checkout_connection() as connection:
+            return self.commit_records(connection, pending_records)
+
+    def commit_records(self, connection, pending_records) -> int:
+        with connection.cursor() as cursor:
+            num_bytes = self.write_records(cursor, pending_records)
+        connection.commit()
+        return num_bytes
+
+    def encode_pending_records(self):
+        """
+        Takes the pending records, in the form they are written in.
+        """
+        pending_records = self.records_to_insert
+        self.records_to_insert = []
+        return pending_records
+
+    def write_records(self, cursor, pending_records) -> int:
+        """
+        Writes the encoded records, and returns the number of bytes sent.
+        """
+        extras.execute_values(cursor, self.insert_sql, pending_records, page_size=self.batch_size)
+        return len(cursor.query or b'')
+
+
+class CopyBulkInserter(BulkInserter):
+    """
+    Streams batches of columns into the table with COPY ... FROM STDIN in CSV form, rather than a multi-row INSERT.
+    Geometries should be given as hex EWKB, which PostGIS reads without any parsing of WKT.
+    Records added one at a time are buffered into the same COPY batch, but can only hold plain values, since COPY
+    doesn't evaluate SQL expressions.
+    """
+    columns_to_insert: list
+    num_columns_records: int
+
+    def __init__(self, copy_sql, batch_size, connection=None):
+        super().__init__(copy_sql, batch_size, connection)
+        self.columns_to_insert = []
+        self.num_columns_records = 0
+
+    @property
+    def num_pending_records(self) -> int:
+        return self.num_columns_records + len(self.records_to_insert)
+
+    def add_columns(self, columns: list):
+        self.columns_to_insert.append(columns)
+        self.num_columns_records += get_num_records(columns)
+        self.insert_batch_records()
+
+    def encode_pending_records(self):
+        csv_buffer = io.StringIO()
+        for columns in self.columns_to_insert:
+            num_records = get_num_records(columns)
+            if num_records:
+                csv_buffer.write('\n'.join(map(','.join, zip(*[
+                    to_csv_values(column, num_records) for column in columns
+                ]))))
+                csv_buffer.write('\n')
+        for record in self.records_to_insert:
+            csv_buffer.write(','.join(map(to_csv_value, record)))
+            csv_buffer.write('\n')
+        csv_buffer.seek(0)
+
+        self.columns_to_insert = []
+        self.num_columns_records = 0
         self.records_to_insert = []
+        return csv_buffer
+
+    def write_records(self, cursor, pending_records) -> int:
+        cursor.copy_expert(self.insert_sql, pending_records)
+        return pending_records.tell()
+
+
+def get_num_records(columns: list) -> int:
+    """
+    Gets the number of records in a batch of columns, from the first column that isn't a single value.
+    """
+    return next((len(column) for column in columns if np.ndim(column)), 0)
+
+
+def to_record_values(column, num_records: int):
+    if not np.ndim(column):
+        return itertools.repeat(column, num_records)
+
+    values = np.asarray(column)
+    if values.dtype.kind == 'f' and np.isnan(values).any():
+        return [None if np.isnan(value) else value for value in values.tolist()]
+    return values.tolist()
+
+
+def to_csv_values(column, num_records: int):
+    """
+    Formats a column as CSV values, where NULLs (None or NaN) are left empty.
+    The values of object columns, such as array literals, are quoted, since they may have delimiters in them.
+    """
+    if not np.ndim(column):
+        return itertools.repeat('' if column is None else str(column), num_records)
+
+    values = np.asarray(column)
+    if values.dtype.kind == 'O':
+        return [to_csv_value(value) for value in values.tolist()]
+
+    if values.dtype.kind == 'f':
+        # Formatted as float64, like the Python floats of to_record_values that psycopg2 writes with repr, so that
+        # both bulk loaders store the same values
+        csv_values = values.astype(np.float64).astype(str)
+        csv_values[np.isnan(values)] = ''
+    else:
+        csv_values = values.astype(str)
+    return csv_values.tolist()
+
+
+def to_csv_value(value) -> str:
+    """
+    Formats a single value as a CSV value, where None is NULL.
+    Values other than numbers, such as array literals, are quoted, since they may have delimiters in them.
+    """
+    if value is None:
+        return ''
+    if isinstance(value, (int, float)):
+        return str(value)
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def to_array_literal(values: np.ndarray) -> str:
+    """
+    Formats the values as a PostgreSQL array literal, where NaN values are NULL.
+    """
+    array_values = values.astype(str)
+    array_values[np.isnan(values)] = 'NULL'
+    return '{' + ','.join(array_values.tolist()) + '}'
 
 
 def snake_to_camel(snake_case_string):
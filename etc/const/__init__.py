@@ -4,3 +4,40 @@ from enum import Enum
 class DatasetType(str, Enum):
     """Dataset Types"""
     OCEAN = 'OCEAN'
+
+
+class IngestMode(str, Enum):
+    """Ingest Modes"""
+    PER_CELL = 'per_cell'
+    VECTORIZED = 'vectorized'
+
+
+class BulkLoader(str, Enum):
+    """Bulk Loaders"""
+    INSERT = 'insert'
+    COPY = 'copy'
+
+
+class StorageLayout(str, Enum):
+    """Storage Layouts of ocean dataset data"""
+    WIDE = 'wide'
+    NORMALIZED = 'normalized'
+    SLAB = 'slab'
+
+
+class NetcdfReadMode(str, Enum):
+    """NetCDF Read Modes"""
+    EAGER = 'eager'
+    LAZY = 'lazy'
+
+
+class IngestStatus(str, Enum):
+    """Ingest Statuses of a dataset"""
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+
+
+class ExportFormat(str, Enum):
+    """Export Formats of ingested ocean dataset data"""
+    GEOPARQUET = 'geoparquet'
+    ZARR = 'zarr'
@@ -1,46 +1,109 @@
+import datetime
 import logging
-import queue
-import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
+from db import Session
+from etc.config import config
+from etc.const import IngestStatus
 from ingest.fetchers.models import FetchedDataset
+from ingest.metrics import IngestMetrics, write_run_report
 from .fetchers import REGISTERED_FETCHERS
 from .ingesters import data_processor_factory
 
 logger = logging.getLogger(__name__)
 
-q = queue.Queue()
+DATASET_WORKERS = config.getint('INGEST', 'DATASET_WORKERS', fallback=1)
+METRICS_REPORT_DIR = config.get('METRICS', 'REPORT_DIR', fallback='ingest_reports')
 
-SENTINEL = None
 
+class DatasetIngestResult:
+    dataset_id: str
+    status: IngestStatus
+    duration_seconds: float
+    metrics: IngestMetrics
 
-def queue_worker():
-    while True:
-        item: FetchedDataset = q.get()
+    def __init__(self, dataset_id: str, status: IngestStatus, duration_seconds: float, metrics: IngestMetrics):
+        self.dataset_id = dataset_id
+        self.status = status
+        self.duration_seconds = duration_seconds
+        self.metrics = metrics
 
-        if item is SENTINEL:
-            q.task_done()
-            logger.info('Ingestion queue emptied')
-            break
+    def to_report(self) -> dict:
+        return {
+            'dataset_id': self.dataset_id,
+            'status': self.status.value,
+            'duration_seconds': round(self.duration_seconds, 3),
+            **self.metrics.to_report(),
+        }
 
-        logger.info(f'Picked up item: {item.dataset_id} from the queue and sending for ingestion')
+
+def ingest_dataset(item: FetchedDataset) -> DatasetIngestResult:
+    """
+    Ingests a dataset on a worker thread, with a session of its own.
+    A dataset failing to ingest doesn't affect the others.
+    """
+    logger.info(f'Picked up item: {item.dataset_id} and sending for ingestion')
+    start_time = time.time()
+    data_processor = None
+    try:
         data_processor = data_processor_factory(item.dataset_type)
-        data_processor.process_dataset(item.dataset_id, item.dataset_path)
-        q.task_done()
+        succeeded = data_processor.process_dataset(item.dataset_id, item.dataset_path)
+    except Exception as e:
+        logger.exception(f'Failed to ingest dataset: {item.dataset_id}, with error: {str(e)}')
+        succeeded = False
+    finally:
+        Session.remove()
 
+    metrics = data_processor.get_ingest_metrics() if data_processor is not None else None
+    return DatasetIngestResult(
+        item.dataset_id,
+        IngestStatus.SUCCEEDED if succeeded else IngestStatus.FAILED,
+        time.time() - start_time,
+        metrics or IngestMetrics()
+    )
 
-def fetch_and_ingest():
+
+def fetch_and_ingest() -> list[DatasetIngestResult]:
     """
-    We first wake up the queue and get it 'listening'
-    Then we fire off the fetchers which will add items to the queue. As soon as an item is added it will be picked up.
+    The fetched datasets are ingested by a pool of worker threads as soon as the fetchers yield them, so the
+    datasets of a product are ingested concurrently, and while the next fetcher is still fetching.
+    A report of the run's metrics is written to the metrics report directory.
     """
-    threading.Thread(target=queue_worker).start()
+    started_at = datetime.datetime.now(datetime.timezone.utc)
+    start_time = time.time()
+    fetch_seconds = 0.0
+    with ThreadPoolExecutor(max_workers=DATASET_WORKERS, thread_name_prefix='dataset_worker') as executor:
+        ingest_futures = []
+        for fetcher in REGISTERED_FETCHERS:
+            fetched_datasets = iter(fetcher.fetch_datasets())
+            while True:
+                fetch_start_time = time.time()
+                fetched_dataset = next(fetched_datasets, None)
+                fetch_seconds += time.time() - fetch_start_time
+                if fetched_dataset is None:
+                    break
+                ingest_futures.append(executor.submit(ingest_dataset, fetched_dataset))
+        ingest_results = [ingest_future.result() for ingest_future in ingest_futures]
+
+    duration_seconds = time.time() - start_time
+    log_ingest_results(ingest_results, duration_seconds)
+    write_run_report(METRICS_REPORT_DIR, {
+        'started_at': started_at.isoformat(timespec='seconds'),
+        'duration_seconds': round(duration_seconds, 3),
+        'fetch_seconds': round(fetch_seconds, 3),
+        'datasets': [ingest_result.to_report() for ingest_result in ingest_results],
+    })
+    return ingest_results
 
-    for fetcher in REGISTERED_FETCHERS:
-        fetched_datasets = fetcher.fetch_datasets()
-        for dataset in fetched_datasets:
-            q.put(dataset)
 
-    # Add an object to the end, so we know the queue is empty
-    q.put(SENTINEL)
-    q.join()
+def log_ingest_results(ingest_results: list[DatasetIngestResult], duration_seconds: float):
+    logger.info(f'Ingested {len(ingest_results)} datasets in {duration_seconds:.2f} seconds:')
+    for ingest_result in ingest_results:
+        logger.info(
+            f'{ingest_result.dataset_id}: {ingest_result.status.value} in {ingest_result.duration_seconds:.2f} seconds'
+        )
 
+    num_failed = sum(ingest_result.status == IngestStatus.FAILED for ingest_result in ingest_results)
+    if num_failed:
+        logger.warning(f'{num_failed} of {len(ingest_results)} datasets failed to ingest')
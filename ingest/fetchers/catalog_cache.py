@@ -0,0 +1,72 @@
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogCache:
+    """
+    Caches a catalog response in a local JSON file for ttl_seconds, so that repeated runs, and fetchers in other
+    processes, don't re-pull the catalog while it's fresh.
+    The catalog is refreshed under a file lock, so that only one of the fetchers that find it stale re-pulls it.
+    """
+    cache_path: str
+    ttl_seconds: int
+
+    def __init__(self, cache_path: str, ttl_seconds: int):
+        self.cache_path = cache_path
+        self.ttl_seconds = ttl_seconds
+
+    def get(self, fetch_catalog: Callable[[], object]):
+        """
+        Returns the cached catalog if it's fresh, or else fetches it with fetch_catalog and caches it.
+        If the catalog can't be fetched, a stale cached catalog is used instead.
+        """
+        catalog = self.read(fresh_only=True)
+        if catalog is not None:
+            return catalog
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+        with open(f'{self.cache_path}.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            # Another fetcher may have refreshed the catalog while this one waited for the lock
+            catalog = self.read(fresh_only=True)
+            if catalog is not None:
+                return catalog
+
+            try:
+                catalog = fetch_catalog()
+            except Exception as e:
+                catalog = self.read(fresh_only=False)
+                if catalog is None:
+                    raise
+                logger.warning(f'Failed to fetch the catalog, using the stale cached catalog instead: {e}')
+                return catalog
+
+            self.write(catalog)
+            return catalog
+
+    def read(self, fresh_only: bool):
+        try:
+            if fresh_only and time.time() - os.path.getmtime(self.cache_path) > self.ttl_seconds:
+                return None
+            with open(self.cache_path) as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+
+    def write(self, catalog):
+        fd, temp_cache_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.cache_path)), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as cache_file:
+                json.dump(catalog, cache_file)
+            os.replace(temp_cache_path, self.cache_path)
+        except Exception:
+            os.remove(temp_cache_path)
+            raise
@@ -1,6 +1,11 @@
+from typing import Iterable
+
 from .models import FetchedDataset
 
 
 class DatasetFetcherInterface:
-    def fetch_datasets(self) -> list[FetchedDataset]:
+    def fetch_datasets(self) -> Iterable[FetchedDataset]:
+        """
+        The fetched datasets may be yielded as a stream, so that they're ingested as soon as they're fetched.
+        """
         raise NotImplementedError
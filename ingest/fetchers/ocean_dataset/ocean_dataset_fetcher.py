@@ -1,27 +1,53 @@
 import logging
+from typing import Iterator
 
-import json
+from sqlalchemy.dialects.postgresql import insert
 
 from db import Session
 from db.models import Dataset
+from etc.config import config
+from ingest.fetchers.catalog_cache import CatalogCache
 from ingest.fetchers.dataset_fetcher_interface import DatasetFetcherInterface
 from ingest.fetchers.models import FetchedDataset
 from .client import cli
 
 logger = logging.getLogger(__name__)
 
+CATALOG_CACHE_PATH = config.get('OCEAN_DATASET', 'CATALOG_CACHE_PATH', fallback=None)
+CATALOG_CACHE_TTL_SECONDS = config.getint('OCEAN_DATASET', 'CATALOG_CACHE_TTL_SECONDS', fallback=300)
+
 
 class OceanDatasetFetcher(DatasetFetcherInterface):
+    catalog_cache: CatalogCache = None
+
+    def __init__(self):
+        if CATALOG_CACHE_PATH:
+            self.catalog_cache = CatalogCache(CATALOG_CACHE_PATH, CATALOG_CACHE_TTL_SECONDS)
 
-    def fetch_datasets(self) -> list[FetchedDataset]:
+    def fetch_datasets(self) -> Iterator[FetchedDataset]:
+        """
+        The headers of the visualized datasets are upserted in a single statement, after which the datasets are
+        yielded one at a time.
+        """
         try:
-            ocean_products = cli.get('/product/all_products')
-            return self.__get_datasets(ocean_products)
+            ocean_products = self.__get_ocean_products()
+            dataset_headers, fetched_datasets = self.__get_datasets(ocean_products)
+            upsert_dataset_headers(dataset_headers)
         except Exception as e:
+            Session.rollback()
             logger.exception(f'Failed to fetch datasets: {e}')
-            return []
+            return
+
+        yield from fetched_datasets
+
+    def __get_ocean_products(self) -> list[dict]:
+        if self.catalog_cache is None:
+            return cli.get('/product/all_products')
+        return self.catalog_cache.get(lambda: cli.get('/product/all_products'))
 
-    def __get_datasets(self, ocean_products) -> list[FetchedDataset]:
+    @staticmethod
+    def __get_datasets(ocean_products) -> tuple[list[dict], list[FetchedDataset]]:
+        dataset_headers = []
         fetched_datasets = []
 
         for product in ocean_products:
@@ -31,15 +57,14 @@ class OceanDatasetFetcher(DatasetFetcherInterface):
 
                 dataset_id = dataset['identifier']
 
-                if Session.get(Dataset, dataset_id) is None:
-                    Dataset(
-                        id=dataset_id,
-                        dataset_type=dataset['type'],
-                        north_bound=product['north_bound'],
-                        south_bound=product['south_bound'],
-                        east_bound=product['east_bound'],
-                        west_bound=product['west_bound'],
-                    ).save()
+                dataset_headers.append({
+                    'id': dataset_id,
+                    'dataset_type': dataset['type'],
+                    'north_bound': product['north_bound'],
+                    'south_bound': product['south_bound'],
+                    'east_bound': product['east_bound'],
+                    'west_bound': product['west_bound'],
+                })
 
                 fetched_dataset = FetchedDataset()
                 fetched_dataset.dataset_type = dataset['type']
@@ -47,4 +72,25 @@ class OceanDatasetFetcher(DatasetFetcherInterface):
                 fetched_dataset.dataset_path = dataset['folder_path']
                 fetched_datasets.append(fetched_dataset)
 
-        return fetched_datasets
+        return dataset_headers, fetched_datasets
+
+
+def upsert_dataset_headers(dataset_headers: list[dict]):
+    """
+    Inserts the headers of new datasets, and updates the type and bounds of existing ones from the catalog.
+    """
+    if not dataset_headers:
+        return
+
+    # A dataset listed under more than one product is upserted once, since a statement can't update a row twice
+    dataset_headers = list({dataset_header['id']: dataset_header for dataset_header in dataset_headers}.values())
+
+    dataset_insert = insert(Dataset).values(dataset_headers)
+    Session.execute(dataset_insert.on_conflict_do_update(
+        index_elements=['id'],
+        set_={
+            column: dataset_insert.excluded[column]
+            for column in ('dataset_type', 'north_bound', 'south_bound', 'east_bound', 'west_bound')
+        }
+    ))
+    Session.commit()
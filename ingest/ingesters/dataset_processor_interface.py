@@ -1,3 +1,12 @@
+from ingest.metrics import IngestMetrics
+
+
 class DatasetProcessorInterface:
     def process_dataset(self, dataset_id: str, data_path: str) -> bool:
         raise NotImplementedError
+
+    def get_ingest_metrics(self) -> IngestMetrics | None:
+        """
+        Gets the metrics of the last processed dataset, if the processor records any.
+        """
+        return None
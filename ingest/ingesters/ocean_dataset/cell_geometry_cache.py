@@ -0,0 +1,144 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from etc.config import config
+from .models import NetcdfFileData, get_cells_ewkb
+
+logger = logging.getLogger(__name__)
+
+GEOMETRY_MEMORY_CACHE_MB = config.getint('INGEST', 'GEOMETRY_MEMORY_CACHE_MB', fallback=512)
+
+
+class CellGeometryCache:
+    """
+    The hex EWKB polygons of every sea cell of a grid, that has a complete polygon.
+    The horizontal grid doesn't change within a file, so the polygons are encoded once per grid and reused for
+    every (time, depth) slab, rather than being rebuilt for every cell.
+    """
+    fingerprint: str
+    sea_cells: np.ndarray
+    sea_cell_ids: np.ndarray
+    geometries: np.ndarray
+
+    def __init__(self, fingerprint: str, sea_cells: np.ndarray, geometries: np.ndarray):
+        self.fingerprint = fingerprint
+        self.sea_cells = sea_cells
+        self.sea_cell_ids = get_cell_ids(sea_cells)
+        self.geometries = geometries
+
+    @property
+    def num_bytes(self) -> int:
+        return self.sea_cells.nbytes + self.sea_cell_ids.nbytes + self.geometries.nbytes
+
+    def get_cell_id_geometries(self, cell_ids: np.ndarray) -> np.ndarray:
+        """
+        Gets the geometries of the cells with the given ids, which may only be the ids of sea cells.
+        """
+        return self.geometries[self.get_sea_cell_indices(cell_ids)].astype(str)
+
+    def get_sea_cell_indices(self, cell_ids: np.ndarray) -> np.ndarray:
+        """
+        Gets the positions of the cells with the given ids among the sea cells, which the geometries are ordered by.
+        """
+        return np.searchsorted(self.sea_cell_ids, cell_ids)
+
+    def get_grid_cell_columns(self) -> list:
+        """
+        Gets the columns of the grid_cell table for the cells of the grid.
+        Cells are identified by their flat index on the grid, which is also how the values refer to them.
+        """
+        etas, xis = np.divmod(self.sea_cell_ids, self.sea_cells.shape[1])
+        return [self.fingerprint, self.sea_cell_ids, etas, xis, self.geometries.astype(str)]
+
+
+class LruCellGeometryCaches:
+    """
+    The cell geometry caches of the grids ingested by a process, which evicts the least recently used caches to stay
+    within a byte budget, since a long running process may ingest many grids.
+    """
+    max_bytes: int
+    num_bytes: int
+    cell_geometry_caches: OrderedDict[str, CellGeometryCache]
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.num_bytes = 0
+        self.cell_geometry_caches = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, fingerprint: str) -> CellGeometryCache | None:
+        with self.lock:
+            cell_geometry_cache = self.cell_geometry_caches.get(fingerprint)
+            if cell_geometry_cache is not None:
+                self.cell_geometry_caches.move_to_end(fingerprint)
+            return cell_geometry_cache
+
+    def put(self, cell_geometry_cache: CellGeometryCache):
+        if cell_geometry_cache.num_bytes > self.max_bytes:
+            return
+
+        with self.lock:
+            previous_cell_geometry_cache = self.cell_geometry_caches.pop(cell_geometry_cache.fingerprint, None)
+            if previous_cell_geometry_cache is not None:
+                self.num_bytes -= previous_cell_geometry_cache.num_bytes
+
+            self.cell_geometry_caches[cell_geometry_cache.fingerprint] = cell_geometry_cache
+            self.num_bytes += cell_geometry_cache.num_bytes
+
+            while self.num_bytes > self.max_bytes:
+                _, evicted_cell_geometry_cache = self.cell_geometry_caches.popitem(last=False)
+                self.num_bytes -= evicted_cell_geometry_cache.num_bytes
+
+
+__CELL_GEOMETRY_CACHES = LruCellGeometryCaches(GEOMETRY_MEMORY_CACHE_MB * 2 ** 20)
+
+
+def get_cell_ids(cells) -> np.ndarray:
+    """
+    Gets the ids of the given cells, a boolean array over the grid.
+    """
+    return np.flatnonzero(cells)
+
+
+def get_cell_geometry_cache(netcdf_file_data: NetcdfFileData, cache_dir: str = None) -> CellGeometryCache:
+    """
+    Gets the cell geometry cache of the grid of the file.
+    Caches are kept in memory by grid fingerprint within the memory budget, and persisted in cache_dir so that they
+    are reused across runs.
+    """
+    fingerprint = netcdf_file_data.get_grid_fingerprint()
+
+    cell_geometry_cache = __CELL_GEOMETRY_CACHES.get(fingerprint)
+    if cell_geometry_cache is not None:
+        return cell_geometry_cache
+
+    lons, lats = netcdf_file_data.get_grid_cell_corners()
+    sea_cells = netcdf_file_data.get_sea_cells() & ~np.isnan(lons).any(axis=-1) & ~np.isnan(lats).any(axis=-1)
+    num_sea_cells = int(np.count_nonzero(sea_cells))
+    cache_path = os.path.join(cache_dir, f'{fingerprint}.cell_geometry.npy') if cache_dir else None
+
+    geometries = None
+    if cache_path and os.path.exists(cache_path):
+        geometries = np.load(cache_path)
+        if len(geometries) != num_sea_cells:
+            logger.warning(f"Ignoring cell geometry cache {cache_path} which doesn't match the grid")
+            geometries = None
+
+    if geometries is None:
+        geometries = get_cells_ewkb(lons[sea_cells], lats[sea_cells])
+        logger.info(f"Encoded the geometries of {num_sea_cells} cells for grid {fingerprint}")
+
+        if cache_path:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                np.save(cache_path, geometries)
+            except OSError as e:
+                logger.warning(f"Failed to persist cell geometry cache {cache_path}: {e}")
+
+    cell_geometry_cache = CellGeometryCache(fingerprint, sea_cells, geometries)
+    __CELL_GEOMETRY_CACHES.put(cell_geometry_cache)
+    return cell_geometry_cache
@@ -0,0 +1,97 @@
+import numpy as np
+
+from .models import NetcdfFileData, get_cells_ewkb, get_current_speeds, get_current_directions
+
+
+class GridOverview:
+    """
+    A coarser version of the grid for low zoom levels, where each cell aggregates a factor x factor block of grid
+    cells. The values of a block are the means of its valid cells, and its polygon is the outline of the block.
+    The current speed and direction of a block are those of its mean current.
+    Blocks at the edges of the grid may be smaller.
+    """
+    factor: int
+    shape: tuple[int, int]
+    geometries: np.ndarray
+    has_geometry: np.ndarray
+
+    def __init__(self, netcdf_file_data: NetcdfFileData, factor: int):
+        self.factor = factor
+
+        # Same cell range as the ingested cells
+        num_eta = netcdf_file_data.num_eta - 2
+        num_xi = netcdf_file_data.num_xi - 2
+        self.shape = (-(-num_eta // factor), -(-num_xi // factor))
+
+        # The corners of a block are the outer corners of its corner cells, taken from the psi-grid
+        row_starts = np.arange(self.shape[0]) * factor
+        row_ends = np.minimum(row_starts + factor, num_eta)
+        col_starts = np.arange(self.shape[1]) * factor
+        col_ends = np.minimum(col_starts + factor, num_xi)
+        lons, lats = (
+            np.stack([
+                psi[np.ix_(row_starts, col_starts)],
+                psi[np.ix_(row_starts, col_ends)],
+                psi[np.ix_(row_ends, col_ends)],
+                psi[np.ix_(row_ends, col_starts)],
+            ], axis=-1).reshape(-1, 4)
+            for psi in (netcdf_file_data.lon_psi, netcdf_file_data.lat_psi)
+        )
+
+        self.has_geometry = (~np.isnan(lons).any(axis=-1) & ~np.isnan(lats).any(axis=-1)).reshape(self.shape)
+        self.geometries = get_cells_ewkb(lons, lats).reshape(self.shape)
+
+    def get_block_means(self, values: np.ndarray, is_valid: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Gets the means of the valid values of each block, and the number of valid values they were taken from.
+        values, is_valid: arrays over the ingested cells of the grid.
+        """
+        num_rows, num_cols = self.shape[0] * self.factor, self.shape[1] * self.factor
+        padded_values = np.zeros((num_rows, num_cols), dtype=np.float64)
+        padded_is_valid = np.zeros((num_rows, num_cols), dtype=bool)
+        padded_values[:values.shape[0], :values.shape[1]] = np.where(is_valid, values, 0.0)
+        padded_is_valid[:values.shape[0], :values.shape[1]] = is_valid
+
+        block_shape = (self.shape[0], self.factor, self.shape[1], self.factor)
+        block_sums = padded_values.reshape(block_shape).sum(axis=(1, 3))
+        block_counts = padded_is_valid.reshape(block_shape).sum(axis=(1, 3))
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return block_sums / block_counts, block_counts
+
+    def get_columns(self, dataset_id: str, current_time: str, current_depth: float, is_valid: np.ndarray,
+                    temps, salts, us, vs, zetas=None, vorticities=None) -> list:
+        """
+        Gets the columns of the ocean_dataset_data INGEST_COLUMNS for the blocks with any valid cells.
+        Blocks are identified by their flat index on the overview grid.
+        """
+        temp_means, block_counts = self.get_block_means(temps, is_valid)
+        is_valid_block = (block_counts > 0) & self.has_geometry
+
+        salt_means, u_means, v_means = [
+            self.get_block_means(values, is_valid)[0][is_valid_block] for values in (salts, us, vs)
+        ]
+
+        zeta_means = None
+        if zetas is not None:
+            zeta_means = self.get_block_means(zetas, is_valid & ~np.isnan(zetas))[0][is_valid_block]
+
+        vorticity_means = np.full(len(u_means), np.nan)
+        if vorticities is not None:
+            vorticity_means = self.get_block_means(vorticities, is_valid & ~np.isnan(vorticities))[0][is_valid_block]
+
+        return [
+            dataset_id,
+            np.flatnonzero(is_valid_block),
+            current_time,
+            current_depth,
+            self.geometries[is_valid_block].astype(str),
+            temp_means[is_valid_block],
+            salt_means,
+            u_means,
+            v_means,
+            zeta_means,
+            get_current_speeds(u_means, v_means),
+            get_current_directions(u_means, v_means),
+            vorticity_means,
+        ]
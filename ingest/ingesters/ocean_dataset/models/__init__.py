@@ -1,3 +1,5 @@
+import hashlib
+
 import numpy as np
 from psycopg2.extensions import AsIs
 
@@ -56,6 +58,94 @@ class GridCell:
         return AsIs(f"ST_SetSRID(ST_GeomFromText('POLYGON(({wkt_points}))'), 4326)")
 
 
+WGS84_SRID = 4326
+LAND_MASK = 0
+EARTH_RADIUS_METERS = 6371000.0
+
+# Little endian EWKB of a polygon with an SRID and a single ring of 5 points
+__EWKB_POLYGON_DTYPE = np.dtype([
+    ('byte_order', 'u1'),
+    ('geometry_type', '<u4'),
+    ('srid', '<u4'),
+    ('num_rings', '<u4'),
+    ('num_points', '<u4'),
+    ('points', '<f8', (5, 2)),
+])
+__EWKB_POLYGON_TYPE = 3 | 0x20000000
+
+# Little endian ISO WKB of a polygon with a single ring of 5 points
+__WKB_POLYGON_DTYPE = np.dtype([
+    ('byte_order', 'u1'),
+    ('geometry_type', '<u4'),
+    ('num_rings', '<u4'),
+    ('num_points', '<u4'),
+    ('points', '<f8', (5, 2)),
+])
+__WKB_POLYGON_TYPE = 3
+__HEX_DIGITS = np.frombuffer(b'0123456789ABCDEF', dtype=np.uint8)
+
+
+def get_cells_ewkb(lons, lats, srid: int = WGS84_SRID):
+    """
+    Encodes the polygons of many cells as hex EWKB in one go, which PostGIS accepts as geometry input.
+    lons, lats: (n, 4) arrays of the cell corners, ordered as in NetcdfFileData.get_grid_cell_corners.
+    Returns a bytes array of n hex strings.
+    """
+    polygons = np.zeros(len(lons), dtype=__EWKB_POLYGON_DTYPE)
+    polygons['byte_order'] = 1
+    polygons['geometry_type'] = __EWKB_POLYGON_TYPE
+    polygons['srid'] = srid
+    polygons['num_rings'] = 1
+    polygons['num_points'] = 5
+    polygons['points'][:, :4, 0] = lons
+    polygons['points'][:, :4, 1] = lats
+    polygons['points'][:, 4] = polygons['points'][:, 0]  # Close the polygon
+
+    ewkb = polygons.view(np.uint8).reshape(len(polygons), __EWKB_POLYGON_DTYPE.itemsize)
+    hex_ewkb = np.stack([__HEX_DIGITS[ewkb >> 4], __HEX_DIGITS[ewkb & 0x0F]], axis=-1)
+    return hex_ewkb.reshape(len(polygons), -1).view(f'S{2 * __EWKB_POLYGON_DTYPE.itemsize}').ravel()
+
+
+def get_cells_wkb(lons, lats) -> np.ndarray:
+    """
+    Encodes the polygons of many cells as ISO WKB, without an SRID, like GeoParquet stores geometries.
+    lons, lats: (n, 4) arrays of the cell corners, ordered as in NetcdfFileData.get_grid_cell_corners.
+    Returns an (n, WKB size) array of the bytes of each polygon.
+    """
+    polygons = np.zeros(len(lons), dtype=__WKB_POLYGON_DTYPE)
+    polygons['byte_order'] = 1
+    polygons['geometry_type'] = __WKB_POLYGON_TYPE
+    polygons['num_rings'] = 1
+    polygons['num_points'] = 5
+    polygons['points'][:, :4, 0] = lons
+    polygons['points'][:, :4, 1] = lats
+    polygons['points'][:, 4] = polygons['points'][:, 0]  # Close the polygon
+
+    return polygons.view(np.uint8).reshape(len(polygons), __WKB_POLYGON_DTYPE.itemsize)
+
+
+class NetcdfSlab:
+    """
+    The 2D values of a single (time, depth) slab of a NetCDF file.
+    """
+    temps: np.ndarray
+    salts: np.ndarray
+    us: np.ndarray
+    vs: np.ndarray
+    zetas: np.ndarray
+
+    def __init__(self, temps, salts, us, vs, zetas):
+        self.temps = temps
+        self.salts = salts
+        self.us = us
+        self.vs = vs
+        self.zetas = zetas
+
+    @property
+    def nbytes(self) -> int:
+        return sum(values.nbytes for values in (self.temps, self.salts, self.us, self.vs, self.zetas))
+
+
 class NetcdfFileData:
     times: []
     depths: []
@@ -73,6 +163,10 @@ class NetcdfFileData:
     num_depths: int
     num_eta: int
     num_xi: int
+    grid_cell_corners: tuple = None
+    grid_metrics: tuple = None
+    grid_fingerprint: str = None
+    slab_reader = None
 
     def set_dimensions(self, times, depths, eta_rhos, xi_rhos):
         self.times = times
@@ -88,6 +182,35 @@ class NetcdfFileData:
         self.lat_psi = rho_to_psi(self.lats_rho)
         self.lon_psi = rho_to_psi(self.lons_rho)
 
+    def set_slab_reader(self, slab_reader):
+        """
+        Reads the slabs on demand with the slab reader, rather than from values loaded in memory.
+        """
+        self.slab_reader = slab_reader
+
+    def set_slab_order(self, slab_order: list[tuple[int, int]]):
+        """
+        The (time_index, depth_index) slabs in the order they will be read, for the slab reader to prefetch.
+        """
+        if self.slab_reader is not None:
+            self.slab_reader.set_slab_order(slab_order)
+
+    def get_slab(self, time_index, depth_index) -> NetcdfSlab:
+        if self.slab_reader is not None:
+            return self.slab_reader.get_slab(time_index, depth_index)
+
+        return NetcdfSlab(
+            self.temps[time_index, depth_index, :, :],
+            self.salts[time_index, depth_index, :, :],
+            self.us[time_index, depth_index, :, :],
+            self.vs[time_index, depth_index, :, :],
+            self.zetas[time_index, :, :],
+        )
+
+    def close(self):
+        if self.slab_reader is not None:
+            self.slab_reader.close()
+
     def get_grid_cell(self, eta_index, xi_index):
         grid_cell = GridCell()
 
@@ -105,6 +228,92 @@ class NetcdfFileData:
 
         return grid_cell
 
+    def get_grid_cell_corners(self):
+        """
+        Vectorized counterpart of get_grid_cell for every cell ingested from the grid.
+        Returns (lons, lats), each of shape (num_eta - 2, num_xi - 2, 4), with the corners in the same order as
+        GridCell's point_1..point_4. The horizontal grid is static, so the result is only computed once.
+        """
+        if self.grid_cell_corners is None:
+            num_eta = self.num_eta - 2
+            num_xi = self.num_xi - 2
+            self.grid_cell_corners = tuple(
+                np.stack([
+                    psi[:num_eta, :num_xi],
+                    psi[:num_eta, 1:num_xi + 1],
+                    psi[1:num_eta + 1, 1:num_xi + 1],
+                    psi[1:num_eta + 1, :num_xi],
+                ], axis=-1)
+                for psi in (self.lon_psi, self.lat_psi)
+            )
+        return self.grid_cell_corners
+
+    def get_sea_cells(self):
+        """
+        Returns a boolean array of shape (num_eta - 2, num_xi - 2) of the cells that are not masked as land.
+        """
+        return self.mask[:self.num_eta - 2, :self.num_xi - 2] != LAND_MASK
+
+    def get_grid_metrics(self):
+        """
+        Returns the derivatives of the eastward and northward distances in meters along xi and eta on the rho-grid,
+        (x_xi, x_eta, y_xi, y_eta), and their determinant, which relate the derivatives of values along the axes of
+        the curvilinear grid to their derivatives along east and north. The horizontal grid is static, so the
+        result is only computed once.
+        """
+        if self.grid_metrics is None:
+            lons, lats = np.radians(self.lons_rho), np.radians(self.lats_rho)
+            lon_eta, lon_xi = np.gradient(lons)
+            lat_eta, lat_xi = np.gradient(lats)
+            x_xi, x_eta = (EARTH_RADIUS_METERS * np.cos(lats) * lon_xi, EARTH_RADIUS_METERS * np.cos(lats) * lon_eta)
+            y_xi, y_eta = EARTH_RADIUS_METERS * lat_xi, EARTH_RADIUS_METERS * lat_eta
+            self.grid_metrics = (x_xi, x_eta, y_xi, y_eta, x_xi * y_eta - x_eta * y_xi)
+        return self.grid_metrics
+
+    def get_vorticities(self, us, vs) -> np.ndarray:
+        """
+        Gets the relative vorticity dv/dx - du/dy, in 1/s, of eastward and northward velocities over the rho-grid,
+        from central differences between neighbouring points. Points next to land, or any other point without
+        values, have no vorticity (NaN).
+        """
+        x_xi, x_eta, y_xi, y_eta, determinant = self.get_grid_metrics()
+        us, vs = np.asarray(us, dtype=np.float64), np.asarray(vs, dtype=np.float64)
+        u_eta, u_xi = np.gradient(us)
+        v_eta, v_xi = np.gradient(vs)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            dv_dx = (v_xi * y_eta - v_eta * y_xi) / determinant
+            du_dy = (x_xi * u_eta - x_eta * u_xi) / determinant
+        # Central differences skip over the point itself, which would otherwise get a vorticity without values
+        return np.where(np.isnan(us) | np.isnan(vs), np.nan, dv_dx - du_dy)
+
+    def get_grid_fingerprint(self) -> str:
+        """
+        A fingerprint of the horizontal grid and land mask, which identifies the cells of the grid.
+        """
+        if self.grid_fingerprint is None:
+            grid_hash = hashlib.sha1()
+            for grid_values in (self.lons_rho, self.lats_rho, self.mask):
+                grid_values = np.ascontiguousarray(grid_values, dtype=np.float64)
+                grid_hash.update(str(grid_values.shape).encode())
+                grid_hash.update(grid_values.tobytes())
+            self.grid_fingerprint = grid_hash.hexdigest()[:16]
+        return self.grid_fingerprint
+
+
+def get_current_speeds(us, vs) -> np.ndarray:
+    """
+    Gets the speeds of currents, in m/s, from their eastward and northward velocities.
+    """
+    return np.hypot(us, vs)
+
+
+def get_current_directions(us, vs) -> np.ndarray:
+    """
+    Gets the directions currents flow towards, in degrees clockwise from north, from their eastward and northward
+    velocities.
+    """
+    return np.mod(np.degrees(np.arctan2(us, vs)), 360.0)
+
 
 def rho_to_psi(var_rho):
     """
@@ -119,21 +328,130 @@ def rho_to_psi(var_rho):
     return var_psi
 
 
+# The fixed bins of the histograms of each variable, as (range min, range max, bin width).
+# Values outside the range are counted in the first or last bin.
+HISTOGRAM_BINS = {
+    'temperature': (-5.0, 40.0, 0.05),
+    'salinity': (0.0, 45.0, 0.01),
+    'zeta': (-5.0, 5.0, 0.01),
+    'current_speed': (0.0, 5.0, 0.01),
+    'current_direction': (0.0, 360.0, 1.0),
+    'vorticity': (-0.001, 0.001, 0.000001),
+}
+PERCENTILES = [1, 2, 5, 25, 50, 75, 95, 98, 99]
+
+
 class VariableThreshold:
     """
     Model for keeping track of the thresholds of a specific variable.
+    Besides the min and max, the values are counted in a fixed-bin histogram, which is a mergeable sketch of their
+    distribution that the percentiles are estimated from to within a bin width.
     """
     variable_name: str
     min_value: float
     max_value: float
+    histogram_counts: np.ndarray = None
 
     def __init__(self, variable_name: str, min_value: float = 1000, max_value: float = -1000):
         self.variable_name = variable_name
         self.min_value = min_value
         self.max_value = max_value
+        if variable_name in HISTOGRAM_BINS:
+            range_min, range_max, bin_width = HISTOGRAM_BINS[variable_name]
+            self.histogram_counts = np.zeros(int(round((range_max - range_min) / bin_width)), dtype=np.int64)
 
     def check_set_thresholds(self, check_value: float):
         if check_value < self.min_value:
             self.min_value = check_value
-        elif check_value > self.max_value:
+        if check_value > self.max_value:
             self.max_value = check_value
+        if self.histogram_counts is not None:
+            self.histogram_counts[self.get_bin_indices(np.array([check_value]))[0]] += 1
+
+    def check_set_threshold_values(self, check_values: np.ndarray):
+        """
+        Vectorized counterpart of check_set_thresholds for a whole array of values.
+        """
+        if check_values.size == 0:
+            return
+        self.min_value = min(self.min_value, float(check_values.min()))
+        self.max_value = max(self.max_value, float(check_values.max()))
+        if self.histogram_counts is not None:
+            self.histogram_counts += np.bincount(
+                self.get_bin_indices(check_values), minlength=len(self.histogram_counts)
+            )
+
+    def merge(self, other: 'VariableThreshold'):
+        self.min_value = min(self.min_value, other.min_value)
+        self.max_value = max(self.max_value, other.max_value)
+        if self.histogram_counts is not None and other.histogram_counts is not None:
+            self.histogram_counts += other.histogram_counts
+
+    def get_bin_indices(self, values: np.ndarray) -> np.ndarray:
+        range_min, _, bin_width = HISTOGRAM_BINS[self.variable_name]
+        bin_indices = np.floor((np.asarray(values, dtype=np.float64) - range_min) / bin_width).astype(np.int64)
+        return np.clip(bin_indices, 0, len(self.histogram_counts) - 1)
+
+    def get_percentiles(self) -> dict[int, float] | None:
+        """
+        Estimates the percentiles of the values from the histogram, interpolating linearly within a bin.
+        """
+        if self.histogram_counts is None or not self.histogram_counts.any():
+            return None
+
+        range_min, _, bin_width = HISTOGRAM_BINS[self.variable_name]
+        cumulative_counts = np.cumsum(self.histogram_counts)
+        ranks = np.array(PERCENTILES) / 100 * cumulative_counts[-1]
+
+        bin_indices = np.searchsorted(cumulative_counts, ranks)
+        counts_before = np.where(bin_indices > 0, cumulative_counts[bin_indices - 1], 0)
+        bin_fractions = (ranks - counts_before) / self.histogram_counts[bin_indices]
+        percentile_values = np.clip(
+            range_min + (bin_indices + bin_fractions) * bin_width, self.min_value, self.max_value
+        )
+        return dict(zip(PERCENTILES, percentile_values.tolist()))
+
+    def get_histogram(self) -> dict | None:
+        """
+        Gets the histogram trimmed to the bins that have any values, with the offset of its first bin.
+        """
+        if self.histogram_counts is None or not self.histogram_counts.any():
+            return None
+
+        range_min, _, bin_width = HISTOGRAM_BINS[self.variable_name]
+        occupied_bins = np.flatnonzero(self.histogram_counts)
+        offset = int(occupied_bins[0])
+        return {
+            'range_min': range_min,
+            'bin_width': bin_width,
+            'offset': offset,
+            'counts': self.histogram_counts[offset:occupied_bins[-1] + 1].tolist(),
+        }
+
+    def set_histogram(self, histogram: dict | None):
+        """
+        Restores the counts of a histogram from get_histogram, if it has the same bins.
+        """
+        if self.histogram_counts is None or histogram is None:
+            return
+        range_min, _, bin_width = HISTOGRAM_BINS[self.variable_name]
+        if histogram['range_min'] != range_min or histogram['bin_width'] != bin_width:
+            return
+        offset = histogram['offset']
+        self.histogram_counts[offset:offset + len(histogram['counts'])] = histogram['counts']
+
+
+class IngestStatistics:
+    """
+    Statistics of the cells ingested from a set of slabs, which are merged across separately ingested slabs.
+    """
+    total_skipped_land_points: int
+    total_skipped_nan_points: int
+    total_failed_cells_count: int
+    temperature_thresholds: dict[float, VariableThreshold]
+    salinity_thresholds: dict[float, VariableThreshold]
+    zeta_thresholds: dict[float, VariableThreshold]
+    current_speed_thresholds: dict[float, VariableThreshold]
+    current_direction_thresholds: dict[float, VariableThreshold]
+    vorticity_thresholds: dict[float, VariableThreshold]
+    metrics = None
@@ -0,0 +1,89 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, Future
+
+import xarray as xr
+
+from .models import NetcdfSlab
+
+logger = logging.getLogger(__name__)
+
+NETCDF_SLAB_VARIABLES = ['temp', 'salt', 'u', 'v']
+
+
+class NetcdfSlabReader:
+    """
+    Reads (time, depth) slabs from a NetCDF file on demand, so that only a few slabs are ever held in memory.
+    While a slab is being ingested, the slabs that follow it in the slab order are prefetched for as far as the memory
+    budget allows. Without a slab order nothing is prefetched.
+    All reads are done on a single reader thread, since the NetCDF library isn't safe to read from concurrently.
+    """
+    ds: xr.Dataset
+    num_prefetch_slabs: int
+    slab_order: list[tuple[int, int]]
+    slab_positions: dict[tuple[int, int], int]
+    prefetched_slabs: dict[tuple[int, int], Future]
+
+    def __init__(self, ds: xr.Dataset, memory_budget_bytes: int):
+        self.ds = ds
+
+        # The slab being ingested takes up part of the budget, what's left is for prefetching
+        slab_bytes = (
+                sum(ds[variable][0, 0].nbytes for variable in NETCDF_SLAB_VARIABLES) + ds['zeta'][0].nbytes
+        )
+        self.num_prefetch_slabs = max(0, int(memory_budget_bytes // slab_bytes) - 1)
+        logger.info(
+            f"Reading slabs of {slab_bytes / 2 ** 20:.1f} MiB on demand, prefetching up to {self.num_prefetch_slabs}"
+        )
+
+        self.slab_order = []
+        self.slab_positions = dict()
+        self.prefetched_slabs = dict()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='netcdf_slab_reader')
+
+    def set_slab_order(self, slab_order: list[tuple[int, int]]):
+        """
+        The (time_index, depth_index) slabs in the order they will be ingested, which are the only ones prefetched.
+        """
+        self.slab_order = list(slab_order)
+        self.slab_positions = {slab_indices: position for position, slab_indices in enumerate(self.slab_order)}
+
+    def get_slab(self, time_index: int, depth_index: int) -> NetcdfSlab:
+        slab_future = self.prefetched_slabs.pop((time_index, depth_index), None)
+        if slab_future is None:
+            slab_future = self.executor.submit(self.__read_slab, time_index, depth_index)
+
+        self.__prefetch_following_slabs(time_index, depth_index)
+
+        return slab_future.result()
+
+    def close(self):
+        for slab_future in self.prefetched_slabs.values():
+            slab_future.cancel()
+        self.prefetched_slabs.clear()
+        self.executor.shutdown(wait=True)
+        self.ds.close()
+
+    def __prefetch_following_slabs(self, time_index: int, depth_index: int):
+        """
+        Prefetches the slabs that follow the given one in the slab order, or none if it isn't in the slab order.
+        Prefetched slabs that were skipped over are discarded, to stay within the budget.
+        """
+        slab_position = self.slab_positions.get((time_index, depth_index))
+        following_slabs = (
+            self.slab_order[slab_position + 1:slab_position + 1 + self.num_prefetch_slabs]
+            if slab_position is not None else []
+        )
+
+        for slab_indices in list(self.prefetched_slabs):
+            if slab_indices not in following_slabs:
+                self.prefetched_slabs.pop(slab_indices).cancel()
+
+        for slab_indices in following_slabs:
+            if slab_indices not in self.prefetched_slabs:
+                self.prefetched_slabs[slab_indices] = self.executor.submit(self.__read_slab, *slab_indices)
+
+    def __read_slab(self, time_index: int, depth_index: int) -> NetcdfSlab:
+        temps, salts, us, vs = (
+            self.ds[variable][time_index, depth_index].values for variable in NETCDF_SLAB_VARIABLES
+        )
+        return NetcdfSlab(temps, salts, us, vs, self.ds['zeta'][time_index].values)
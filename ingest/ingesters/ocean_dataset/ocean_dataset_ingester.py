@@ -1,20 +1,28 @@
+import datetime
 import logging
-import time
 
 import numpy as np
 
 from db.utils import BulkInserter
-from .models import NetcdfFileData, VariableThreshold
+from etc.const import IngestMode, StorageLayout
+from ingest.metrics import IngestMetrics
+from .cell_geometry_cache import CellGeometryCache, get_cell_geometry_cache, get_cell_ids
+from .grid_overview import GridOverview
+from .models import NetcdfFileData, VariableThreshold, IngestStatistics, LAND_MASK, get_current_speeds, \
+    get_current_directions
+from .sinks import OceanDataSinkInterface, OceanDataBatch, PostgresSink, VALUE_COLUMNS
 from .utils import insert_variables_and_thresholds, set_dataset_dates
 
 logger = logging.getLogger(__name__)
 
-LAND_MASK = 0
 TIME_STEP_MINUTES = 60
 
 TEMPERATURE_VARIABLE_NAME = 'temperature'
 SALINITY_VARIABLE_NAME = 'salinity'
 ZETA_VARIABLE_NAME = 'zeta'
+CURRENT_SPEED_VARIABLE_NAME = 'current_speed'
+CURRENT_DIRECTION_VARIABLE_NAME = 'current_direction'
+VORTICITY_VARIABLE_NAME = 'vorticity'
 SURFACE_DEPTH = 0.0
 
 
@@ -25,47 +33,135 @@ class OceanDatasetIngester:
     total_skipped_nan_points = 0
     total_inserted_cells_count = 0
     total_failed_cells_count = 0
-    records_to_insert = []
     netcdf_file_data: NetcdfFileData
-    bulk_inserter: BulkInserter
-    temperature_thresholds: dict[float, VariableThreshold] = dict()
-    salinity_thresholds: dict[float, VariableThreshold] = dict()
-    zeta_thresholds: dict[float, VariableThreshold] = dict()
-
-    def __init__(self, dataset_id: str, netcdf_file_data: NetcdfFileData):
+    ingest_mode: IngestMode
+    storage_layout: StorageLayout
+    max_time_steps: int
+    time_indices: list[int] = None
+    bulk_inserter: BulkInserter = None
+    sinks: list[OceanDataSinkInterface]
+    are_sinks_open: bool = False
+    metrics: IngestMetrics
+    cell_geometry_cache: CellGeometryCache = None
+    slab_ingester_pool = None
+    overview_bulk_inserters: dict[int, BulkInserter] = None
+    grid_overviews: dict[int, GridOverview] = None
+    temperature_thresholds: dict[float, VariableThreshold]
+    salinity_thresholds: dict[float, VariableThreshold]
+    zeta_thresholds: dict[float, VariableThreshold]
+    current_speed_thresholds: dict[float, VariableThreshold]
+    current_direction_thresholds: dict[float, VariableThreshold]
+    vorticity_thresholds: dict[float, VariableThreshold]
+
+    def __init__(self, dataset_id: str, netcdf_file_data: NetcdfFileData,
+                 ingest_mode: IngestMode = IngestMode.VECTORIZED,
+                 storage_layout: StorageLayout = StorageLayout.WIDE,
+                 max_time_steps: int = 5):
         self.dataset_id = dataset_id
         self.temp_dataset_id = f'temp_{self.dataset_id}'
         self.netcdf_file_data = netcdf_file_data
+        self.ingest_mode = ingest_mode
+        self.storage_layout = storage_layout
+        self.max_time_steps = max_time_steps
+        self.metrics = IngestMetrics()
+        self.sinks = []
+        self.reset_statistics()
 
     def set_bulk_inserter(self, bulk_inserter: BulkInserter):
+        """
+        The per cell ingest mode inserts records with the bulk inserter directly, the vectorized ingest mode writes
+        batches to it through a Postgres sink.
+        """
         self.bulk_inserter = bulk_inserter
+        self.add_sink(PostgresSink(bulk_inserter, self.storage_layout))
+
+    def add_sink(self, sink: OceanDataSinkInterface):
+        """
+        Adds a sink that the batches of each slab are written to, in the vectorized ingest mode.
+        """
+        sink.set_metrics(self.metrics)
+        if self.are_sinks_open:
+            sink.open(self.dataset_id, self.netcdf_file_data, self.cell_geometry_cache)
+        self.sinks.append(sink)
+
+    def open_sinks(self):
+        if self.cell_geometry_cache is None:
+            self.cell_geometry_cache = get_cell_geometry_cache(self.netcdf_file_data)
+
+        for sink in self.sinks:
+            sink.open(self.dataset_id, self.netcdf_file_data, self.cell_geometry_cache)
+        self.are_sinks_open = True
+
+    def set_metrics(self, metrics: IngestMetrics):
+        """
+        Records the metrics of the ingest, including those of the sinks and bulk inserters, in the given metrics.
+        """
+        self.metrics = metrics
+        for sink in self.sinks:
+            sink.set_metrics(metrics)
+        for overview_bulk_inserter in (self.overview_bulk_inserters or {}).values():
+            overview_bulk_inserter.set_metrics(metrics)
+
+    def set_cell_geometry_cache(self, cell_geometry_cache: CellGeometryCache):
+        self.cell_geometry_cache = cell_geometry_cache
+
+    def set_overview_bulk_inserters(self, overview_bulk_inserters: dict[int, BulkInserter]):
+        """
+        Also ingests the slabs into the overview tables of the given aggregation factors, in the vectorized ingest mode.
+        """
+        self.overview_bulk_inserters = overview_bulk_inserters
+        for overview_bulk_inserter in overview_bulk_inserters.values():
+            overview_bulk_inserter.set_metrics(self.metrics)
+        self.grid_overviews = {
+            factor: GridOverview(self.netcdf_file_data, factor) for factor in overview_bulk_inserters
+        }
+
+    def set_slab_ingester_pool(self, slab_ingester_pool):
+        """
+        Ingests the slabs with the worker processes of the pool, rather than with this ingester's bulk inserter.
+        """
+        self.slab_ingester_pool = slab_ingester_pool
+
+    def set_time_indices(self, time_indices: list[int]):
+        """
+        Only ingests the given time steps, rather than the first max_time_steps.
+        """
+        self.time_indices = time_indices
+
+    def get_time_indices(self) -> list[int] | range:
+        """
+        Only the first max_time_steps time steps are ingested, or all of them if it's 0.
+        """
+        if self.time_indices is not None:
+            return self.time_indices
+        if self.max_time_steps:
+            return range(min(self.max_time_steps, self.netcdf_file_data.num_times))
+        return range(self.netcdf_file_data.num_times)
+
+    def get_ingest_times(self) -> list[datetime.datetime]:
+        """
+        The times of the time steps that are ingested.
+        """
+        ingest_times = self.netcdf_file_data.times[list(self.get_time_indices())]
+        return ingest_times.astype('datetime64[us]').astype(datetime.datetime).tolist()
+
+    def get_ingest_dates(self) -> list[datetime.date]:
+        """
+        The days of the time steps that are ingested.
+        """
+        return sorted({ingest_time.date() for ingest_time in self.get_ingest_times()})
 
     def ingest_data(self):
-        start_time = time.time()
-        start_date = end_date = np.datetime_as_string(self.netcdf_file_data.times[0])
-
-        self.zeta_thresholds[SURFACE_DEPTH] = VariableThreshold(ZETA_VARIABLE_NAME)
-
-        for time_index in range(5):
-            # for time_index in range(self.netcdf_file_data.num_times):
-            current_time = np.datetime_as_string(self.netcdf_file_data.times[time_index], unit='s')
-            end_date = np.datetime_as_string(self.netcdf_file_data.times[time_index])
-
-            logger.info(f"Processing time step {time_index + 1}/{self.netcdf_file_data.num_times} ({current_time})")
-
-            for depth_index in range(self.netcdf_file_data.num_depths):
-                current_depth = float(self.netcdf_file_data.depths[depth_index])
-
-                self.temperature_thresholds[current_depth] = VariableThreshold(TEMPERATURE_VARIABLE_NAME)
-                self.salinity_thresholds[current_depth] = VariableThreshold(SALINITY_VARIABLE_NAME)
-
-                self.__iterate_over_points_and_insert_cells(current_time, current_depth, time_index, depth_index)
+        time_indices = self.get_time_indices()
+        start_date = np.datetime_as_string(self.netcdf_file_data.times[time_indices[0]])
+        end_date = np.datetime_as_string(self.netcdf_file_data.times[time_indices[-1]])
 
-        # Insert any remaining records
-        self.bulk_inserter.flush()
+        self.ingest_slabs()
 
-        insert_variables_and_thresholds(self.dataset_id, self.temperature_thresholds, self.salinity_thresholds,
-                                        self.zeta_thresholds)
+        with self.metrics.time_stage('thresholds'):
+            insert_variables_and_thresholds(self.dataset_id, self.temperature_thresholds, self.salinity_thresholds,
+                                            self.zeta_thresholds, self.current_speed_thresholds,
+                                            self.current_direction_thresholds, self.vorticity_thresholds)
 
         set_dataset_dates(
             self.dataset_id,
@@ -74,17 +170,196 @@ class OceanDatasetIngester:
             TIME_STEP_MINUTES
         )
 
-        end_time = time.time()
-        elapsed_time = end_time - start_time
-        with open("ingest_data_runtime.txt", "w") as f:
-            f.write(f"The ingest_data function took {elapsed_time:.2f} seconds to run.")
+    def ingest_slabs(self):
+        """
+        Ingests the slabs of all the ingested times and depths through the bulk inserters, without the dataset's
+        variables, thresholds and dates.
+        """
+        time_indices = self.get_time_indices()
+        slabs = [
+            (time_index, depth_index)
+            for time_index in time_indices
+            for depth_index in range(self.netcdf_file_data.num_depths)
+        ]
+
+        if self.slab_ingester_pool is None:
+            self.netcdf_file_data.set_slab_order(slabs)
+            for time_index, depth_index in slabs:
+                self.ingest_slab(time_index, depth_index)
+
+            # Insert any remaining records
+            self.flush()
+        else:
+            for slab_statistics in self.slab_ingester_pool.ingest_slabs(slabs):
+                self.merge_statistics(slab_statistics)
+
+        self.metrics.set_skipped_cells(
+            self.total_skipped_land_points, self.total_skipped_nan_points, self.total_failed_cells_count
+        )
+
+    def ingest_slab(self, time_index: int, depth_index: int):
+        """
+        Ingests the cells of a single (time, depth) slab, accumulating the thresholds of each depth over all times.
+        """
+        current_time = np.datetime_as_string(self.netcdf_file_data.times[time_index], unit='s')
+        current_depth = float(self.netcdf_file_data.depths[depth_index])
+
+        if depth_index == 0:
+            logger.info(f"Processing time step {time_index + 1}/{self.netcdf_file_data.num_times} ({current_time})")
+
+        if current_depth not in self.temperature_thresholds:
+            self.temperature_thresholds[current_depth] = VariableThreshold(TEMPERATURE_VARIABLE_NAME)
+            self.salinity_thresholds[current_depth] = VariableThreshold(SALINITY_VARIABLE_NAME)
+            self.current_speed_thresholds[current_depth] = VariableThreshold(CURRENT_SPEED_VARIABLE_NAME)
+            self.current_direction_thresholds[current_depth] = VariableThreshold(CURRENT_DIRECTION_VARIABLE_NAME)
+            self.vorticity_thresholds[current_depth] = VariableThreshold(VORTICITY_VARIABLE_NAME)
+
+        if self.ingest_mode == IngestMode.PER_CELL:
+            self.__iterate_over_points_and_insert_cells(current_time, current_depth, time_index, depth_index)
+        else:
+            self.__insert_slab_cells(current_time, current_depth, time_index, depth_index)
+
+    def flush(self):
+        for sink in self.sinks:
+            sink.flush()
+        for overview_bulk_inserter in (self.overview_bulk_inserters or {}).values():
+            overview_bulk_inserter.flush()
+
+    def reset_statistics(self):
+        self.total_skipped_land_points = 0
+        self.total_skipped_nan_points = 0
+        self.total_failed_cells_count = 0
+        self.temperature_thresholds = dict()
+        self.salinity_thresholds = dict()
+        self.zeta_thresholds = {SURFACE_DEPTH: VariableThreshold(ZETA_VARIABLE_NAME)}
+        self.current_speed_thresholds = dict()
+        self.current_direction_thresholds = dict()
+        self.vorticity_thresholds = dict()
+
+    def get_statistics(self) -> IngestStatistics:
+        ingest_statistics = IngestStatistics()
+        ingest_statistics.total_skipped_land_points = self.total_skipped_land_points
+        ingest_statistics.total_skipped_nan_points = self.total_skipped_nan_points
+        ingest_statistics.total_failed_cells_count = self.total_failed_cells_count
+        ingest_statistics.temperature_thresholds = self.temperature_thresholds
+        ingest_statistics.salinity_thresholds = self.salinity_thresholds
+        ingest_statistics.zeta_thresholds = self.zeta_thresholds
+        ingest_statistics.current_speed_thresholds = self.current_speed_thresholds
+        ingest_statistics.current_direction_thresholds = self.current_direction_thresholds
+        ingest_statistics.vorticity_thresholds = self.vorticity_thresholds
+        ingest_statistics.metrics = self.metrics
+        return ingest_statistics
+
+    def merge_statistics(self, ingest_statistics: IngestStatistics):
+        """
+        Merges the statistics of separately ingested slabs into the statistics of this ingester.
+        """
+        self.total_skipped_land_points += ingest_statistics.total_skipped_land_points
+        self.total_skipped_nan_points += ingest_statistics.total_skipped_nan_points
+        self.total_failed_cells_count += ingest_statistics.total_failed_cells_count
+        if ingest_statistics.metrics is not None and ingest_statistics.metrics is not self.metrics:
+            self.metrics.merge(ingest_statistics.metrics)
+
+        for thresholds, other_thresholds in (
+                (self.temperature_thresholds, ingest_statistics.temperature_thresholds),
+                (self.salinity_thresholds, ingest_statistics.salinity_thresholds),
+                (self.zeta_thresholds, ingest_statistics.zeta_thresholds),
+                (self.current_speed_thresholds, ingest_statistics.current_speed_thresholds),
+                (self.current_direction_thresholds, ingest_statistics.current_direction_thresholds),
+                (self.vorticity_thresholds, ingest_statistics.vorticity_thresholds),
+        ):
+            for depth, other_threshold in other_thresholds.items():
+                if depth in thresholds:
+                    thresholds[depth].merge(other_threshold)
+                else:
+                    thresholds[depth] = other_threshold
+
+    def __insert_slab_cells(self, current_time, current_depth, time_index, depth_index):
+        """
+        Vectorized counterpart of __iterate_over_points_and_insert_cells.
+        The land mask, NaN filtering, thresholds and record columns are computed for the whole
+        (time, depth) slab at once, and produce the same records as the per cell reference implementation,
+        with the cell polygons taken from the grid's EWKB cache.
+        The derived current speed, direction and vorticity are computed for the whole slab too.
+        """
+        # Same cell range as the per cell iteration, stopping 2 short of the rho-grid dimensions
+        num_eta = self.netcdf_file_data.num_eta - 2
+        num_xi = self.netcdf_file_data.num_xi - 2
+
+        if not self.are_sinks_open:
+            self.open_sinks()
+
+        with self.metrics.time_stage('read_slab'):
+            slab = self.netcdf_file_data.get_slab(time_index, depth_index)
+
+        with self.metrics.time_stage('cell_build'):
+            lons, lats = self.netcdf_file_data.get_grid_cell_corners()
+            temps = slab.temps[:num_eta, :num_xi]
+            salts = slab.salts[:num_eta, :num_xi]
+            us = slab.us[:num_eta, :num_xi]
+            vs = slab.vs[:num_eta, :num_xi]
+
+            is_sea = self.netcdf_file_data.get_sea_cells()
+            is_populated = (
+                    ~np.isnan(lons).any(axis=-1) & ~np.isnan(lats).any(axis=-1) &
+                    ~np.isnan(temps) & ~np.isnan(salts) & ~np.isnan(us) & ~np.isnan(vs)
+            )
+            is_valid = is_sea & is_populated
+
+            self.total_skipped_land_points += int(np.count_nonzero(~is_sea))
+            self.total_skipped_nan_points += int(np.count_nonzero(is_sea & ~is_populated))
+
+            valid_temps = temps[is_valid]
+            valid_salts = salts[is_valid]
+
+            self.temperature_thresholds[current_depth].check_set_threshold_values(valid_temps)
+            self.salinity_thresholds[current_depth].check_set_threshold_values(valid_salts)
+
+            valid_zetas = None
+            if current_depth == SURFACE_DEPTH:
+                valid_zetas = slab.zetas[:num_eta, :num_xi][is_valid]
+                self.zeta_thresholds[SURFACE_DEPTH].check_set_threshold_values(valid_zetas[~np.isnan(valid_zetas)])
+
+        with self.metrics.time_stage('derived_fields'):
+            valid_us, valid_vs = us[is_valid], vs[is_valid]
+            valid_current_speeds = get_current_speeds(valid_us, valid_vs)
+            valid_current_directions = get_current_directions(valid_us, valid_vs)
+            # The vorticity of the cells at the edges of the range is taken from the points just past it
+            vorticities = self.netcdf_file_data.get_vorticities(slab.us, slab.vs)[:num_eta, :num_xi]
+            valid_vorticities = vorticities[is_valid]
+
+            self.current_speed_thresholds[current_depth].check_set_threshold_values(valid_current_speeds)
+            self.current_direction_thresholds[current_depth].check_set_threshold_values(valid_current_directions)
+            self.vorticity_thresholds[current_depth].check_set_threshold_values(
+                valid_vorticities[~np.isnan(valid_vorticities)]
+            )
+
+        batch = OceanDataBatch(current_time, current_depth, get_cell_ids(is_valid), dict(zip(
+            VALUE_COLUMNS, [
+                valid_temps, valid_salts, valid_us, valid_vs, valid_zetas,
+                valid_current_speeds, valid_current_directions, valid_vorticities
+            ]
+        )))
+
+        for sink in self.sinks:
+            sink.write_batch(batch)
+
+        for factor, grid_overview in (self.grid_overviews or {}).items():
+            with self.metrics.time_stage('overview_build'):
+                overview_columns = grid_overview.get_columns(
+                    self.temp_dataset_id, current_time, current_depth, is_valid, temps, salts, us, vs,
+                    slab.zetas[:num_eta, :num_xi] if current_depth == SURFACE_DEPTH else None, vorticities
+                )
+            self.overview_bulk_inserters[factor].add_columns(overview_columns)
 
     def __iterate_over_points_and_insert_cells(self, current_time, current_depth, time_index, depth_index):
-        current_temp_slice = self.netcdf_file_data.temps[time_index, depth_index, :, :]
-        current_salt_slice = self.netcdf_file_data.salts[time_index, depth_index, :, :]
-        current_u_slice = self.netcdf_file_data.us[time_index, depth_index, :, :]
-        current_v_slice = self.netcdf_file_data.vs[time_index, depth_index, :, :]
-        current_zeta_slice = self.netcdf_file_data.zetas[time_index, :, :] if current_depth == SURFACE_DEPTH else None
+        slab = self.netcdf_file_data.get_slab(time_index, depth_index)
+        current_temp_slice = slab.temps
+        current_salt_slice = slab.salts
+        current_u_slice = slab.us
+        current_v_slice = slab.vs
+        current_zeta_slice = slab.zetas if current_depth == SURFACE_DEPTH else None
+        current_vorticity_slice = self.netcdf_file_data.get_vorticities(slab.us, slab.vs)
 
         # Iterate over the original rho-grid dimensions, but stop 2 short
         # to ensure (i_idx+1, j_idx+1) for psi-points are within bounds.
@@ -123,8 +398,19 @@ class OceanDatasetIngester:
                         zeta_value = float(grid_cell.zeta_val)
                         self.zeta_thresholds[SURFACE_DEPTH].check_set_thresholds(zeta_value)
 
+                    current_speed_value = float(get_current_speeds(grid_cell.u_val, grid_cell.v_val))
+                    current_direction_value = float(get_current_directions(grid_cell.u_val, grid_cell.v_val))
+                    self.current_speed_thresholds[current_depth].check_set_thresholds(current_speed_value)
+                    self.current_direction_thresholds[current_depth].check_set_thresholds(current_direction_value)
+
+                    vorticity_value = None
+                    if not np.isnan(current_vorticity_slice[i_idx, j_idx]):
+                        vorticity_value = float(current_vorticity_slice[i_idx, j_idx])
+                        self.vorticity_thresholds[current_depth].check_set_thresholds(vorticity_value)
+
                     record = (
                         self.temp_dataset_id,
+                        i_idx * (self.netcdf_file_data.num_xi - 2) + j_idx,
                         current_time,
                         current_depth,
                         grid_cell.get_cell_vertices_geometry(),
@@ -132,7 +418,10 @@ class OceanDatasetIngester:
                         float(grid_cell.salt_val),
                         float(grid_cell.u_val),
                         float(grid_cell.v_val),
-                        zeta_value
+                        zeta_value,
+                        current_speed_value,
+                        current_direction_value,
+                        vorticity_value
                     )
 
                     self.bulk_inserter.add_record(record)
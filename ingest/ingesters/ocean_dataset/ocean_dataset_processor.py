@@ -1,56 +1,416 @@
+import datetime
 import logging
+import os
 
 import xarray as xr
 
-from db.models import ocean_dataset_data
+from db import Session
+from db.models import Dataset
 from db.ocean_dataset_data_table_orchestrator import OceanDatasetDataTableOrchestrator
-from db.utils import BulkInserter
+from db.utils import BulkInserter, CopyBulkInserter
+from etc.config import config
+from etc.const import IngestMode, BulkLoader, StorageLayout, NetcdfReadMode
 from ingest.ingesters.dataset_processor_interface import DatasetProcessorInterface
+from ingest.metrics import IngestMetrics
+from tiles import TileSeeder, TileStore
+from .cell_geometry_cache import get_cell_geometry_cache
 from .models import NetcdfFileData
-from .ocean_dataset_ingester import OceanDatasetIngester
-from .utils import parse_ocean_dataset_path
+from .netcdf_slab_reader import NetcdfSlabReader
+from .remote_netcdf_cache import RemoteNetcdfCache, is_remote_path
+from .sinks import ExportSink, export_sink_factory
+from .slab_ingester_pool import SlabIngesterPool
+from .ocean_dataset_ingester import OceanDatasetIngester, TIME_STEP_MINUTES
+from .utils import parse_ocean_dataset_path, set_dataset_dates, get_source_signature, \
+    get_ingest_manifest, save_ingest_manifest, get_ingest_statistics, bump_dataset_generation, get_time_step_hashes
 
 logger = logging.getLogger(__name__)
 
 INGEST_BATCH_SIZE = 50000
+# The rows of the slab storage layout each hold the values of all the cells of a slab
+SLAB_INGEST_BATCH_SIZE = 8
+INGEST_MODE = IngestMode(config.get('INGEST', 'MODE', fallback=IngestMode.VECTORIZED.value))
+BULK_LOADER = BulkLoader(config.get('INGEST', 'BULK_LOADER', fallback=BulkLoader.COPY.value))
+GEOMETRY_CACHE_DIR = config.get('INGEST', 'GEOMETRY_CACHE_DIR', fallback=None)
+STORAGE_LAYOUT = StorageLayout(config.get('INGEST', 'STORAGE_LAYOUT', fallback=StorageLayout.WIDE.value))
+READ_MODE = NetcdfReadMode(config.get('INGEST', 'READ_MODE', fallback=NetcdfReadMode.EAGER.value))
+READ_MEMORY_BUDGET_MB = config.getint('INGEST', 'READ_MEMORY_BUDGET_MB', fallback=512)
+MAX_TIME_STEPS = config.getint('INGEST', 'MAX_TIME_STEPS', fallback=5)
+WORKERS = config.getint('INGEST', 'WORKERS', fallback=1)
+PARTITIONED = config.getboolean('INGEST', 'PARTITIONED', fallback=False)
+RETENTION_DAYS = config.getint('INGEST', 'RETENTION_DAYS', fallback=0)
+SKIP_UNCHANGED = config.getboolean('INGEST', 'SKIP_UNCHANGED', fallback=True)
+MANIFEST_CONTENT_HASH = config.getboolean('INGEST', 'MANIFEST_CONTENT_HASH', fallback=False)
+REMOTE_CACHE_DIR = config.get('INGEST', 'REMOTE_CACHE_DIR', fallback=None)
+DEFER_INDEXES = config.getboolean('INGEST', 'DEFER_INDEXES', fallback=True)
+UNLOGGED_STAGING = config.getboolean('INGEST', 'UNLOGGED_STAGING', fallback=True)
+INDEX_BUILD_WORKERS = config.getint('INGEST', 'INDEX_BUILD_WORKERS', fallback=4)
+INDEX_BUILD_MEMORY_MB = config.getint('INGEST', 'INDEX_BUILD_MEMORY_MB', fallback=512)
+SEED_TILES = config.getboolean('TILES', 'SEED', fallback=False)
+SEED_MIN_ZOOM = config.getint('TILES', 'SEED_MIN_ZOOM', fallback=4)
+SEED_MAX_ZOOM = config.getint('TILES', 'SEED_MAX_ZOOM', fallback=8)
+SEED_TIME_STEPS = config.getint('TILES', 'SEED_TIME_STEPS', fallback=0)
+SEED_DEPTHS = [float(depth) for depth in config.get('TILES', 'SEED_DEPTHS', fallback='0').split(',')]
+SEED_WORKERS = config.getint('TILES', 'SEED_WORKERS', fallback=4)
+TILE_CACHE_DIR = config.get('TILES', 'CACHE_DIR', fallback=None)
+OVERVIEW_FACTORS = [
+    int(factor) for factor in config.get('INGEST', 'OVERVIEW_FACTORS', fallback='').split(',') if factor.strip()
+]
+EXPORT_FORMATS = [
+    export_format.strip() for export_format in config.get('EXPORT', 'FORMATS', fallback='').split(',')
+    if export_format.strip()
+]
+EXPORT_DIR = config.get('EXPORT', 'DIR', fallback=None)
 
 
 class OceanDatasetProcessor(DatasetProcessorInterface):
+    ingest_metrics: IngestMetrics = None
+
+    def get_ingest_metrics(self) -> IngestMetrics | None:
+        return self.ingest_metrics
 
     def process_dataset(self, dataset_id: str, data_path: str) -> bool:
+        netcdf_file_data = None
+        ocean_dataset_data_table_orchestrator = None
+        export_sinks = []
+        ingest_metrics = self.ingest_metrics = IngestMetrics()
         try:
             logger.info(f"Ingesting data from {dataset_id}")
 
             # Decipher path
             parsed_path = parse_ocean_dataset_path(data_path)
 
+            storage_layout = get_storage_layout(dataset_id)
+            if storage_layout != StorageLayout.WIDE and INGEST_MODE == IngestMode.PER_CELL:
+                raise ValueError(f'The {storage_layout.value} storage layout needs the vectorized ingest mode')
+
+            ocean_dataset_data_table_orchestrator = OceanDatasetDataTableOrchestrator(
+                dataset_id, storage_layout, PARTITIONED, DEFER_INDEXES, UNLOGGED_STAGING
+            )
+
+            # Remote sources are read from a local copy of the subset that is ingested
+            nc_path = parsed_path
+            if is_remote_path(parsed_path) and REMOTE_CACHE_DIR:
+                with ingest_metrics.time_stage('remote_fetch'):
+                    nc_path = RemoteNetcdfCache(REMOTE_CACHE_DIR).get_subset_path(
+                        parsed_path, MAX_TIME_STEPS, get_dataset_bounds(dataset_id)
+                    )
+
+            # Skip the dataset if it was already ingested from the same source file
+            source_signature = get_source_signature(nc_path, MANIFEST_CONTENT_HASH)
+            ingest_manifest = get_ingest_manifest(dataset_id)
+            if (
+                    SKIP_UNCHANGED and source_signature is not None and ingest_manifest is not None
+                    and ingest_manifest.is_source_unchanged(parsed_path, *source_signature)
+                    and ingest_manifest.storage_layout == storage_layout.value
+                    and ocean_dataset_data_table_orchestrator.ocean_dataset_data_table_exists
+            ):
+                logger.info(f"Skipping {dataset_id}, its source file is unchanged since it was last ingested")
+                return True
+
             # Load data into data object
-            netcdf_file_data = get_netcdf_file_data(parsed_path)
+            with ingest_metrics.time_stage('open_netcdf'):
+                netcdf_file_data = get_netcdf_file_data(nc_path, READ_MODE)
 
-            ocean_dataset_data_table_orchestrator = OceanDatasetDataTableOrchestrator(dataset_id)
-            ocean_dataset_data_table_orchestrator.create_ingest_into_table()
+            # By default the cache is persisted next to a local NetCDF file, and only kept in memory for a remote one
+            geometry_cache_dir = GEOMETRY_CACHE_DIR
+            if geometry_cache_dir is None and not is_remote_path(nc_path):
+                geometry_cache_dir = os.path.dirname(nc_path)
+            with ingest_metrics.time_stage('geometry_cache'):
+                cell_geometry_cache = get_cell_geometry_cache(netcdf_file_data, geometry_cache_dir)
 
-            # Initialise the bulk inserter with the correct sql
-            bulk_inserter = BulkInserter(
-                insert_sql=ocean_dataset_data_table_orchestrator.get_bulk_insert_sql(),
-                batch_size=INGEST_BATCH_SIZE
+            # Iterate through data and save records
+            netcdf_dataset_ingester = OceanDatasetIngester(
+                dataset_id, netcdf_file_data, INGEST_MODE, storage_layout, MAX_TIME_STEPS
             )
+            netcdf_dataset_ingester.set_metrics(ingest_metrics)
+            netcdf_dataset_ingester.set_cell_geometry_cache(cell_geometry_cache)
 
-            # Iterate through data and save records
-            netcdf_dataset_ingester = OceanDatasetIngester(dataset_id, netcdf_file_data)
+            # Only load the time steps that weren't loaded from an earlier version of the same source file, as long
+            # as the ones that were loaded from it are unchanged
+            loaded_times = []
+            loaded_time_hashes = dict()
+            new_time_indices = None
+            if is_incremental_ingest(ingest_manifest, parsed_path, netcdf_dataset_ingester.get_ingest_times(),
+                                     cell_geometry_cache.fingerprint, ocean_dataset_data_table_orchestrator):
+                with ingest_metrics.time_stage('manifest_check'):
+                    new_time_indices = get_new_time_indices(ingest_manifest, nc_path, netcdf_dataset_ingester)
+                if new_time_indices is None:
+                    logger.info(f"Reloading {dataset_id}, the time steps loaded from its source file changed")
+
+            if new_time_indices is not None:
+                if not new_time_indices:
+                    logger.info(f"Skipping {dataset_id}, its loaded time steps are unchanged and it has no new ones")
+                    return True
+
+                loaded_times = list(ingest_manifest.loaded_times)
+                loaded_time_hashes = ingest_manifest.get_loaded_time_hashes()
+                logger.info(f"Loading {len(new_time_indices)} new time steps into {dataset_id}")
+                netcdf_dataset_ingester.set_time_indices(new_time_indices)
+                # The thresholds keep covering the days pruned since the last full ingest, which reset them
+                netcdf_dataset_ingester.merge_statistics(get_ingest_statistics(dataset_id))
+                ocean_dataset_data_table_orchestrator.use_current_table(netcdf_dataset_ingester.get_ingest_times())
+            else:
+                with ingest_metrics.time_stage('create_tables'):
+                    ocean_dataset_data_table_orchestrator.create_ingest_into_table()
+
+            # Initialise the bulk inserter with the correct sql
+            bulk_inserter = get_bulk_inserter(ocean_dataset_data_table_orchestrator)
             netcdf_dataset_ingester.set_bulk_inserter(bulk_inserter)
-            netcdf_dataset_ingester.ingest_data()
 
-            # Switch Temp table with original table
-            ocean_dataset_data_table_orchestrator.switch_tables()
+            # Overviews are aggregated from the slabs in the vectorized ingest mode
+            overview_bulk_insert_sqls = dict()
+            if OVERVIEW_FACTORS and INGEST_MODE == IngestMode.VECTORIZED:
+                with ingest_metrics.time_stage('create_tables'):
+                    ocean_dataset_data_table_orchestrator.create_overview_tables(OVERVIEW_FACTORS)
+                overview_bulk_insert_sqls = {
+                    factor: get_overview_bulk_insert_sql(ocean_dataset_data_table_orchestrator, factor)
+                    for factor in OVERVIEW_FACTORS
+                }
+                netcdf_dataset_ingester.set_overview_bulk_inserters({
+                    factor: type(bulk_inserter)(overview_bulk_insert_sql, INGEST_BATCH_SIZE)
+                    for factor, overview_bulk_insert_sql in overview_bulk_insert_sqls.items()
+                })
+
+            # The cells of the grid are also what the API locates points on
+            with ingest_metrics.time_stage('grid_cells'):
+                ocean_dataset_data_table_orchestrator.save_grid_cells(
+                    cell_geometry_cache.fingerprint, cell_geometry_cache.get_grid_cell_columns(), INGEST_BATCH_SIZE
+                )
+
+            # The values are also exported to files, on full ingests
+            if ocean_dataset_data_table_orchestrator.ingest_into_current_table:
+                if EXPORT_FORMATS:
+                    logger.info(f"Not exporting {dataset_id}, exports are only written on full ingests")
+            else:
+                export_sinks = get_export_sinks(dataset_id)
+                for export_sink in export_sinks:
+                    export_sink.prepare(dataset_id, netcdf_file_data, netcdf_dataset_ingester.get_time_indices())
+                    netcdf_dataset_ingester.add_sink(export_sink)
+
+            ingest_dates = netcdf_dataset_ingester.get_ingest_dates()
+            if PARTITIONED:
+                with ingest_metrics.time_stage('create_tables'):
+                    ocean_dataset_data_table_orchestrator.create_partitions(ingest_dates)
+
+            if WORKERS > 1:
+                netcdf_dataset_ingester.set_slab_ingester_pool(SlabIngesterPool(
+                    WORKERS, dataset_id, nc_path, INGEST_MODE, storage_layout, geometry_cache_dir,
+                    type(bulk_inserter), bulk_inserter.insert_sql, bulk_inserter.batch_size, overview_bulk_insert_sqls,
+                    export_sinks, INGEST_BATCH_SIZE
+                ))
+
+            with ingest_metrics.time_stage('ingest_data'):
+                netcdf_dataset_ingester.ingest_data()
+
+            with ingest_metrics.time_stage('index_build'):
+                ocean_dataset_data_table_orchestrator.finish_staging_tables(INDEX_BUILD_WORKERS, INDEX_BUILD_MEMORY_MB)
+
+            # Switch Temp table with original table, and the dataset to its storage layout and grid
+            with ingest_metrics.time_stage('table_switch'):
+                ocean_dataset_data_table_orchestrator.switch_tables(
+                    cell_geometry_cache.fingerprint, netcdf_dataset_ingester.get_ingest_times()
+                )
+
+            with ingest_metrics.time_stage('export_publish'):
+                for export_sink in export_sinks:
+                    export_sink.publish(dataset_id)
+
+            loaded_times = sorted(set(loaded_times) | set(netcdf_dataset_ingester.get_ingest_times()))
+
+            # Drop the forecast days that are older than the retention period
+            if RETENTION_DAYS:
+                oldest_date = ingest_dates[-1] - datetime.timedelta(days=RETENTION_DAYS)
+                with ingest_metrics.time_stage('prune'):
+                    ocean_dataset_data_table_orchestrator.prune_partitions(oldest_date)
+                if PARTITIONED:
+                    loaded_times = [loaded_time for loaded_time in loaded_times if loaded_time.date() >= oldest_date]
+
+            if ocean_dataset_data_table_orchestrator.ingest_into_current_table:
+                set_dataset_dates(dataset_id, loaded_times[0], loaded_times[-1], TIME_STEP_MINUTES)
+
+            # The dataset is fully updated, so anything cached about it can be invalidated
+            generation = bump_dataset_generation(dataset_id)
+            prune_dataset_tiles(dataset_id, generation)
+
+            if SEED_TILES:
+                with ingest_metrics.time_stage('seed_tiles'):
+                    seed_dataset_tiles(dataset_id, generation, loaded_times)
+
+            if source_signature is not None:
+                if SKIP_UNCHANGED:
+                    with ingest_metrics.time_stage('manifest_check'):
+                        loaded_time_hashes.update(zip(
+                            netcdf_dataset_ingester.get_ingest_times(),
+                            get_time_step_hashes(nc_path, list(netcdf_dataset_ingester.get_time_indices()))
+                        ))
+                save_ingest_manifest(dataset_id, parsed_path, source_signature, cell_geometry_cache.fingerprint,
+                                     storage_layout.value, loaded_times, loaded_time_hashes)
 
             return True
         except Exception as e:
             logger.exception(f"Failed to ingest dataset: {dataset_id}, with error: {str(e)}")
+
+            # Don't leave a partially ingested table behind
+            if ocean_dataset_data_table_orchestrator is not None:
+                ocean_dataset_data_table_orchestrator.drop_ingest_into_table()
+            for export_sink in export_sinks:
+                export_sink.discard(dataset_id)
+
             return False
+        finally:
+            if netcdf_file_data is not None:
+                netcdf_file_data.close()
 
 
-def get_netcdf_file_data(nc_file_path) -> NetcdfFileData:
+def get_storage_layout(dataset_id: str) -> StorageLayout:
+    """
+    Datasets can override the default storage layout in the STORAGE_LAYOUT section of the config.
+    """
+    if config.has_option('STORAGE_LAYOUT', dataset_id):
+        return StorageLayout(config.get('STORAGE_LAYOUT', dataset_id))
+    return STORAGE_LAYOUT
+
+
+def get_export_sinks(dataset_id: str) -> list[ExportSink]:
+    """
+    Exports are written by the vectorized ingest mode, into EXPORT.DIR.
+    """
+    if not EXPORT_FORMATS:
+        return []
+
+    if INGEST_MODE != IngestMode.VECTORIZED:
+        logger.warning(f"Not exporting {dataset_id}, exports need the vectorized ingest mode")
+        return []
+
+    if not EXPORT_DIR:
+        logger.warning(f"Not exporting {dataset_id}, EXPORT.DIR isn't configured")
+        return []
+
+    return [export_sink_factory(export_format, EXPORT_DIR) for export_format in EXPORT_FORMATS]
+
+
+def seed_dataset_tiles(dataset_id: str, generation: int, loaded_times: list[datetime.datetime]):
+    """
+    Pre-renders the tiles of the first SEED_TIME_STEPS loaded time steps, or all of them if it's 0, into the tile
+    store served by the API. Failing to seed the tiles doesn't fail the ingest, they are rendered on demand instead.
+    """
+    if not TILE_CACHE_DIR:
+        logger.warning(f"Not seeding the tiles of {dataset_id}, TILES.CACHE_DIR isn't configured")
+        return
+
+    try:
+        bounds = get_dataset_bounds(dataset_id)
+        tile_seeder = TileSeeder(TileStore(TILE_CACHE_DIR), SEED_MIN_ZOOM, SEED_MAX_ZOOM, SEED_WORKERS)
+        tile_seeder.seed_tiles(
+            dataset_id, generation, bounds, loaded_times[:SEED_TIME_STEPS or len(loaded_times)], SEED_DEPTHS
+        )
+    except Exception as e:
+        logger.exception(f"Failed to seed the tiles of dataset: {dataset_id}, with error: {str(e)}")
+
+
+def prune_dataset_tiles(dataset_id: str, generation: int):
+    """
+    Deletes the stored tiles of the earlier generations of the dataset, which can no longer be served, whether or not
+    the tiles are seeded. Failing to prune them doesn't fail the ingest.
+    """
+    if not TILE_CACHE_DIR:
+        return
+
+    try:
+        TileStore(TILE_CACHE_DIR).prune_generations(dataset_id, generation)
+    except Exception as e:
+        logger.exception(f"Failed to prune the tiles of dataset: {dataset_id}, with error: {str(e)}")
+
+
+def get_dataset_bounds(dataset_id: str) -> tuple[float, float, float, float] | None:
+    """
+    The west, south, east and north bounds of the dataset.
+    """
+    dataset = Session.get(Dataset, dataset_id)
+    if dataset is None:
+        return None
+    return float(dataset.west_bound), float(dataset.south_bound), float(dataset.east_bound), float(dataset.north_bound)
+
+
+def is_incremental_ingest(ingest_manifest, source_path: str, ingest_times: list[datetime.datetime], grid_id: str,
+                          ocean_dataset_data_table_orchestrator: OceanDatasetDataTableOrchestrator) -> bool:
+    """
+    A source file that was extended with new time steps, such as a forecast that is appended to, only needs its new
+    time steps loaded into the current table. Anything else about the source or the table changing needs a full
+    ingest.
+    """
+    return (
+            SKIP_UNCHANGED and ingest_manifest is not None
+            and ingest_manifest.source_path == source_path
+            and ingest_manifest.grid_id == grid_id
+            and ingest_manifest.storage_layout == ocean_dataset_data_table_orchestrator.storage_layout.value
+            and ocean_dataset_data_table_orchestrator.ocean_dataset_data_table_exists
+            and ocean_dataset_data_table_orchestrator.ocean_dataset_data_table_is_partitioned == PARTITIONED
+            and set(ingest_manifest.loaded_times) <= set(ingest_times)
+    )
+
+
+def get_new_time_indices(ingest_manifest, nc_file_path: str,
+                         netcdf_dataset_ingester: OceanDatasetIngester) -> list[int] | None:
+    """
+    Gets the indices of the ingested time steps of the source file that weren't loaded from it yet.
+    Returns None if any of the time steps that were loaded from it changed since, or weren't hashed when they were
+    loaded, such as when a forecast is regenerated with the same times, in which case the dataset is fully ingested.
+    """
+    loaded_time_hashes = ingest_manifest.get_loaded_time_hashes()
+
+    new_time_indices = []
+    loaded_time_indices = []
+    for time_index, ingest_time in zip(netcdf_dataset_ingester.get_time_indices(),
+                                       netcdf_dataset_ingester.get_ingest_times()):
+        if ingest_time in ingest_manifest.loaded_times:
+            if ingest_time not in loaded_time_hashes:
+                return None
+            loaded_time_indices.append((time_index, loaded_time_hashes[ingest_time]))
+        else:
+            new_time_indices.append(time_index)
+
+    time_step_hashes = get_time_step_hashes(nc_file_path, [time_index for time_index, _ in loaded_time_indices])
+    if time_step_hashes != [loaded_time_hash for _, loaded_time_hash in loaded_time_indices]:
+        return None
+
+    return new_time_indices
+
+
+def get_bulk_inserter(ocean_dataset_data_table_orchestrator: OceanDatasetDataTableOrchestrator) -> BulkInserter:
+    """
+    The per cell ingest mode builds records with WKT geometry expressions, which can only be inserted.
+    """
+    batch_size = (
+        SLAB_INGEST_BATCH_SIZE if ocean_dataset_data_table_orchestrator.storage_layout == StorageLayout.SLAB
+        else INGEST_BATCH_SIZE
+    )
+
+    if BULK_LOADER == BulkLoader.COPY and INGEST_MODE != IngestMode.PER_CELL:
+        return CopyBulkInserter(
+            copy_sql=ocean_dataset_data_table_orchestrator.get_bulk_copy_sql(),
+            batch_size=batch_size
+        )
+
+    return BulkInserter(
+        insert_sql=ocean_dataset_data_table_orchestrator.get_bulk_insert_sql(),
+        batch_size=batch_size
+    )
+
+
+def get_overview_bulk_insert_sql(ocean_dataset_data_table_orchestrator: OceanDatasetDataTableOrchestrator,
+                                 factor: int) -> str:
+    if BULK_LOADER == BulkLoader.COPY:
+        return ocean_dataset_data_table_orchestrator.get_overview_bulk_copy_sql(factor)
+    return ocean_dataset_data_table_orchestrator.get_overview_bulk_insert_sql(factor)
+
+
+def get_netcdf_file_data(nc_file_path, read_mode: NetcdfReadMode = NetcdfReadMode.EAGER,
+                         read_memory_budget_bytes: int = READ_MEMORY_BUDGET_MB * 2 ** 20) -> NetcdfFileData:
+    """
+    In the eager read mode all the variables are loaded into memory up front.
+    In the lazy read mode only the grid is, and the (time, depth) slabs are read on demand within the memory budget.
+    """
     logger.info(f"Opening NetCDF file: {nc_file_path}")
     ds = xr.open_dataset(nc_file_path)
 
@@ -63,11 +423,15 @@ def get_netcdf_file_data(nc_file_path) -> NetcdfFileData:
     netcdf_file_data.set_dimensions(ds['time'].values, ds['depth'].values, ds['eta_rho'], ds['xi_rho'])
 
     netcdf_file_data.mask = ds['mask'].values
-    netcdf_file_data.temps = ds['temp'].values
-    netcdf_file_data.salts = ds['salt'].values
-    netcdf_file_data.us = ds['u'].values
-    netcdf_file_data.vs = ds['v'].values
-    netcdf_file_data.zetas = ds['zeta'].values
+
+    if read_mode == NetcdfReadMode.LAZY:
+        netcdf_file_data.set_slab_reader(NetcdfSlabReader(ds, read_memory_budget_bytes))
+    else:
+        netcdf_file_data.temps = ds['temp'].values
+        netcdf_file_data.salts = ds['salt'].values
+        netcdf_file_data.us = ds['u'].values
+        netcdf_file_data.vs = ds['v'].values
+        netcdf_file_data.zetas = ds['zeta'].values
 
     logger.info(
         f"Dataset dimensions: Time={netcdf_file_data.num_times}, Depth={netcdf_file_data.num_depths}, Eta_rho={netcdf_file_data.num_eta}, Xi_rho={netcdf_file_data.num_xi}")
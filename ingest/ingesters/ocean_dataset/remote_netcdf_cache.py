@@ -0,0 +1,215 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+import netCDF4
+import numpy as np
+import xarray as xr
+
+logger = logging.getLogger(__name__)
+
+REMOTE_PATH_PREFIXES = ('http://', 'https://')
+# OPeNDAP servers, such as THREDDS, subset requests themselves
+DAP_PATH_MARKERS = ('/dodsC/', '/dap4/', '/opendap/')
+SUBSET_VARIABLES = ['temp', 'salt', 'u', 'v', 'zeta']
+GRID_VARIABLES = ['lon_rho', 'lat_rho', 'mask']
+# The cells of a grid point are built from its neighbours, so the bounding box is widened by a point on each side
+BOUNDS_MARGIN = 1
+# Global attributes that change when a remote source is regenerated
+VERSION_ATTRIBUTES = ['date_modified', 'date_created', 'history']
+CHECKSUM_CHUNK_SIZE = 2 ** 20
+
+
+def is_remote_path(path: str) -> bool:
+    return path.startswith(REMOTE_PATH_PREFIXES)
+
+
+def get_remote_open_path(url: str) -> str:
+    """
+    Other HTTP servers are read with byte range requests, which netCDF-C only makes for a #mode=bytes URL.
+    """
+    if any(dap_path_marker in url for dap_path_marker in DAP_PATH_MARKERS):
+        return url
+    return f'{url}#mode=bytes'
+
+
+class RemoteNetcdfCache:
+    """
+    Copies the subset of a remote NetCDF source that is ingested into a local NetCDF file: only the ingested
+    variables, the first max_time_steps time steps, and the grid points within the dataset's bounds.
+    The subset is downloaded in chunks of a variable's time step, which are cached with their checksums, so that
+    an interrupted download resumes from the chunks that were already verified.
+    """
+    cache_dir: str
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+
+    def get_subset_path(self, url: str, max_time_steps: int,
+                        bounds: tuple[float, float, float, float] | None = None) -> str:
+        """
+        Gets the path of the local subset of the remote source, which is only downloaded if the source changed.
+        max_time_steps: all of them if it's 0.
+        bounds: west, south, east, north. The whole grid if it's None.
+        """
+        ds = xr.open_dataset(get_remote_open_path(url), engine='netcdf4')
+        try:
+            num_times = min(max_time_steps, ds.sizes['time']) if max_time_steps else ds.sizes['time']
+            eta_slice, xi_slice = get_bounds_slices(ds['lon_rho'].values, ds['lat_rho'].values, bounds)
+            subset = {'time': slice(0, num_times), 'eta_rho': eta_slice, 'xi_rho': xi_slice}
+
+            url_key = hashlib.sha256(url.encode()).hexdigest()[:16]
+            subset_dir = os.path.join(self.cache_dir, f'{url_key}_{get_subset_key(ds, subset)}')
+            subset_path = os.path.join(subset_dir, 'subset.nc')
+            if os.path.exists(subset_path):
+                logger.info(f"Using the cached subset of {url}: {subset_path}")
+                return subset_path
+
+            logger.info(f"Downloading the subset of {url}: {subset}")
+            chunk_store = ChunkStore(os.path.join(subset_dir, 'chunks'))
+            for variable in SUBSET_VARIABLES:
+                variable_subset = {dim: dim_slice for dim, dim_slice in subset.items() if dim in ds[variable].dims}
+                for time_index in range(num_times):
+                    chunk_store.fetch_chunk(
+                        f'{variable}_{time_index}',
+                        lambda: ds[variable].isel(variable_subset).isel(time=time_index).values
+                    )
+
+            write_subset_file(ds, subset, chunk_store, subset_path)
+            shutil.rmtree(chunk_store.chunk_dir)
+        finally:
+            ds.close()
+
+        # The subsets of earlier versions of the source are no longer used
+        for cache_entry in os.listdir(self.cache_dir):
+            cache_entry_path = os.path.join(self.cache_dir, cache_entry)
+            if cache_entry.startswith(f'{url_key}_') and cache_entry_path != subset_dir:
+                shutil.rmtree(cache_entry_path, ignore_errors=True)
+
+        return subset_path
+
+
+class ChunkStore:
+    """
+    Chunks saved as .npy files, with a manifest of their SHA-256 checksums.
+    A chunk is only recorded in the manifest once it's completely written.
+    """
+    chunk_dir: str
+    checksums: dict[str, str]
+
+    def __init__(self, chunk_dir: str):
+        self.chunk_dir = chunk_dir
+        os.makedirs(chunk_dir, exist_ok=True)
+        try:
+            with open(self.get_manifest_path()) as manifest_file:
+                self.checksums = json.load(manifest_file)
+        except (OSError, ValueError):
+            self.checksums = dict()
+
+    def fetch_chunk(self, name: str, download_chunk):
+        """
+        Downloads a chunk with download_chunk, unless it's already saved and its checksum matches.
+        """
+        chunk_path = self.get_chunk_path(name)
+        if name in self.checksums and os.path.exists(chunk_path) and get_checksum(chunk_path) == self.checksums[name]:
+            return
+
+        with open(f'{chunk_path}.tmp', 'wb') as chunk_file:
+            np.save(chunk_file, download_chunk())
+        os.replace(f'{chunk_path}.tmp', chunk_path)
+
+        self.checksums[name] = get_checksum(chunk_path)
+        with open(f'{self.get_manifest_path()}.tmp', 'w') as manifest_file:
+            json.dump(self.checksums, manifest_file)
+        os.replace(f'{self.get_manifest_path()}.tmp', self.get_manifest_path())
+
+    def load_chunk(self, name: str) -> np.ndarray:
+        chunk_path = self.get_chunk_path(name)
+        if get_checksum(chunk_path) != self.checksums.get(name):
+            raise ValueError(f'The checksum of chunk {chunk_path} does not match')
+        return np.load(chunk_path)
+
+    def get_chunk_path(self, name: str) -> str:
+        return os.path.join(self.chunk_dir, f'{name}.npy')
+
+    def get_manifest_path(self) -> str:
+        return os.path.join(self.chunk_dir, 'manifest.json')
+
+
+def get_bounds_slices(lons: np.ndarray, lats: np.ndarray,
+                      bounds: tuple[float, float, float, float] | None) -> tuple[slice, slice]:
+    """
+    The eta and xi ranges of the grid points within the bounds, or of the whole grid if none are.
+    """
+    num_eta, num_xi = lons.shape
+    if bounds is None:
+        return slice(0, num_eta), slice(0, num_xi)
+
+    west, south, east, north = bounds
+    eta_indices, xi_indices = np.nonzero((lons >= west) & (lons <= east) & (lats >= south) & (lats <= north))
+    if len(eta_indices) == 0:
+        return slice(0, num_eta), slice(0, num_xi)
+
+    return (
+        slice(max(int(eta_indices.min()) - BOUNDS_MARGIN, 0), min(int(eta_indices.max()) + BOUNDS_MARGIN + 1, num_eta)),
+        slice(max(int(xi_indices.min()) - BOUNDS_MARGIN, 0), min(int(xi_indices.max()) + BOUNDS_MARGIN + 1, num_xi)),
+    )
+
+
+def get_subset_key(ds: xr.Dataset, subset: dict[str, slice]) -> str:
+    """
+    Identifies the version of the source and the subset of it, so that a regenerated source is downloaded again.
+    """
+    subset_key = hashlib.sha256()
+    subset_key.update(np.asarray(ds['time'].values[subset['time']]).tobytes())
+    subset_key.update(json.dumps(
+        {
+            'subset': {dim: [dim_slice.start, dim_slice.stop] for dim, dim_slice in subset.items()},
+            'versions': {name: str(ds.attrs.get(name)) for name in VERSION_ATTRIBUTES},
+            'variables': SUBSET_VARIABLES,
+        },
+        sort_keys=True
+    ).encode())
+    return subset_key.hexdigest()[:16]
+
+
+def get_checksum(path: str) -> str:
+    checksum = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHECKSUM_CHUNK_SIZE), b''):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def write_subset_file(ds: xr.Dataset, subset: dict[str, slice], chunk_store: ChunkStore, subset_path: str):
+    """
+    Writes the grid and coordinates of the subset with xarray, and then its variables a chunk at a time, so that
+    the subset is never held in memory.
+    """
+    temp_subset_path = f'{subset_path}.tmp'
+    num_times = subset['time'].stop
+
+    grid_ds = xr.Dataset(
+        {name: ds[name].isel(subset, missing_dims='ignore').load() for name in GRID_VARIABLES},
+        coords={'time': ds['time'].values[subset['time']], 'depth': ds['depth'].values},
+    )
+    grid_ds.to_netcdf(temp_subset_path)
+
+    with netCDF4.Dataset(temp_subset_path, 'a') as subset_file:
+        for variable in SUBSET_VARIABLES:
+            subset_variable = None
+            for time_index in range(num_times):
+                chunk = chunk_store.load_chunk(f'{variable}_{time_index}')
+                if subset_variable is None:
+                    subset_variable = subset_file.createVariable(
+                        variable, chunk.dtype, ds[variable].dims, zlib=False,
+                        fill_value=np.nan if np.issubdtype(chunk.dtype, np.floating) else None
+                    )
+                    subset_variable.setncatts({
+                        name: value for name, value in ds[variable].attrs.items() if name != '_FillValue'
+                    })
+                subset_variable[time_index] = chunk
+
+    os.replace(temp_subset_path, subset_path)
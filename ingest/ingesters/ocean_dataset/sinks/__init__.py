@@ -0,0 +1,20 @@
+from etc.const import ExportFormat
+from .ocean_data_sink_interface import OceanDataSinkInterface, OceanDataBatch, VALUE_COLUMNS
+from .postgres_sink import PostgresSink
+from .null_sink import NullSink
+from .export_sink import ExportSink
+
+
+def export_sink_factory(export_format: str, export_dir: str) -> ExportSink:
+    """
+    The export sinks are imported on demand, so that pyarrow and zarr are only loaded by ingests that export.
+    """
+    match export_format:
+        case ExportFormat.GEOPARQUET.value:
+            from .geoparquet_sink import GeoParquetSink
+            return GeoParquetSink(export_dir)
+        case ExportFormat.ZARR.value:
+            from .zarr_sink import ZarrSink
+            return ZarrSink(export_dir)
+        case _:
+            raise ValueError(f'Unknown export format: {export_format}')
@@ -0,0 +1,58 @@
+import logging
+import os
+import shutil
+
+from ..models import NetcdfFileData
+from .ocean_data_sink_interface import OceanDataSinkInterface
+
+logger = logging.getLogger(__name__)
+
+
+class ExportSink(OceanDataSinkInterface):
+    """
+    Exports the batches of a dataset to files in the export directory, for bulk access outside of PostGIS.
+    Like the ocean dataset data tables, an export is written to a temporary path, and only replaces the dataset's
+    current export once the ingest has succeeded.
+    """
+    export_dir: str
+    file_extension: str = ''
+
+    def __init__(self, export_dir: str):
+        self.export_dir = export_dir
+
+    def get_export_path(self, dataset_id: str) -> str:
+        return os.path.join(self.export_dir, f'{dataset_id}.{self.file_extension}')
+
+    def get_temp_export_path(self, dataset_id: str) -> str:
+        return f'{self.get_export_path(dataset_id)}.tmp'
+
+    def prepare(self, dataset_id: str, netcdf_file_data: NetcdfFileData, time_indices: list[int]):
+        """
+        Creates the temporary export of the given time steps, before any process opens the sink.
+        """
+        temp_export_path = self.get_temp_export_path(dataset_id)
+        remove_path(temp_export_path)
+        os.makedirs(self.export_dir, exist_ok=True)
+
+    def publish(self, dataset_id: str):
+        """
+        Replaces the current export of the dataset with the temporary export.
+        """
+        export_path = self.get_export_path(dataset_id)
+        old_export_path = f'{export_path}.old'
+        remove_path(old_export_path)
+        if os.path.exists(export_path):
+            os.rename(export_path, old_export_path)
+        os.rename(self.get_temp_export_path(dataset_id), export_path)
+        remove_path(old_export_path)
+        logger.info(f"Exported {dataset_id} to {export_path}")
+
+    def discard(self, dataset_id: str):
+        remove_path(self.get_temp_export_path(dataset_id))
+
+
+def remove_path(path: str):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,134 @@
+import json
+import os
+import uuid
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ingest.metrics import IngestMetrics
+from ..cell_geometry_cache import CellGeometryCache
+from ..models import NetcdfFileData, get_cells_wkb
+from .export_sink import ExportSink
+from .ocean_data_sink_interface import OceanDataBatch, VALUE_COLUMNS
+
+DEFAULT_ROW_GROUP_SIZE = 1000000
+
+# The cell polygons are in WGS84 longitude, latitude order, which is GeoParquet's default CRS
+GEOPARQUET_METADATA = {
+    'version': '1.1.0',
+    'primary_column': 'geometry',
+    'columns': {
+        'geometry': {'encoding': 'WKB', 'geometry_types': ['Polygon']},
+    },
+}
+
+GEOPARQUET_SCHEMA = pa.schema(
+    [
+        pa.field('date_time', pa.timestamp('s'), nullable=False),
+        pa.field('depth', pa.float64(), nullable=False),
+        pa.field('cell_id', pa.int64(), nullable=False),
+        *[pa.field(value_column, pa.float32()) for value_column in VALUE_COLUMNS],
+        pa.field('geometry', pa.binary(), nullable=False),
+    ],
+    metadata={b'geo': json.dumps(GEOPARQUET_METADATA).encode()},
+)
+
+
+class GeoParquetSink(ExportSink):
+    """
+    Exports the values of a dataset as a GeoParquet dataset: a directory of part files with a row per cell, time and
+    depth, and the cell polygons as WKB.
+    Every process that writes to the sink writes part files of its own, and a part is completed on each flush.
+    """
+    file_extension = 'parquet'
+    row_group_size: int
+    temp_export_path: str = None
+    cell_geometry_cache: CellGeometryCache = None
+    cell_wkb: np.ndarray = None
+    pending_batches: list[OceanDataBatch]
+    num_pending_rows: int
+    part_writer: pq.ParquetWriter = None
+    metrics: IngestMetrics
+
+    def __init__(self, export_dir: str, row_group_size: int = DEFAULT_ROW_GROUP_SIZE):
+        super().__init__(export_dir)
+        self.row_group_size = row_group_size
+        self.pending_batches = []
+        self.num_pending_rows = 0
+        self.metrics = IngestMetrics()
+
+    def prepare(self, dataset_id: str, netcdf_file_data: NetcdfFileData, time_indices: list[int]):
+        super().prepare(dataset_id, netcdf_file_data, time_indices)
+        os.makedirs(self.get_temp_export_path(dataset_id))
+
+    def open(self, dataset_id: str, netcdf_file_data: NetcdfFileData, cell_geometry_cache: CellGeometryCache):
+        self.temp_export_path = self.get_temp_export_path(dataset_id)
+        self.cell_geometry_cache = cell_geometry_cache
+
+        # Encoded once for the sea cells of the grid, in the order of their geometries in the cache
+        lons, lats = netcdf_file_data.get_grid_cell_corners()
+        self.cell_wkb = get_cells_wkb(lons[cell_geometry_cache.sea_cells], lats[cell_geometry_cache.sea_cells])
+
+    def write_batch(self, batch: OceanDataBatch):
+        self.pending_batches.append(batch)
+        self.num_pending_rows += batch.num_cells
+        if self.num_pending_rows >= self.row_group_size:
+            self.write_pending_batches()
+
+    def flush(self):
+        self.write_pending_batches()
+        if self.part_writer is not None:
+            self.part_writer.close()
+            self.part_writer = None
+
+    def set_metrics(self, metrics):
+        self.metrics = metrics
+
+    def write_pending_batches(self):
+        if not self.pending_batches:
+            return
+
+        if self.part_writer is None:
+            part_path = os.path.join(self.temp_export_path, f'part-{uuid.uuid4().hex}.parquet')
+            self.part_writer = pq.ParquetWriter(part_path, GEOPARQUET_SCHEMA, compression='zstd')
+
+        with self.metrics.time_stage('export_geoparquet'):
+            self.part_writer.write_table(self.get_pending_table(), row_group_size=self.row_group_size)
+
+        self.pending_batches = []
+        self.num_pending_rows = 0
+
+    def get_pending_table(self) -> pa.Table:
+        batches = self.pending_batches
+        cell_ids = np.concatenate([batch.cell_ids for batch in batches])
+
+        value_arrays = []
+        for value_column in VALUE_COLUMNS:
+            values = np.concatenate([
+                batch.values[value_column] if batch.values[value_column] is not None
+                else np.full(batch.num_cells, np.nan, dtype=np.float32)
+                for batch in batches
+            ]).astype(np.float32)
+            value_arrays.append(pa.array(values, mask=np.isnan(values)))
+
+        # All the polygons have the same number of points, so their WKB is packed end to end
+        cell_wkb = self.cell_wkb[self.cell_geometry_cache.get_sea_cell_indices(cell_ids)]
+        wkb_offsets = np.arange(len(cell_wkb) + 1, dtype=np.int32) * cell_wkb.shape[1]
+        geometries = pa.Array.from_buffers(
+            pa.binary(), len(cell_wkb), [None, pa.py_buffer(wkb_offsets), pa.py_buffer(cell_wkb.tobytes())]
+        )
+
+        return pa.Table.from_arrays(
+            [
+                pa.array(np.repeat(
+                    np.array([batch.date_time for batch in batches], dtype='datetime64[s]'),
+                    [batch.num_cells for batch in batches]
+                )),
+                pa.array(np.repeat([batch.depth for batch in batches], [batch.num_cells for batch in batches])),
+                pa.array(cell_ids.astype(np.int64)),
+                *value_arrays,
+                geometries,
+            ],
+            schema=GEOPARQUET_SCHEMA,
+        )
@@ -0,0 +1,16 @@
+from .ocean_data_sink_interface import OceanDataSinkInterface, OceanDataBatch
+
+
+class NullSink(OceanDataSinkInterface):
+    """
+    Discards the batches, only counting their rows, so that reading and building the cells can be measured apart
+    from encoding and writing them.
+    """
+    metrics = None
+
+    def write_batch(self, batch: OceanDataBatch):
+        if self.metrics is not None:
+            self.metrics.record_batch(batch.num_cells, 0, 0.0)
+
+    def set_metrics(self, metrics):
+        self.metrics = metrics
@@ -0,0 +1,58 @@
+import numpy as np
+
+from ..cell_geometry_cache import CellGeometryCache
+from ..models import NetcdfFileData
+
+# The value columns of a batch, named like the columns of ocean_dataset_data
+VALUE_COLUMNS = [
+    'temperature', 'salinity', 'u_velocity', 'v_velocity', 'zeta', 'current_speed', 'current_direction', 'vorticity'
+]
+
+
+class OceanDataBatch:
+    """
+    The values of the valid cells of a single (time, depth) slab, as columns.
+    Cells are identified by their flat index on the grid of ingested cells, like in grid_cell.
+    values: a column per VALUE_COLUMNS, where zeta is None below the surface, and vorticity is NaN for cells next to
+    cells without values.
+    """
+    date_time: str
+    depth: float
+    cell_ids: np.ndarray
+    values: dict[str, np.ndarray | None]
+
+    def __init__(self, date_time: str, depth: float, cell_ids: np.ndarray, values: dict[str, np.ndarray | None]):
+        self.date_time = date_time
+        self.depth = depth
+        self.cell_ids = cell_ids
+        self.values = values
+
+    @property
+    def num_cells(self) -> int:
+        return len(self.cell_ids)
+
+
+class OceanDataSinkInterface:
+    """
+    Receives the ingested values of a dataset as columnar batches.
+    Sinks are picklable until they are opened, so that they can be handed to the slab ingester pool's workers,
+    which open copies of them of their own.
+    """
+
+    def open(self, dataset_id: str, netcdf_file_data: NetcdfFileData, cell_geometry_cache: CellGeometryCache):
+        """
+        Opens the sink in a process that writes batches to it.
+        """
+        pass
+
+    def write_batch(self, batch: OceanDataBatch):
+        raise NotImplementedError
+
+    def flush(self):
+        """
+        Writes out any buffered batches.
+        """
+        pass
+
+    def set_metrics(self, metrics):
+        pass
@@ -0,0 +1,66 @@
+import numpy as np
+
+from db.utils import BulkInserter, to_array_literal
+from etc.const import StorageLayout
+from ..cell_geometry_cache import CellGeometryCache
+from ..models import NetcdfFileData
+from .ocean_data_sink_interface import OceanDataSinkInterface, OceanDataBatch, VALUE_COLUMNS
+
+
+class PostgresSink(OceanDataSinkInterface):
+    """
+    Writes the batches into the ocean dataset data table of the storage layout with a bulk inserter.
+    The slab storage layout has a row per batch, with the values of the batch's cells spread over arrays of all the
+    cells of the grid, as array literals.
+    """
+    bulk_inserter: BulkInserter
+    storage_layout: StorageLayout
+    temp_dataset_id: str = None
+    cell_geometry_cache: CellGeometryCache = None
+
+    def __init__(self, bulk_inserter: BulkInserter, storage_layout: StorageLayout):
+        self.bulk_inserter = bulk_inserter
+        self.storage_layout = storage_layout
+
+    def open(self, dataset_id: str, netcdf_file_data: NetcdfFileData, cell_geometry_cache: CellGeometryCache):
+        # Rows are ingested under a temporary dataset id until the tables are switched
+        self.temp_dataset_id = f'temp_{dataset_id}'
+        self.cell_geometry_cache = cell_geometry_cache
+
+    def write_batch(self, batch: OceanDataBatch):
+        value_columns = [batch.values[value_column] for value_column in VALUE_COLUMNS]
+
+        if self.storage_layout == StorageLayout.NORMALIZED:
+            columns = [batch.cell_ids, batch.date_time, batch.depth, *value_columns]
+        elif self.storage_layout == StorageLayout.SLAB:
+            columns = [
+                [batch.date_time],
+                [batch.depth],
+                *[np.array([self.get_slab_array_literal(batch.cell_ids, values)], dtype=object)
+                  for values in value_columns]
+            ]
+        else:
+            columns = [
+                self.temp_dataset_id,
+                batch.cell_ids,
+                batch.date_time,
+                batch.depth,
+                self.cell_geometry_cache.get_cell_id_geometries(batch.cell_ids),
+                *value_columns
+            ]
+
+        self.bulk_inserter.add_columns(columns)
+
+    def get_slab_array_literal(self, cell_ids: np.ndarray, values: np.ndarray | None) -> str | None:
+        if values is None:
+            return None
+
+        slab_values = np.full(self.cell_geometry_cache.sea_cells.size, np.nan, dtype=np.float32)
+        slab_values[cell_ids] = values
+        return to_array_literal(slab_values)
+
+    def flush(self):
+        self.bulk_inserter.flush()
+
+    def set_metrics(self, metrics):
+        self.bulk_inserter.set_metrics(metrics)
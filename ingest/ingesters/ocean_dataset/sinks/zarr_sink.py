@@ -0,0 +1,98 @@
+import numpy as np
+import zarr
+
+from ingest.metrics import IngestMetrics
+from ..cell_geometry_cache import CellGeometryCache
+from ..models import NetcdfFileData
+from .export_sink import ExportSink
+from .ocean_data_sink_interface import OceanDataBatch, VALUE_COLUMNS
+
+SURFACE_VALUE_COLUMNS = ['zeta']
+
+# The attribute a Zarr v2 store names the dimensions of an array with for xarray
+XARRAY_DIMENSIONS_ATTRIBUTE = '_ARRAY_DIMENSIONS'
+
+
+class ZarrSink(ExportSink):
+    """
+    Exports the values of a dataset as a Zarr store of dense (time, depth, eta, xi) arrays, with zeta over
+    (time, eta, xi), which xarray can open with open_zarr. Cells without values are NaN.
+    Each (time, depth) slab is a chunk of its own, so the processes writing to the sink never write the same chunk.
+    """
+    file_extension = 'zarr'
+    group: zarr.Group = None
+    time_positions: dict[str, int] = None
+    depth_positions: dict[float, int] = None
+    grid_shape: tuple[int, int] = None
+    metrics: IngestMetrics
+
+    def __init__(self, export_dir: str):
+        super().__init__(export_dir)
+        self.metrics = IngestMetrics()
+
+    def prepare(self, dataset_id: str, netcdf_file_data: NetcdfFileData, time_indices: list[int]):
+        super().prepare(dataset_id, netcdf_file_data, time_indices)
+
+        # Same cell range as the ingested cells
+        grid_shape = (netcdf_file_data.num_eta - 2, netcdf_file_data.num_xi - 2)
+        num_times = len(time_indices)
+        num_depths = netcdf_file_data.num_depths
+
+        group = zarr.open_group(self.get_temp_export_path(dataset_id), mode='w')
+        for value_column in VALUE_COLUMNS:
+            if value_column in SURFACE_VALUE_COLUMNS:
+                shape, chunks, dims = (num_times, *grid_shape), (1, *grid_shape), ['time', 'eta', 'xi']
+            else:
+                shape, chunks, dims = (
+                    (num_times, num_depths, *grid_shape), (1, 1, *grid_shape), ['time', 'depth', 'eta', 'xi']
+                )
+            array = group.create_dataset(value_column, shape=shape, chunks=chunks, dtype='float32', fill_value=np.nan)
+            array.attrs.update({'coordinates': 'lon lat', XARRAY_DIMENSIONS_ATTRIBUTE: dims})
+
+        # The coordinates, with the cell centers taken as the means of their corners
+        times = np.asarray(netcdf_file_data.times)[time_indices].astype('datetime64[s]')
+        coordinates = {
+            'time': (times.astype(np.int64), ['time'], {'units': 'seconds since 1970-01-01', 'calendar': 'standard'}),
+            'depth': (np.asarray(netcdf_file_data.depths, dtype=np.float64), ['depth'], {'units': 'm'}),
+            **{
+                name: (corners.mean(axis=-1), ['eta', 'xi'], {'units': units})
+                for name, corners, units in zip(
+                    ('lon', 'lat'), netcdf_file_data.get_grid_cell_corners(), ('degrees_east', 'degrees_north')
+                )
+            },
+        }
+        for name, (values, dims, attrs) in coordinates.items():
+            # Without a fill value, as Zarr v2 defaults to 0, which xarray would mask the surface depth with
+            array = group.create_dataset(name, data=values, fill_value=None)
+            array.attrs.update({**attrs, XARRAY_DIMENSIONS_ATTRIBUTE: dims})
+
+        zarr.consolidate_metadata(group.store)
+
+    def open(self, dataset_id: str, netcdf_file_data: NetcdfFileData, cell_geometry_cache: CellGeometryCache):
+        self.group = zarr.open_group(self.get_temp_export_path(dataset_id), mode='r+')
+        times = self.group['time'][:].astype('datetime64[s]')
+        self.time_positions = {date_time: position for position, date_time in enumerate(np.datetime_as_string(times))}
+        self.depth_positions = {float(depth): position for position, depth in enumerate(self.group['depth'][:])}
+        self.grid_shape = self.group['temperature'].shape[-2:]
+
+    def write_batch(self, batch: OceanDataBatch):
+        time_position = self.time_positions[batch.date_time]
+        depth_position = self.depth_positions[batch.depth]
+
+        with self.metrics.time_stage('export_zarr'):
+            for value_column in VALUE_COLUMNS:
+                values = batch.values[value_column]
+                if values is None:
+                    continue
+
+                slab = np.full(self.grid_shape[0] * self.grid_shape[1], np.nan, dtype=np.float32)
+                slab[batch.cell_ids] = values
+                slab = slab.reshape(self.grid_shape)
+
+                if value_column in SURFACE_VALUE_COLUMNS:
+                    self.group[value_column][time_position] = slab
+                else:
+                    self.group[value_column][time_position, depth_position] = slab
+
+    def set_metrics(self, metrics):
+        self.metrics = metrics
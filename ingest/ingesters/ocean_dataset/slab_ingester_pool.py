@@ -0,0 +1,94 @@
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from etc.const import IngestMode, StorageLayout, NetcdfReadMode
+from ingest.metrics import IngestMetrics
+from .cell_geometry_cache import get_cell_geometry_cache
+from .models import IngestStatistics
+
+logger = logging.getLogger(__name__)
+
+# The ingester of each worker process, set up by the pool's initializer
+__worker_ingester = None
+
+
+class SlabIngesterPool:
+    """
+    Spreads the (time, depth) slabs of an ingest over a pool of worker processes.
+    Every worker opens the NetCDF file, a connection pool and copies of the sinks of its own, and returns the
+    statistics and metrics of each slab it ingested, which are merged by the ingester.
+    Workers read their slabs on demand, without prefetching, since they don't ingest consecutive slabs.
+    """
+    num_workers: int
+
+    def __init__(self, num_workers: int, dataset_id: str, nc_file_path: str, ingest_mode: IngestMode,
+                 storage_layout: StorageLayout, geometry_cache_dir: str,
+                 bulk_inserter_class: type | None, bulk_insert_sql: str, batch_size: int,
+                 overview_bulk_insert_sqls: dict[int, str] = None, sinks: list = None,
+                 overview_batch_size: int = None):
+        """
+        bulk_inserter_class: the class of the bulk inserter of the Postgres sink, or None to not write to Postgres.
+        sinks: any other sinks to write to, which are copied to the workers unopened.
+        overview_batch_size: the batch size of the overview bulk inserters, batch_size by default.
+        """
+        self.num_workers = num_workers
+        self.worker_args = (
+            dataset_id, nc_file_path, ingest_mode, storage_layout, geometry_cache_dir,
+            bulk_inserter_class, bulk_insert_sql, batch_size, overview_bulk_insert_sqls, sinks,
+            overview_batch_size or batch_size
+        )
+
+    def ingest_slabs(self, slabs: list[tuple[int, int]]):
+        """
+        Yields the statistics of the slabs as they are ingested.
+        The first slab to fail cancels the slabs that haven't started, and is raised.
+        """
+        logger.info(f"Ingesting {len(slabs)} slabs with {self.num_workers} worker processes")
+
+        # Workers are spawned rather than forked, since HDF5 and open connections don't survive a fork
+        executor = ProcessPoolExecutor(
+            max_workers=self.num_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker,
+            initargs=self.worker_args,
+        )
+        try:
+            slab_futures = [executor.submit(ingest_worker_slab, *slab) for slab in slabs]
+            for slab_future in as_completed(slab_futures):
+                yield slab_future.result()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+def init_worker(dataset_id, nc_file_path, ingest_mode, storage_layout, geometry_cache_dir,
+                bulk_inserter_class, bulk_insert_sql, batch_size, overview_bulk_insert_sqls, sinks,
+                overview_batch_size):
+    from .ocean_dataset_ingester import OceanDatasetIngester
+    from .ocean_dataset_processor import get_netcdf_file_data
+
+    global __worker_ingester
+
+    logging.basicConfig(level=logging.INFO)
+
+    netcdf_file_data = get_netcdf_file_data(nc_file_path, NetcdfReadMode.LAZY, read_memory_budget_bytes=0)
+
+    __worker_ingester = OceanDatasetIngester(dataset_id, netcdf_file_data, ingest_mode, storage_layout)
+    if bulk_inserter_class is not None:
+        __worker_ingester.set_bulk_inserter(bulk_inserter_class(bulk_insert_sql, batch_size))
+    for sink in sinks or []:
+        __worker_ingester.add_sink(sink)
+    __worker_ingester.set_cell_geometry_cache(get_cell_geometry_cache(netcdf_file_data, geometry_cache_dir))
+    if overview_bulk_insert_sqls:
+        __worker_ingester.set_overview_bulk_inserters({
+            factor: bulk_inserter_class(overview_bulk_insert_sql, overview_batch_size)
+            for factor, overview_bulk_insert_sql in overview_bulk_insert_sqls.items()
+        })
+
+
+def ingest_worker_slab(time_index: int, depth_index: int) -> IngestStatistics:
+    __worker_ingester.set_metrics(IngestMetrics())
+    __worker_ingester.reset_statistics()
+    __worker_ingester.ingest_slab(time_index, depth_index)
+    __worker_ingester.flush()
+    return __worker_ingester.get_statistics()
@@ -1,11 +1,20 @@
 import datetime
+import hashlib
+import os
+
+import numpy as np
+import xarray as xr
+from sqlalchemy import text, delete
+from sqlalchemy.dialects.postgresql import insert
 
 from db import Session
-from db.models import DatasetVariable, VariableThresholds, Dataset
-from .models import VariableThreshold
+from db.models import DatasetVariable, VariableThresholds, Dataset, IngestManifest
+from .models import VariableThreshold, IngestStatistics
 
 YEAR_MONTH_TAG = '<YYYYMM>'
 YEAR_MONTH_DAY_TAG = '<YYYYMMDD>'
+SOURCE_HASH_CHUNK_SIZE = 16 * 2 ** 20
+TIME_STEP_HASH_VARIABLES = ['temp', 'salt', 'u', 'v', 'zeta']
 
 
 def parse_ocean_dataset_path(ocean_dataset_path) -> str:
@@ -23,67 +32,63 @@ def parse_ocean_dataset_path(ocean_dataset_path) -> str:
 
 def insert_variables_and_thresholds(dataset_id: str, temperature_thresholds: dict[float, VariableThreshold],
                                     salinity_thresholds: dict[float, VariableThreshold],
-                                    zeta_thresholds: dict[float, VariableThreshold]):
-    temperature_variable = Session.query(DatasetVariable).filter(
-        DatasetVariable.dataset_id == dataset_id,
-        DatasetVariable.variable_name == 'temperature'
-    ).first()
-
-    if not temperature_variable:
-        temperature_variable = DatasetVariable()
-
-    temperature_variable.dataset_id = dataset_id
-    temperature_variable.variable_name = 'temperature'
-    temperature_variable.variable_type = 'layer'
-
-    temperature_variable.save()
-    temperature_variable.delete_all_thresholds()
-
-    __save_thresholds(temperature_variable.id, temperature_thresholds)
-
-    salinity_variable = Session.query(DatasetVariable).filter(
-        DatasetVariable.dataset_id == dataset_id,
-        DatasetVariable.variable_name == 'salinity'
-    ).first()
-
-    if not salinity_variable:
-        salinity_variable = DatasetVariable()
-
-    salinity_variable.dataset_id = dataset_id
-    salinity_variable.variable_name = 'salinity'
-    salinity_variable.variable_type = 'layer'
-
-    salinity_variable.save()
-    salinity_variable.delete_all_thresholds()
-
-    __save_thresholds(salinity_variable.id, salinity_thresholds)
-
-    zeta_variable = Session.query(DatasetVariable).filter(
-        DatasetVariable.dataset_id == dataset_id,
-        DatasetVariable.variable_name == 'zeta'
-    ).first()
-
-    if not zeta_variable:
-        zeta_variable = DatasetVariable()
-
-    zeta_variable.dataset_id = dataset_id
-    zeta_variable.variable_name = 'zeta'
-    zeta_variable.variable_type = 'layer'
-
-    zeta_variable.save()
-    zeta_variable.delete_all_thresholds()
-
-    __save_thresholds(zeta_variable.id, zeta_thresholds)
-
-
-def __save_thresholds(dataset_variable_id: int, thresholds: dict[float, VariableThreshold]):
-    for depth in thresholds:
-        VariableThresholds(
-            dataset_variable_id=dataset_variable_id,
-            min_value=thresholds[depth].min_value,
-            max_value=thresholds[depth].max_value,
-            dependent_variable_value=depth
-        ).save()
+                                    zeta_thresholds: dict[float, VariableThreshold],
+                                    current_speed_thresholds: dict[float, VariableThreshold],
+                                    current_direction_thresholds: dict[float, VariableThreshold],
+                                    vorticity_thresholds: dict[float, VariableThreshold]):
+    """
+    Upserts the variables of the dataset and their thresholds per depth in bulk, in a single transaction.
+    Thresholds of depths that are no longer ingested are deleted.
+    """
+    variables_thresholds = {
+        'temperature': temperature_thresholds,
+        'salinity': salinity_thresholds,
+        'zeta': zeta_thresholds,
+        'current_speed': current_speed_thresholds,
+        'current_direction': current_direction_thresholds,
+        'vorticity': vorticity_thresholds,
+    }
+
+    variable_insert = insert(DatasetVariable).values([
+        {'dataset_id': dataset_id, 'variable_name': variable_name, 'variable_type': 'layer'}
+        for variable_name in variables_thresholds
+    ])
+    variable_ids = dict(Session.execute(
+        variable_insert.on_conflict_do_update(
+            index_elements=['dataset_id', 'variable_name'],
+            set_={'variable_type': variable_insert.excluded.variable_type}
+        ).returning(DatasetVariable.variable_name, DatasetVariable.id)
+    ).all())
+
+    thresholds_values = [
+        {
+            'dataset_variable_id': variable_ids[variable_name],
+            'min_value': threshold.min_value,
+            'max_value': threshold.max_value,
+            'dependent_variable_value': depth,
+            'percentiles': threshold.get_percentiles(),
+            'histogram': threshold.get_histogram(),
+        }
+        for variable_name, thresholds in variables_thresholds.items()
+        for depth, threshold in thresholds.items()
+    ]
+    if thresholds_values:
+        thresholds_insert = insert(VariableThresholds).values(thresholds_values)
+        Session.execute(thresholds_insert.on_conflict_do_update(
+            index_elements=['dataset_variable_id', 'dependent_variable_value'],
+            set_={
+                column: thresholds_insert.excluded[column]
+                for column in ('min_value', 'max_value', 'percentiles', 'histogram')
+            }
+        ))
+
+    for variable_name, thresholds in variables_thresholds.items():
+        Session.execute(delete(VariableThresholds).where(
+            VariableThresholds.dataset_variable_id == variable_ids[variable_name],
+            VariableThresholds.dependent_variable_value.not_in(list(thresholds))
+        ))
+
+    Session.commit()
 
 
 def set_dataset_dates(dataset_id: str, start_date: datetime, end_date: datetime, time_step_minutes: int):
@@ -92,3 +97,121 @@ def set_dataset_dates(dataset_id: str, start_date: datetime, end_date: datetime,
     dataset.end_date = end_date
     dataset.time_step_minutes = time_step_minutes
     dataset.save()
+
+
+def bump_dataset_generation(dataset_id: str) -> int:
+    """
+    Tells the readers of a dataset, like the API's caches, that its data has changed.
+    Returns the new generation.
+    """
+    generation = Session.execute(
+        text('UPDATE dataset SET generation = generation + 1 WHERE id = :dataset_id RETURNING generation'),
+        {"dataset_id": dataset_id}
+    ).scalar_one()
+    Session.commit()
+    return generation
+
+
+def get_source_signature(source_path: str, with_hash: bool = False) -> tuple[int, float, str | None] | None:
+    """
+    Gets the size, modification time and, optionally, content hash of a local source file.
+    Returns None for sources that aren't local files.
+    """
+    if not os.path.isfile(source_path):
+        return None
+
+    source_stat = os.stat(source_path)
+
+    source_hash = None
+    if with_hash:
+        content_hash = hashlib.sha256()
+        with open(source_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(SOURCE_HASH_CHUNK_SIZE), b''):
+                content_hash.update(chunk)
+        source_hash = content_hash.hexdigest()
+
+    return source_stat.st_size, source_stat.st_mtime, source_hash
+
+
+def get_time_step_hashes(nc_file_path: str, time_indices: list[int]) -> list[str]:
+    """
+    Gets a hash of the ingested values of each of the time steps of a NetCDF file, which tells whether a time step
+    that was loaded from an earlier version of the file changed since.
+    The values are read a variable of a time step at a time.
+    """
+    time_step_hashes = []
+    with xr.open_dataset(nc_file_path) as ds:
+        for time_index in time_indices:
+            time_step_hash = hashlib.sha256()
+            for variable in TIME_STEP_HASH_VARIABLES:
+                time_step_hash.update(np.ascontiguousarray(ds[variable].isel(time=time_index).values).tobytes())
+            time_step_hashes.append(time_step_hash.hexdigest())
+    return time_step_hashes
+
+
+def get_ingest_manifest(dataset_id: str) -> IngestManifest | None:
+    IngestManifest.__table__.create(Session.connection(), checkfirst=True)
+    Session.commit()
+    return Session.get(IngestManifest, dataset_id)
+
+
+def save_ingest_manifest(dataset_id: str, source_path: str, source_signature: tuple[int, float, str | None],
+                         grid_id: str, storage_layout: str, loaded_times: list[datetime.datetime],
+                         loaded_time_hashes: dict[datetime.datetime, str]):
+    """
+    loaded_time_hashes: the hashes of the loaded time steps by time, of which any missing ones are saved as NULL.
+    """
+    ingest_manifest = Session.get(IngestManifest, dataset_id) or IngestManifest(dataset_id=dataset_id)
+    ingest_manifest.source_path = source_path
+    ingest_manifest.source_size, ingest_manifest.source_mtime, ingest_manifest.source_hash = source_signature
+    ingest_manifest.grid_id = grid_id
+    ingest_manifest.storage_layout = storage_layout
+    ingest_manifest.loaded_times = sorted(loaded_times)
+    ingest_manifest.loaded_time_hashes = [
+        loaded_time_hashes.get(loaded_time) for loaded_time in ingest_manifest.loaded_times
+    ]
+    ingest_manifest.updated_at = datetime.datetime.now()
+    ingest_manifest.save()
+
+
+def get_ingest_statistics(dataset_id: str) -> IngestStatistics:
+    """
+    Gets the statistics of what was previously ingested into a dataset, from its variables' thresholds.
+    The thresholds only ever grow as they are merged into, so their min, max and percentiles cover all the data ever
+    ingested into the dataset since its last full ingest, including the days that were since pruned by the retention
+    period.
+    """
+    ingest_statistics = IngestStatistics()
+    ingest_statistics.total_skipped_land_points = 0
+    ingest_statistics.total_skipped_nan_points = 0
+    ingest_statistics.total_failed_cells_count = 0
+    ingest_statistics.temperature_thresholds = dict()
+    ingest_statistics.salinity_thresholds = dict()
+    ingest_statistics.zeta_thresholds = dict()
+    ingest_statistics.current_speed_thresholds = dict()
+    ingest_statistics.current_direction_thresholds = dict()
+    ingest_statistics.vorticity_thresholds = dict()
+
+    variables_thresholds = {
+        'temperature': ingest_statistics.temperature_thresholds,
+        'salinity': ingest_statistics.salinity_thresholds,
+        'zeta': ingest_statistics.zeta_thresholds,
+        'current_speed': ingest_statistics.current_speed_thresholds,
+        'current_direction': ingest_statistics.current_direction_thresholds,
+        'vorticity': ingest_statistics.vorticity_thresholds,
+    }
+
+    dataset_variables = Session.query(DatasetVariable).filter(DatasetVariable.dataset_id == dataset_id)
+    for dataset_variable in dataset_variables:
+        if dataset_variable.variable_name not in variables_thresholds:
+            continue
+        for threshold in dataset_variable.thresholds:
+            variable_threshold = VariableThreshold(
+                dataset_variable.variable_name, float(threshold.min_value), float(threshold.max_value)
+            )
+            variable_threshold.set_histogram(threshold.histogram)
+            variables_thresholds[dataset_variable.variable_name][float(threshold.dependent_variable_value)] = (
+                variable_threshold
+            )
+
+    return ingest_statistics
@@ -0,0 +1,202 @@
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# The upper bounds of the batch latency histogram buckets, in seconds
+BATCH_LATENCY_BUCKETS = [0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float('inf')]
+
+LATEST_REPORT_FILE_NAME = 'latest.json'
+
+
+class IngestMetrics:
+    """
+    Metrics of the ingest of a dataset: the time spent in each stage, the rows and bytes written, the latencies of
+    the written batches and the skipped cells.
+    Metrics of separately ingested slabs, like those of worker processes, are merged.
+    """
+    stage_seconds: dict[str, float]
+    num_rows: int
+    num_bytes: int
+    batch_latency_counts: list[int]
+    batch_latency_seconds: float
+    skipped_land_points: int
+    skipped_nan_points: int
+    failed_cells: int
+
+    def __init__(self):
+        self.stage_seconds = dict()
+        self.num_rows = 0
+        self.num_bytes = 0
+        self.batch_latency_counts = [0] * len(BATCH_LATENCY_BUCKETS)
+        self.batch_latency_seconds = 0.0
+        self.skipped_land_points = 0
+        self.skipped_nan_points = 0
+        self.failed_cells = 0
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def time_stage(self, stage: str):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage_seconds(stage, time.perf_counter() - start_time)
+
+    def add_stage_seconds(self, stage: str, seconds: float):
+        with self.lock:
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+
+    def record_batch(self, num_rows: int, num_bytes: int, seconds: float):
+        """
+        Records a batch written by a bulk inserter, and the time it took to write.
+        """
+        with self.lock:
+            self.num_rows += num_rows
+            self.num_bytes += num_bytes
+            self.batch_latency_seconds += seconds
+            for bucket_index, bucket_bound in enumerate(BATCH_LATENCY_BUCKETS):
+                if seconds <= bucket_bound:
+                    self.batch_latency_counts[bucket_index] += 1
+                    break
+
+    def set_skipped_cells(self, skipped_land_points: int, skipped_nan_points: int, failed_cells: int):
+        self.skipped_land_points = skipped_land_points
+        self.skipped_nan_points = skipped_nan_points
+        self.failed_cells = failed_cells
+
+    def merge(self, other: 'IngestMetrics'):
+        with self.lock:
+            for stage, seconds in other.stage_seconds.items():
+                self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+            self.num_rows += other.num_rows
+            self.num_bytes += other.num_bytes
+            self.batch_latency_seconds += other.batch_latency_seconds
+            self.batch_latency_counts = [
+                count + other_count for count, other_count in zip(self.batch_latency_counts, other.batch_latency_counts)
+            ]
+
+    def to_report(self) -> dict:
+        db_write_seconds = self.stage_seconds.get('db_write', 0.0)
+        return {
+            'stage_seconds': {stage: round(seconds, 3) for stage, seconds in self.stage_seconds.items()},
+            'rows': self.num_rows,
+            'rows_per_second': round(self.num_rows / db_write_seconds, 1) if db_write_seconds else None,
+            'bytes_sent': self.num_bytes,
+            'batches': {
+                'count': sum(self.batch_latency_counts),
+                'sum_seconds': round(self.batch_latency_seconds, 3),
+                'buckets': dict(zip([str(bound) for bound in BATCH_LATENCY_BUCKETS], self.batch_latency_counts)),
+            },
+            'skipped_land_points': self.skipped_land_points,
+            'skipped_nan_points': self.skipped_nan_points,
+            'failed_cells': self.failed_cells,
+        }
+
+
+def write_run_report(report_dir: str, run_report: dict):
+    """
+    Writes the JSON report of an ingest run, named by its start time, and as the latest report.
+    """
+    try:
+        os.makedirs(report_dir, exist_ok=True)
+        report_path = os.path.join(report_dir, f'ingest_run_{run_report["started_at"].replace(":", "")}.json')
+        with open(report_path, 'w') as f:
+            json.dump(run_report, f, indent=2)
+
+        # Replaced atomically, since the API may be reading it
+        latest_report_path = os.path.join(report_dir, LATEST_REPORT_FILE_NAME)
+        with open(f'{latest_report_path}.tmp', 'w') as f:
+            json.dump(run_report, f, indent=2)
+        os.replace(f'{latest_report_path}.tmp', latest_report_path)
+
+        logger.info(f"Wrote the ingest run report to {report_path}")
+    except OSError as e:
+        logger.warning(f"Failed to write the ingest run report to {report_dir}: {str(e)}")
+
+
+def read_latest_run_report(report_dir: str) -> dict | None:
+    try:
+        with open(os.path.join(report_dir, LATEST_REPORT_FILE_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def get_prometheus_metrics(run_report: dict) -> str:
+    """
+    Formats the metrics of an ingest run report in the Prometheus text exposition format.
+    """
+    lines = [
+        '# HELP ingest_run_timestamp_seconds When the latest ingest run started.',
+        '# TYPE ingest_run_timestamp_seconds gauge',
+        f'ingest_run_timestamp_seconds {datetime.datetime.fromisoformat(run_report["started_at"]).timestamp()}',
+        '# HELP ingest_run_duration_seconds How long the latest ingest run took.',
+        '# TYPE ingest_run_duration_seconds gauge',
+        f'ingest_run_duration_seconds {run_report["duration_seconds"]}',
+        '# HELP ingest_fetch_seconds How long fetching the datasets of the latest ingest run took.',
+        '# TYPE ingest_fetch_seconds gauge',
+        f'ingest_fetch_seconds {run_report["fetch_seconds"]}',
+    ]
+
+    dataset_gauges = [
+        ('ingest_dataset_succeeded', 'Whether the dataset was ingested successfully.',
+         lambda report: int(report['status'] == 'succeeded')),
+        ('ingest_dataset_duration_seconds', 'How long ingesting the dataset took.',
+         lambda report: report['duration_seconds']),
+        ('ingest_dataset_rows', 'The rows written for the dataset.', lambda report: report['rows']),
+        ('ingest_dataset_bytes_sent', 'The bytes sent to the database for the dataset.',
+         lambda report: report['bytes_sent']),
+        ('ingest_dataset_skipped_land_points', 'The land cells skipped.',
+         lambda report: report['skipped_land_points']),
+        ('ingest_dataset_skipped_nan_points', 'The cells skipped for having NaN values.',
+         lambda report: report['skipped_nan_points']),
+        ('ingest_dataset_failed_cells', 'The cells that failed to ingest.', lambda report: report['failed_cells']),
+    ]
+    for name, description, get_value in dataset_gauges:
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} gauge')
+        for dataset_report in run_report['datasets']:
+            lines.append(f'{name}{{dataset_id="{dataset_report["dataset_id"]}"}} {get_value(dataset_report)}')
+
+    lines.append('# HELP ingest_dataset_stage_seconds The time spent in each stage of ingesting the dataset.')
+    lines.append('# TYPE ingest_dataset_stage_seconds gauge')
+    for dataset_report in run_report['datasets']:
+        for stage, seconds in dataset_report['stage_seconds'].items():
+            lines.append(
+                f'ingest_dataset_stage_seconds{{dataset_id="{dataset_report["dataset_id"]}",stage="{stage}"}} {seconds}'
+            )
+
+    lines.append('# HELP ingest_dataset_batch_latency_seconds The latencies of the batches written for the dataset.')
+    lines.append('# TYPE ingest_dataset_batch_latency_seconds histogram')
+    for dataset_report in run_report['datasets']:
+        dataset_label = f'dataset_id="{dataset_report["dataset_id"]}"'
+        cumulative_count = 0
+        for bucket_bound, count in dataset_report['batches']['buckets'].items():
+            cumulative_count += count
+            bucket_label = '+Inf' if bucket_bound == 'inf' else bucket_bound
+            lines.append(
+                f'ingest_dataset_batch_latency_seconds_bucket{{{dataset_label},le="{bucket_label}"}} {cumulative_count}'
+            )
+        lines.append(
+            f'ingest_dataset_batch_latency_seconds_sum{{{dataset_label}}} {dataset_report["batches"]["sum_seconds"]}'
+        )
+        lines.append(
+            f'ingest_dataset_batch_latency_seconds_count{{{dataset_label}}} {dataset_report["batches"]["count"]}'
+        )
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,7 @@
+import os
+
+from etc.config import config
+
+# The db package reads its connection settings on import, which the tests never connect with
+if not config.has_section('DB'):
+    config.read(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.ini.example'))
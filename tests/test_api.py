@@ -0,0 +1,66 @@
+import asyncio
+import datetime
+import gzip
+from types import SimpleNamespace
+
+import pytest
+from starlette.requests import Request
+
+# The api package reports the version of the somisana package it's deployed with
+pytest.importorskip('somisana')
+
+import api
+
+TILE = b'\x1a\x02tile'
+
+
+def get_tile(headers: dict) -> api.Response:
+    request = Request({
+        'type': 'http',
+        'method': 'GET',
+        'headers': [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+    })
+    return asyncio.run(api.get_tile('ds', 0, 0, 0, datetime.datetime(2024, 1, 1), -1.0, request))
+
+
+@pytest.fixture(autouse=True)
+def cached_tile(monkeypatch):
+    monkeypatch.setattr(
+        api.tile_cache, 'get_tile', lambda *args: (SimpleNamespace(generation=3), gzip.compress(TILE))
+    )
+
+
+@pytest.mark.parametrize('accept_encoding, gzip_accepted', [
+    ('gzip, deflate, br', True),
+    ('br;q=1.0, gzip;q=0.5', True),
+    ('*', True),
+    ('gzip;q=0, *', False),
+    ('identity', False),
+    (None, False),
+])
+def test_accepts_gzip(accept_encoding, gzip_accepted):
+    assert api.accepts_gzip(accept_encoding) == gzip_accepted
+
+
+def test_tiles_are_sent_compressed_to_clients_accepting_gzip():
+    response = get_tile({'Accept-Encoding': 'gzip'})
+
+    assert response.headers['content-encoding'] == 'gzip'
+    assert response.headers['vary'] == 'Accept-Encoding'
+    assert gzip.decompress(response.body) == TILE
+
+
+def test_tiles_are_decompressed_for_clients_not_accepting_gzip():
+    response = get_tile({})
+
+    assert 'content-encoding' not in response.headers
+    assert response.headers['vary'] == 'Accept-Encoding'
+    assert response.body == TILE
+    assert response.headers['etag'] != get_tile({'Accept-Encoding': 'gzip'}).headers['etag']
+
+
+def test_tiles_are_revalidated_per_encoding():
+    etag = get_tile({}).headers['etag']
+
+    assert get_tile({'If-None-Match': etag}).status_code == 304
+    assert get_tile({'If-None-Match': etag, 'Accept-Encoding': 'gzip'}).status_code == 200
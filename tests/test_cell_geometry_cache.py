@@ -0,0 +1,42 @@
+import numpy as np
+
+from ingest.ingesters.ocean_dataset.cell_geometry_cache import CellGeometryCache, LruCellGeometryCaches
+
+
+def get_cell_geometry_cache(fingerprint: str, num_cells: int) -> CellGeometryCache:
+    sea_cells = np.ones((1, num_cells), dtype=bool)
+    return CellGeometryCache(fingerprint, sea_cells, np.full(num_cells, b'00', dtype='S2'))
+
+
+def test_least_recently_used_caches_are_evicted_to_stay_within_the_budget():
+    cell_geometry_caches = [get_cell_geometry_cache(fingerprint, 100) for fingerprint in ('a', 'b', 'c')]
+    lru_cell_geometry_caches = LruCellGeometryCaches(2 * cell_geometry_caches[0].num_bytes)
+
+    lru_cell_geometry_caches.put(cell_geometry_caches[0])
+    lru_cell_geometry_caches.put(cell_geometry_caches[1])
+    assert lru_cell_geometry_caches.get('a') is cell_geometry_caches[0]
+    lru_cell_geometry_caches.put(cell_geometry_caches[2])
+
+    assert lru_cell_geometry_caches.get('a') is cell_geometry_caches[0]
+    assert lru_cell_geometry_caches.get('b') is None
+    assert lru_cell_geometry_caches.get('c') is cell_geometry_caches[2]
+    assert lru_cell_geometry_caches.num_bytes == 2 * cell_geometry_caches[0].num_bytes
+
+
+def test_caches_larger_than_the_budget_are_not_kept():
+    lru_cell_geometry_caches = LruCellGeometryCaches(1000)
+    lru_cell_geometry_caches.put(get_cell_geometry_cache('a', 10))
+    lru_cell_geometry_caches.put(get_cell_geometry_cache('b', 1000))
+
+    assert lru_cell_geometry_caches.get('a') is not None
+    assert lru_cell_geometry_caches.get('b') is None
+
+
+def test_putting_a_cache_again_replaces_it():
+    lru_cell_geometry_caches = LruCellGeometryCaches(10 ** 6)
+    lru_cell_geometry_caches.put(get_cell_geometry_cache('a', 10))
+    cell_geometry_cache = get_cell_geometry_cache('a', 20)
+    lru_cell_geometry_caches.put(cell_geometry_cache)
+
+    assert lru_cell_geometry_caches.get('a') is cell_geometry_cache
+    assert lru_cell_geometry_caches.num_bytes == cell_geometry_cache.num_bytes
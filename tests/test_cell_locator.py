@@ -0,0 +1,98 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+# The api package reports the version of the somisana package it's deployed with
+pytest.importorskip('somisana')
+
+from api import ocean_data
+from api.cell_locator import CellLocator
+from api.ocean_data import PointNotFound, locate_dataset_cell
+
+SPACING = 0.01
+
+
+def get_cell_locator(center_lon: float, center_lat: float, land: np.ndarray = None) -> CellLocator:
+    """
+    A cell locator over a 20 by 20 grid of cells around a point, without the cells on land.
+    The ids of the cells are their eta * 100 + xi indices.
+    """
+    eta, xi = np.meshgrid(np.arange(20), np.arange(20), indexing='ij')
+    lons = center_lon + (xi - 9.5) * SPACING
+    lats = center_lat + (eta - 9.5) * SPACING
+    sea = ~land if land is not None else np.ones(eta.shape, dtype=bool)
+    return CellLocator((eta * 100 + xi)[sea], lons[sea], lats[sea])
+
+
+def get_cell_center(center_lon: float, center_lat: float, eta: int, xi: int) -> tuple[float, float]:
+    return center_lon + (xi - 9.5) * SPACING, center_lat + (eta - 9.5) * SPACING
+
+
+@pytest.mark.parametrize('eta, xi, lon_offset, lat_offset', [
+    (0, 0, 0.0, 0.0),
+    (5, 12, 0.3, -0.4),
+    (19, 3, -0.45, 0.45),
+])
+def test_points_are_located_in_the_cell_they_fall_in(eta, xi, lon_offset, lat_offset):
+    cell_locator = get_cell_locator(18.0, -34.0)
+    lon, lat = get_cell_center(18.0, -34.0, eta, xi)
+
+    assert cell_locator.locate(lon + lon_offset * SPACING, lat + lat_offset * SPACING) == eta * 100 + xi
+
+
+def test_points_on_land_are_not_in_any_cell():
+    land = np.zeros((20, 20), dtype=bool)
+    land[5:12, 5:12] = True
+    cell_locator = get_cell_locator(18.0, -34.0, land)
+
+    assert cell_locator.locate(*get_cell_center(18.0, -34.0, 8, 8)) is None
+    assert cell_locator.locate(*get_cell_center(18.0, -34.0, 4, 8)) == 408
+
+
+@pytest.mark.parametrize('eta, xi', [(-3, 5), (5, 22), (25, 25)])
+def test_points_outside_of_the_grid_are_not_in_any_cell(eta, xi):
+    cell_locator = get_cell_locator(18.0, -34.0)
+
+    assert cell_locator.locate(*get_cell_center(18.0, -34.0, eta, xi)) is None
+
+
+def test_points_are_located_across_the_antimeridian():
+    cell_locator = get_cell_locator(180.0, -20.0)
+    lon, lat = get_cell_center(180.0, -20.0, 7, 12)
+
+    # The same point with a longitude on the other side of the antimeridian
+    assert lon > 180.0
+    assert cell_locator.locate(lon - 360.0, lat) == 712
+    assert cell_locator.locate(*get_cell_center(180.0, -20.0, 7, 8)) == 708
+
+
+def test_points_are_located_around_a_pole():
+    # Square cells of a kilometre around the south pole, as on a polar stereographic grid
+    eta, xi = np.meshgrid(np.arange(20), np.arange(20), indexing='ij')
+    xs, ys = (xi - 9.5) * 1000.0, (eta - 9.5) * 1000.0
+
+    def to_lon_lat(x, y):
+        return np.degrees(np.arctan2(y, x)), -90.0 + np.degrees(np.hypot(x, y) / 6371000.0)
+
+    cell_locator = CellLocator((eta * 100 + xi).ravel(), *(values.ravel() for values in to_lon_lat(xs, ys)))
+
+    assert cell_locator.locate(*to_lon_lat(xs[9, 10] + 300.0, ys[9, 10] - 400.0)) == 910
+    assert cell_locator.locate(*to_lon_lat(xs[0, 19] - 450.0, ys[0, 19] + 450.0)) == 19
+    assert cell_locator.locate(*to_lon_lat(xs[0, 19] + 2000.0, ys[0, 19])) is None
+
+
+def test_points_not_in_any_cell_of_a_dataset_are_not_found(monkeypatch):
+    cell_locator = get_cell_locator(18.0, -34.0)
+    monkeypatch.setattr(ocean_data, 'Session', SimpleNamespace(get=lambda model, dataset_id: SimpleNamespace(
+        id=dataset_id, grid_id='grid'
+    ) if dataset_id == 'ds' else None))
+    monkeypatch.setattr(ocean_data, 'get_cell_locator', lambda grid_id: cell_locator)
+
+    _, cell_id = locate_dataset_cell('ds', *get_cell_center(18.0, -34.0, 2, 3))
+    assert cell_id == 203
+
+    with pytest.raises(PointNotFound):
+        locate_dataset_cell('ds', *get_cell_center(18.0, -34.0, 2, 30))
+    with pytest.raises(PointNotFound):
+        locate_dataset_cell('other', *get_cell_center(18.0, -34.0, 2, 3))
@@ -0,0 +1,54 @@
+import csv
+
+import numpy as np
+from psycopg2.extensions import adapt
+
+from db.utils import to_array_literal, to_csv_value, to_csv_values, to_record_values
+
+
+def test_nan_and_none_are_null():
+    assert to_csv_values(np.array([1.5, np.nan, -2.0]), 3) == ['1.5', '', '-2.0']
+    assert to_csv_values(np.array(['{1}', None, ''], dtype=object), 3) == ['"{1}"', '', '""']
+    assert list(to_csv_values(None, 2)) == ['', '']
+    assert to_record_values(np.array([1.5, np.nan, -2.0]), 3) == [1.5, None, -2.0]
+
+
+def test_single_values_are_repeated_for_every_record():
+    assert list(to_csv_values('ds', 3)) == ['ds', 'ds', 'ds']
+    assert list(to_csv_values(-5.0, 2)) == ['-5.0', '-5.0']
+    assert list(to_record_values('ds', 2)) == ['ds', 'ds']
+
+
+def test_array_literals_are_quoted():
+    array_literal = to_array_literal(np.array([1.25, np.nan, -3.5]))
+    assert array_literal == '{1.25,NULL,-3.5}'
+
+    values = [array_literal, '{"a,b","c""d"}', 'plain']
+    csv_values = [to_csv_value(value) for value in values]
+    assert csv_values == ['"{1.25,NULL,-3.5}"', '"{""a,b"",""c""""d""}"', '"plain"']
+
+    # Read back as a CSV line, like COPY does
+    assert next(csv.reader([','.join(csv_values)])) == values
+
+
+def test_numbers_are_not_quoted():
+    assert [to_csv_value(value) for value in (3, -0.5, None)] == ['3', '-0.5', '']
+
+
+def test_floats_are_written_as_execute_values_writes_them():
+    values = np.random.default_rng(0).normal(0, 10.0 ** np.arange(-8, 9), (100, 17)).ravel()
+    values[::7] = np.nan
+
+    for float_values in (values, values.astype(np.float32)):
+        csv_values = to_csv_values(float_values, len(float_values))
+        record_values = to_record_values(float_values, len(float_values))
+
+        # psycopg2 puts a space before negative numbers, so they can't make a -- comment in the query
+        assert csv_values == [
+            '' if record_value is None else adapt(record_value).getquoted().decode().lstrip()
+            for record_value in record_values
+        ]
+        # The values read back are the float64 values of the column
+        np.testing.assert_array_equal(
+            [float(csv_value) if csv_value else np.nan for csv_value in csv_values], float_values.astype(np.float64)
+        )
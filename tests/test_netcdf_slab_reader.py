@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from bench.synthetic_roms import write_synthetic_roms_file
+from ingest.ingesters.ocean_dataset.netcdf_slab_reader import NETCDF_SLAB_VARIABLES, NetcdfSlabReader
+
+NUM_TIMES = 4
+NUM_DEPTHS = 3
+
+
+@pytest.fixture
+def slab_reader(tmp_path):
+    nc_path = str(tmp_path / 'roms.nc')
+    write_synthetic_roms_file(nc_path, NUM_TIMES, NUM_DEPTHS, 6, 8)
+    ds = xr.open_dataset(nc_path)
+    slab_bytes = sum(ds[variable][0, 0].nbytes for variable in NETCDF_SLAB_VARIABLES) + ds['zeta'][0].nbytes
+    # Room for the slab being ingested, and two prefetched slabs
+    slab_reader = NetcdfSlabReader(ds, 3 * slab_bytes)
+    yield slab_reader
+    slab_reader.close()
+
+
+def test_only_the_following_slabs_of_the_slab_order_are_prefetched(slab_reader):
+    slab_order = [(time_index, depth_index) for time_index in (3, 1) for depth_index in range(NUM_DEPTHS)]
+    slab_reader.set_slab_order(slab_order)
+
+    prefetched_slabs = []
+    for slab_indices in slab_order:
+        slab = slab_reader.get_slab(*slab_indices)
+        prefetched_slabs.append(set(slab_reader.prefetched_slabs))
+
+        np.testing.assert_array_equal(slab.temps, slab_reader.ds['temp'][slab_indices].values)
+        np.testing.assert_array_equal(slab.zetas, slab_reader.ds['zeta'][slab_indices[0]].values)
+
+    assert prefetched_slabs == [
+        {(3, 1), (3, 2)},
+        {(3, 2), (1, 0)},
+        {(1, 0), (1, 1)},
+        {(1, 1), (1, 2)},
+        {(1, 2)},
+        set(),
+    ]
+
+
+def test_nothing_is_prefetched_without_a_slab_order(slab_reader):
+    slab_reader.get_slab(0, 0)
+
+    assert slab_reader.prefetched_slabs == dict()
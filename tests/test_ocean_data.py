@@ -0,0 +1,34 @@
+import datetime
+from types import SimpleNamespace
+
+import pytest
+
+# The api package reports the version of the somisana package it's deployed with
+pytest.importorskip('somisana')
+
+from api import ocean_data
+from api.models import CellValues
+
+
+def test_vertical_profile_reads_a_time_with_a_timezone_as_naive_utc(monkeypatch):
+    cell_value_filters = []
+
+    def get_cell_values(dataset, cell_id, filters=None):
+        cell_value_filters.append(filters)
+        return [
+            CellValues(date_time=filters['date_time'], depth=depth, temperature=20.0 + depth, salinity=35.0,
+                       u_velocity=0.1, v_velocity=0.2, zeta=None, current_speed=None, current_direction=None,
+                       vorticity=None)
+            for depth in (-10.0, -5.0)
+        ]
+
+    monkeypatch.setattr(ocean_data, 'locate_dataset_cell', lambda dataset_id, lon, lat: (SimpleNamespace(), 7))
+    monkeypatch.setattr(ocean_data, 'get_cell_values', get_cell_values)
+    monkeypatch.setattr(ocean_data, 'Session', SimpleNamespace(remove=lambda: None))
+
+    date_time = datetime.datetime(2024, 1, 2, 14, 0, tzinfo=datetime.timezone(datetime.timedelta(hours=2)))
+    profile = ocean_data.read_vertical_profile('ds', -34.0, 18.0, date_time, None)
+
+    assert cell_value_filters == [{'date_time': datetime.datetime(2024, 1, 2, 12, 0)}]
+    assert profile.date_time == datetime.datetime(2024, 1, 2, 12, 0)
+    assert profile.depths == [-10.0, -5.0]
@@ -0,0 +1,160 @@
+import datetime
+import re
+from types import SimpleNamespace
+
+import pytest
+
+from db import ocean_dataset_data_table_orchestrator
+from db.ocean_dataset_data_table_orchestrator import OceanDatasetDataTableOrchestrator
+from etc.const import StorageLayout
+
+DATASET_ID = 'ds'
+
+# The table get_ocean_data_tile reads the cells of each storage layout from
+TILE_TABLE_NAMES = {
+    StorageLayout.WIDE.value: f'{DATASET_ID}_ocean_dataset_data',
+    StorageLayout.NORMALIZED.value: f'{DATASET_ID}_ocean_dataset_value',
+    StorageLayout.SLAB.value: f'{DATASET_ID}_ocean_dataset_slab',
+}
+
+STORAGE_LAYOUTS = [StorageLayout.WIDE, StorageLayout.NORMALIZED, StorageLayout.SLAB]
+
+DATE_TIMES = [datetime.datetime(2024, 1, 2, hour) for hour in (0, 6)]
+
+
+class FakeDatabase:
+    """
+    Keeps the tables and the dataset's storage layout that readers see, which only change once a transaction commits,
+    and checks that the dataset's tiles can be read after every commit.
+    """
+    tables: set[str]
+    storage_layout: str
+    dataset: SimpleNamespace
+    pending_changes: list
+    num_commits: int
+    overview_statements: list
+
+    def __init__(self, tables: set[str], storage_layout: str):
+        self.tables = set(tables)
+        self.storage_layout = storage_layout
+        self.dataset = SimpleNamespace(storage_layout=storage_layout, grid_id=None)
+        self.pending_changes = []
+        self.num_commits = 0
+        self.overview_statements = []
+
+    def execute(self, statement, params=None):
+        sql = str(statement)
+        drop_table = re.match(r'DROP TABLE IF EXISTS (\w+)', sql)
+        if drop_table:
+            self.pending_changes.append((drop_table.group(1), None))
+            return None
+        if 'dataset_overview' in sql:
+            self.overview_statements.append((' '.join(sql.split()), params))
+            return None
+        if 'pg_tables' in sql:
+            table_names = [table_name for table_name in self.tables if re.match(params['pattern'], table_name)]
+            return SimpleNamespace(scalars=lambda: SimpleNamespace(all=lambda: table_names))
+        raise AssertionError(f'Unexpected statement: {sql}')
+
+    def get(self, model, dataset_id):
+        assert dataset_id == DATASET_ID
+        return self.dataset
+
+    def switch_tables(self, current_table_name: str, temp_table_name: str, commit: bool = True):
+        self.pending_changes.append((temp_table_name, current_table_name))
+        if commit:
+            self.commit()
+
+    def swap_partitions(self, current_table_name: str, temp_table_name: str, commit: bool = True):
+        self.pending_changes.append((temp_table_name, None))
+        if commit:
+            self.commit()
+
+    def create_table(self, attributes, table_name: str):
+        self.tables.add(table_name)
+        self.commit()
+
+    def commit(self):
+        for table_name, new_table_name in self.pending_changes:
+            self.tables.discard(table_name)
+            if new_table_name is not None:
+                self.tables.discard(new_table_name)
+                self.tables.add(new_table_name)
+        self.pending_changes = []
+        self.storage_layout = self.dataset.storage_layout
+        self.num_commits += 1
+        self.assert_tiles_readable()
+
+    def assert_tiles_readable(self):
+        assert TILE_TABLE_NAMES[self.storage_layout] in self.tables, (self.storage_layout, self.tables)
+
+
+@pytest.fixture
+def fake_database(request, monkeypatch):
+    storage_layout = request.param
+    database = FakeDatabase({TILE_TABLE_NAMES[storage_layout.value]}, storage_layout.value)
+    monkeypatch.setattr(ocean_dataset_data_table_orchestrator, 'Session', database)
+    monkeypatch.setattr(ocean_dataset_data_table_orchestrator, 'switch_tables', database.switch_tables)
+    monkeypatch.setattr(ocean_dataset_data_table_orchestrator, 'swap_partitions', database.swap_partitions)
+    monkeypatch.setattr(ocean_dataset_data_table_orchestrator, 'create_table', database.create_table)
+    monkeypatch.setattr(ocean_dataset_data_table_orchestrator, 'table_exists', lambda name: name in database.tables)
+    monkeypatch.setattr(ocean_dataset_data_table_orchestrator, 'table_is_partitioned', lambda name: False)
+    return database
+
+
+@pytest.mark.parametrize('fake_database', STORAGE_LAYOUTS, indirect=True, ids=lambda layout: layout.value)
+@pytest.mark.parametrize('storage_layout', STORAGE_LAYOUTS, ids=lambda layout: layout.value)
+def test_switching_tables_keeps_tiles_readable(fake_database, storage_layout):
+    fake_database.assert_tiles_readable()
+
+    orchestrator = OceanDatasetDataTableOrchestrator(DATASET_ID, storage_layout)
+    orchestrator.create_ingest_into_table()
+    orchestrator.switch_tables('grid', DATE_TIMES)
+
+    assert fake_database.num_commits >= 3
+    assert fake_database.storage_layout == storage_layout.value
+    assert fake_database.dataset.grid_id == 'grid'
+    assert fake_database.tables == {TILE_TABLE_NAMES[storage_layout.value]}
+    assert orchestrator.tables_switched
+
+
+@pytest.mark.parametrize('fake_database', [StorageLayout.WIDE], indirect=True, ids=lambda layout: layout.value)
+def test_switching_tables_records_the_time_steps_of_the_overviews(fake_database):
+    fake_database.tables |= {
+        'dataset_overview', f'{DATASET_ID}_ocean_dataset_data_o2', f'{DATASET_ID}_ocean_dataset_data_o8'
+    }
+
+    orchestrator = OceanDatasetDataTableOrchestrator(DATASET_ID, StorageLayout.WIDE)
+    orchestrator.create_ingest_into_table()
+    orchestrator.overview_tables = {
+        2: (f'{DATASET_ID}_ocean_dataset_data_o2', f'{DATASET_ID}_temp_ocean_dataset_data_o2'),
+        4: (f'{DATASET_ID}_ocean_dataset_data_o4', f'{DATASET_ID}_ocean_dataset_data_o4'),
+    }
+    orchestrator.switch_tables('grid', DATE_TIMES)
+
+    deleted_factors, *overview_statements = fake_database.overview_statements
+    assert deleted_factors[0].startswith('DELETE FROM dataset_overview')
+    assert deleted_factors[1]['factors'] == [2, 4]
+    # Both the switched in and the new overview table only have the ingested time steps
+    for factor, (delete_times, insert_times) in zip([2, 4], zip(overview_statements[::2], overview_statements[1::2])):
+        assert delete_times[0].endswith('AND factor = :factor AND TRUE')
+        assert delete_times[1]['factor'] == factor
+        assert insert_times[0].startswith('INSERT INTO dataset_overview')
+        assert insert_times[1] == {'dataset_id': DATASET_ID, 'factor': factor, 'date_times': DATE_TIMES}
+    assert f'{DATASET_ID}_ocean_dataset_data_o8' not in fake_database.tables
+
+
+@pytest.mark.parametrize('fake_database', [StorageLayout.WIDE], indirect=True, ids=lambda layout: layout.value)
+def test_ingesting_into_the_current_table_only_replaces_the_ingested_time_steps_of_the_overviews(fake_database):
+    overview_table_name = f'{DATASET_ID}_ocean_dataset_data_o2'
+    fake_database.tables |= {'dataset_overview', overview_table_name}
+
+    orchestrator = OceanDatasetDataTableOrchestrator(DATASET_ID, StorageLayout.WIDE)
+    orchestrator.use_current_table(DATE_TIMES)
+    orchestrator.overview_tables = {2: (overview_table_name, overview_table_name)}
+    orchestrator.switch_tables('grid', DATE_TIMES)
+
+    delete_times, insert_times = fake_database.overview_statements
+    assert delete_times[0].endswith('AND factor = :factor AND date_time = ANY(:date_times)')
+    assert insert_times[1]['date_times'] == DATE_TIMES
+    assert overview_table_name in fake_database.tables
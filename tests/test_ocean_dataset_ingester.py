@@ -0,0 +1,111 @@
+import re
+import struct
+
+import numpy as np
+import pytest
+
+from bench.synthetic_roms import write_synthetic_roms_file
+from db.utils import BulkInserter
+from etc.const import IngestMode, NetcdfReadMode, StorageLayout
+from ingest.ingesters.ocean_dataset.cell_geometry_cache import get_cell_geometry_cache
+from ingest.ingesters.ocean_dataset.ocean_dataset_ingester import OceanDatasetIngester, SURFACE_DEPTH
+from ingest.ingesters.ocean_dataset.ocean_dataset_processor import get_netcdf_file_data
+
+NUM_TIMES = 2
+NUM_DEPTHS = 3
+NUM_ETA = 14
+NUM_XI = 18
+
+THRESHOLD_ATTRIBUTES = [
+    'temperature_thresholds',
+    'salinity_thresholds',
+    'zeta_thresholds',
+    'current_speed_thresholds',
+    'current_direction_thresholds',
+    'vorticity_thresholds',
+]
+
+
+class RecordCapturingBulkInserter(BulkInserter):
+    """
+    Keeps the records it's given rather than inserting them.
+    """
+    records: list
+
+    def __init__(self):
+        super().__init__('', 10 ** 9)
+        self.records = []
+
+    def send_records(self, pending_records) -> int:
+        self.records.extend(pending_records)
+        return 0
+
+
+@pytest.fixture(scope='module')
+def netcdf_file_data(tmp_path_factory):
+    nc_path = str(tmp_path_factory.mktemp('roms') / 'roms.nc')
+    write_synthetic_roms_file(nc_path, NUM_TIMES, NUM_DEPTHS, NUM_ETA, NUM_XI, land_fraction=0.3, nan_rate=0.1)
+    return get_netcdf_file_data(nc_path, NetcdfReadMode.EAGER)
+
+
+def ingest(netcdf_file_data, ingest_mode: IngestMode, cache_dir: str) -> tuple[OceanDatasetIngester, dict]:
+    ingester = OceanDatasetIngester('ds', netcdf_file_data, ingest_mode, StorageLayout.WIDE, NUM_TIMES)
+    ingester.set_cell_geometry_cache(get_cell_geometry_cache(netcdf_file_data, cache_dir))
+    bulk_inserter = RecordCapturingBulkInserter()
+    ingester.set_bulk_inserter(bulk_inserter)
+    ingester.ingest_slabs()
+
+    rows = dict()
+    for record in bulk_inserter.records:
+        dataset_id, cell_id, date_time, depth, geometry, *values = record
+        rows[(str(date_time), float(depth), int(cell_id))] = (dataset_id, get_polygon_points(geometry), values)
+    return ingester, rows
+
+
+def get_polygon_points(geometry) -> np.ndarray:
+    """
+    Gets the points of a polygon given as the WKT geometry of the per cell ingest or the hex EWKB of the vectorized one.
+    """
+    if isinstance(geometry, str):
+        ewkb = bytes.fromhex(geometry)
+        _, _, _, _, num_points = struct.unpack_from('<BIIII', ewkb)
+        return np.array(struct.unpack_from(f'<{2 * num_points}d', ewkb, 17)).reshape(num_points, 2)
+
+    wkt_points = re.search(r'POLYGON\(\((.*)\)\)', str(geometry)).group(1)
+    return np.array([[float(value) for value in point.split()] for point in wkt_points.split(',')])
+
+
+def test_vectorized_ingest_matches_per_cell_ingest(netcdf_file_data, tmp_path):
+    per_cell_ingester, per_cell_rows = ingest(netcdf_file_data, IngestMode.PER_CELL, str(tmp_path))
+    vectorized_ingester, vectorized_rows = ingest(netcdf_file_data, IngestMode.VECTORIZED, str(tmp_path))
+
+    assert per_cell_rows
+    assert vectorized_rows.keys() == per_cell_rows.keys()
+
+    # The grid has land, NaN cells, and surface cells both with and without a zeta
+    assert per_cell_ingester.total_skipped_land_points > 0
+    assert per_cell_ingester.total_skipped_nan_points > 0
+    surface_zetas = [values[4] for (_, depth, _), (_, _, values) in per_cell_rows.items() if depth == SURFACE_DEPTH]
+    assert any(zeta is None for zeta in surface_zetas)
+    assert any(zeta is not None for zeta in surface_zetas)
+
+    for key, (dataset_id, points, values) in per_cell_rows.items():
+        vectorized_dataset_id, vectorized_points, vectorized_values = vectorized_rows[key]
+        assert vectorized_dataset_id == dataset_id
+        np.testing.assert_array_equal(vectorized_points, points)
+        assert [value is None for value in vectorized_values] == [value is None for value in values], key
+        assert vectorized_values == pytest.approx(values, rel=1e-6, abs=1e-12), key
+
+    assert vectorized_ingester.total_skipped_land_points == per_cell_ingester.total_skipped_land_points
+    assert vectorized_ingester.total_skipped_nan_points == per_cell_ingester.total_skipped_nan_points
+    assert vectorized_ingester.total_failed_cells_count == per_cell_ingester.total_failed_cells_count == 0
+
+    for threshold_attribute in THRESHOLD_ATTRIBUTES:
+        per_cell_thresholds = getattr(per_cell_ingester, threshold_attribute)
+        vectorized_thresholds = getattr(vectorized_ingester, threshold_attribute)
+        assert vectorized_thresholds.keys() == per_cell_thresholds.keys(), threshold_attribute
+        for depth, threshold in per_cell_thresholds.items():
+            assert vectorized_thresholds[depth].min_value == pytest.approx(threshold.min_value, rel=1e-6)
+            assert vectorized_thresholds[depth].max_value == pytest.approx(threshold.max_value, rel=1e-6)
+            if threshold.histogram_counts is not None:
+                np.testing.assert_array_equal(vectorized_thresholds[depth].histogram_counts, threshold.histogram_counts)
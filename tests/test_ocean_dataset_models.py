@@ -0,0 +1,183 @@
+import struct
+
+import numpy as np
+import pytest
+
+from ingest.ingesters.ocean_dataset.models import (
+    EARTH_RADIUS_METERS, HISTOGRAM_BINS, PERCENTILES, WGS84_SRID, NetcdfFileData, VariableThreshold,
+    get_cells_ewkb, get_current_directions, get_current_speeds
+)
+
+GRID_CENTER_LON = 18.0
+GRID_CENTER_LAT = -34.0
+
+
+def get_values(variable_name: str, size: int, seed: int = 0) -> np.ndarray:
+    """
+    Values spread over part of the histogram range of a variable, skewed so the percentiles aren't symmetric.
+    """
+    range_min, range_max, _ = HISTOGRAM_BINS[variable_name]
+    values = np.random.default_rng(seed).gamma(2.0, 1.0, size)
+    return range_min + (range_max - range_min) * (0.1 + 0.6 * values / values.max())
+
+
+@pytest.mark.parametrize('variable_name', list(HISTOGRAM_BINS))
+def test_percentiles_are_estimated_to_within_a_bin_width(variable_name):
+    values = get_values(variable_name, 100_000)
+    variable_threshold = VariableThreshold(variable_name)
+    variable_threshold.check_set_threshold_values(values)
+
+    _, _, bin_width = HISTOGRAM_BINS[variable_name]
+    percentiles = variable_threshold.get_percentiles()
+    assert list(percentiles) == PERCENTILES
+    np.testing.assert_allclose(
+        list(percentiles.values()), np.percentile(values, PERCENTILES), rtol=0, atol=bin_width
+    )
+    assert variable_threshold.min_value == values.min()
+    assert variable_threshold.max_value == values.max()
+
+
+def test_single_values_are_counted_like_arrays_of_values():
+    values = get_values('temperature', 1000)
+    variable_threshold = VariableThreshold('temperature')
+    for value in values:
+        variable_threshold.check_set_thresholds(value)
+    array_variable_threshold = VariableThreshold('temperature')
+    array_variable_threshold.check_set_threshold_values(values)
+
+    np.testing.assert_array_equal(variable_threshold.histogram_counts, array_variable_threshold.histogram_counts)
+    assert variable_threshold.get_percentiles() == array_variable_threshold.get_percentiles()
+
+
+@pytest.mark.parametrize('variable_name', list(HISTOGRAM_BINS))
+def test_merged_histograms_equal_a_histogram_of_all_the_values(variable_name):
+    values = get_values(variable_name, 10_000)
+    first_values, second_values = values[:3000], values[3000:]
+
+    variable_threshold = VariableThreshold(variable_name)
+    variable_threshold.check_set_threshold_values(first_values)
+    other_variable_threshold = VariableThreshold(variable_name)
+    other_variable_threshold.check_set_threshold_values(second_values)
+    variable_threshold.merge(other_variable_threshold)
+
+    all_variable_threshold = VariableThreshold(variable_name)
+    all_variable_threshold.check_set_threshold_values(values)
+
+    np.testing.assert_array_equal(variable_threshold.histogram_counts, all_variable_threshold.histogram_counts)
+    assert variable_threshold.min_value == all_variable_threshold.min_value
+    assert variable_threshold.max_value == all_variable_threshold.max_value
+    assert variable_threshold.get_percentiles() == all_variable_threshold.get_percentiles()
+
+
+def test_merging_a_saved_histogram_equals_a_histogram_of_all_the_values():
+    values = get_values('salinity', 10_000)
+
+    # As an incremental ingest merges the thresholds saved by the earlier ingests
+    saved_variable_threshold = VariableThreshold('salinity')
+    saved_variable_threshold.check_set_threshold_values(values[:5000])
+    variable_threshold = VariableThreshold(
+        'salinity', saved_variable_threshold.min_value, saved_variable_threshold.max_value
+    )
+    variable_threshold.set_histogram(saved_variable_threshold.get_histogram())
+
+    new_variable_threshold = VariableThreshold('salinity')
+    new_variable_threshold.check_set_threshold_values(values[5000:])
+    new_variable_threshold.merge(variable_threshold)
+
+    all_variable_threshold = VariableThreshold('salinity')
+    all_variable_threshold.check_set_threshold_values(values)
+
+    np.testing.assert_array_equal(new_variable_threshold.histogram_counts, all_variable_threshold.histogram_counts)
+    assert new_variable_threshold.get_percentiles() == all_variable_threshold.get_percentiles()
+
+
+def test_values_outside_of_the_histogram_range_are_counted_in_its_end_bins():
+    variable_threshold = VariableThreshold('temperature')
+    variable_threshold.check_set_threshold_values(np.array([-50.0, 100.0]))
+
+    assert variable_threshold.histogram_counts[0] == 1
+    assert variable_threshold.histogram_counts[-1] == 1
+    assert variable_threshold.histogram_counts.sum() == 2
+
+
+def get_curvilinear_grid(num_eta: int = 30, num_xi: int = 40) -> tuple[NetcdfFileData, np.ndarray, np.ndarray]:
+    """
+    A grid rotated from east and north, with cells of a few hundred meters that grow along both of its axes.
+    Returns the grid, and the eastward and northward distances in meters of its points from the grid's center.
+    """
+    eta, xi = np.meshgrid(np.arange(num_eta, dtype=np.float64), np.arange(num_xi, dtype=np.float64), indexing='ij')
+    along_xi = 200.0 * xi + 2.0 * xi ** 2
+    along_eta = 150.0 * eta + 3.0 * eta ** 2
+    rotation = np.radians(30.0)
+    xs = along_xi * np.cos(rotation) - along_eta * np.sin(rotation)
+    ys = along_xi * np.sin(rotation) + along_eta * np.cos(rotation)
+    xs, ys = xs - xs.mean(), ys - ys.mean()
+
+    netcdf_file_data = NetcdfFileData()
+    netcdf_file_data.set_coordinates(
+        GRID_CENTER_LON + np.degrees(xs / (EARTH_RADIUS_METERS * np.cos(np.radians(GRID_CENTER_LAT)))),
+        GRID_CENTER_LAT + np.degrees(ys / EARTH_RADIUS_METERS),
+    )
+    return netcdf_file_data, xs, ys
+
+
+def test_solid_body_rotation_has_a_vorticity_of_twice_its_angular_velocity():
+    netcdf_file_data, xs, ys = get_curvilinear_grid()
+    angular_velocity = 1e-5
+
+    # Counterclockwise around the grid's center
+    vorticities = netcdf_file_data.get_vorticities(-angular_velocity * ys, angular_velocity * xs)
+
+    np.testing.assert_allclose(vorticities, 2 * angular_velocity, rtol=1e-3)
+
+
+def test_uniform_flow_has_no_vorticity():
+    netcdf_file_data, xs, _ = get_curvilinear_grid()
+
+    vorticities = netcdf_file_data.get_vorticities(np.full(xs.shape, 0.3), np.full(xs.shape, -0.2))
+
+    np.testing.assert_allclose(vorticities, 0.0, atol=1e-12)
+
+
+def test_points_next_to_points_without_values_have_no_vorticity():
+    netcdf_file_data, xs, ys = get_curvilinear_grid()
+    us, vs = -1e-5 * ys, 1e-5 * xs
+    us[10, 10] = vs[10, 10] = np.nan
+
+    vorticities = netcdf_file_data.get_vorticities(us, vs)
+
+    without_vorticity = np.zeros(xs.shape, dtype=bool)
+    without_vorticity[9:12, 10] = without_vorticity[10, 9:12] = True
+    np.testing.assert_array_equal(np.isnan(vorticities), without_vorticity)
+
+
+def test_current_speeds():
+    np.testing.assert_allclose(
+        get_current_speeds(np.array([3.0, 0.0, -1.0]), np.array([4.0, 0.0, 0.0])), [5.0, 0.0, 1.0]
+    )
+
+
+def test_current_directions_are_where_currents_flow_towards_clockwise_from_north():
+    # Flowing north, east, south and west, and north-east
+    us = np.array([0.0, 1.0, 0.0, -1.0, 1.0])
+    vs = np.array([1.0, 0.0, -1.0, 0.0, 1.0])
+
+    np.testing.assert_allclose(get_current_directions(us, vs), [0.0, 90.0, 180.0, 270.0, 45.0])
+
+
+def test_cells_are_encoded_as_ewkb_polygons_with_an_srid():
+    lons = np.array([[18.0, 18.1, 18.1, 18.0], [-179.95, 179.95, 179.95, -179.95]])
+    lats = np.array([[-34.0, -34.0, -33.9, -33.9], [-20.05, -20.05, -19.95, -19.95]])
+
+    cells_ewkb = get_cells_ewkb(lons, lats)
+
+    assert len(cells_ewkb) == 2
+    for cell_ewkb, cell_lons, cell_lats in zip(cells_ewkb, lons, lats):
+        ewkb = bytes.fromhex(cell_ewkb.decode())
+        byte_order, geometry_type, srid, num_rings, num_points = struct.unpack_from('<BIIII', ewkb)
+        points = np.frombuffer(ewkb, dtype='<f8', offset=struct.calcsize('<BIIII')).reshape(-1, 2)
+
+        assert (byte_order, geometry_type, srid, num_rings, num_points) == (1, 3 | 0x20000000, WGS84_SRID, 1, 5)
+        # A closed ring of the corners, with the exact float64 coordinates
+        np.testing.assert_array_equal(points[:4], np.stack([cell_lons, cell_lats], axis=-1))
+        np.testing.assert_array_equal(points[4], points[0])
@@ -0,0 +1,5 @@
+from .models import TileKey
+from .tile_renderer import render_tile
+from .tile_store import TileStore
+from .lru_tile_cache import LruTileCache
+from .tile_seeder import TileSeeder, TileSeedReport
@@ -0,0 +1,42 @@
+import threading
+from collections import OrderedDict
+
+from .models import TileKey
+
+
+class LruTileCache:
+    """
+    An in-memory cache of rendered tiles, which evicts the least recently used tiles to stay within a byte budget.
+    """
+    max_bytes: int
+    num_bytes: int
+    tiles: OrderedDict[TileKey, bytes]
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.num_bytes = 0
+        self.tiles = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, tile_key: TileKey) -> bytes | None:
+        with self.lock:
+            tile = self.tiles.get(tile_key)
+            if tile is not None:
+                self.tiles.move_to_end(tile_key)
+            return tile
+
+    def put(self, tile_key: TileKey, tile: bytes):
+        if len(tile) > self.max_bytes:
+            return
+
+        with self.lock:
+            previous_tile = self.tiles.pop(tile_key, None)
+            if previous_tile is not None:
+                self.num_bytes -= len(previous_tile)
+
+            self.tiles[tile_key] = tile
+            self.num_bytes += len(tile)
+
+            while self.num_bytes > self.max_bytes:
+                _, evicted_tile = self.tiles.popitem(last=False)
+                self.num_bytes -= len(evicted_tile)
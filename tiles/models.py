@@ -0,0 +1,44 @@
+import datetime
+
+
+class TileKey:
+    """
+    Identifies a rendered tile. The generation of the dataset is part of the key, so that the tiles of a dataset
+    are invalidated whenever an ingest switches in new data.
+    Times are in UTC, like the ingested data: a time with an offset is converted to UTC, and one without an offset
+    is taken to be in UTC already.
+    """
+    dataset_id: str
+    generation: int
+    date_time: datetime.datetime
+    depth: float
+    z: int
+    x: int
+    y: int
+
+    def __init__(self, dataset_id: str, generation: int, date_time: datetime.datetime, depth: float,
+                 z: int, x: int, y: int):
+        self.dataset_id = dataset_id
+        self.generation = generation
+        if date_time.tzinfo is not None:
+            date_time = date_time.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        self.date_time = date_time
+        self.depth = depth
+        self.z = z
+        self.x = x
+        self.y = y
+
+    def get_path(self) -> str:
+        """
+        The relative path of the tile in a tile store, which can be served by a static file server.
+        """
+        return (
+            f'{self.dataset_id}/{self.generation}/{self.date_time.strftime("%Y%m%dT%H%M%S")}/{self.depth:g}/'
+            f'{self.z}/{self.x}/{self.y}.mvt.gz'
+        )
+
+    def __eq__(self, other):
+        return isinstance(other, TileKey) and self.get_path() == other.get_path()
+
+    def __hash__(self):
+        return hash(self.get_path())
@@ -0,0 +1,27 @@
+import gzip
+import json
+
+from sqlalchemy import text
+
+from db import Session
+from .models import TileKey
+
+TILE_COMPRESS_LEVEL = 6
+
+
+def render_tile(tile_key: TileKey) -> bytes:
+    """
+    Renders a tile with get_ocean_data_tile, and returns it gzip compressed, as it's stored and served.
+    """
+    query = {
+        'dataset_id': tile_key.dataset_id,
+        'date_time': tile_key.date_time.isoformat(),
+        'depth': tile_key.depth,
+    }
+    mvt = Session.execute(
+        text('SELECT get_ocean_data_tile(:z, :x, :y, CAST(:query AS jsonb))'),
+        {'z': tile_key.z, 'x': tile_key.x, 'y': tile_key.y, 'query': json.dumps(query)}
+    ).scalar()
+    Session.commit()
+
+    return gzip.compress(bytes(mvt or b''), compresslevel=TILE_COMPRESS_LEVEL)
@@ -0,0 +1,99 @@
+import datetime
+import logging
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from db import Session
+from .models import TileKey
+from .tile_renderer import render_tile
+from .tile_store import TileStore
+
+logger = logging.getLogger(__name__)
+
+# The latitudes beyond which web mercator tiles don't extend
+WEB_MERCATOR_MAX_LATITUDE = 85.0511287798
+
+
+class TileSeedReport:
+    num_tiles: int
+    num_bytes: int
+    duration_seconds: float
+
+    def __init__(self, num_tiles: int, num_bytes: int, duration_seconds: float):
+        self.num_tiles = num_tiles
+        self.num_bytes = num_bytes
+        self.duration_seconds = duration_seconds
+
+    @property
+    def tiles_per_second(self) -> float:
+        return self.num_tiles / self.duration_seconds if self.duration_seconds else 0.0
+
+
+class TileSeeder:
+    """
+    Pre-renders the tiles of a newly ingested dataset over its bounds into a tile store, so that the first users to
+    view it don't all trigger the rendering of the same tiles.
+    """
+    tile_store: TileStore
+    min_zoom: int
+    max_zoom: int
+    num_workers: int
+
+    def __init__(self, tile_store: TileStore, min_zoom: int, max_zoom: int, num_workers: int):
+        self.tile_store = tile_store
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.num_workers = num_workers
+
+    def seed_tiles(self, dataset_id: str, generation: int, bounds: tuple[float, float, float, float],
+                   date_times: list[datetime.datetime], depths: list[float]) -> TileSeedReport:
+        """
+        bounds: (west, south, east, north) in degrees.
+        """
+        start_time = time.time()
+        self.tile_store.prune_generations(dataset_id, generation)
+
+        tile_keys = [
+            TileKey(dataset_id, generation, date_time, depth, z, x, y)
+            for date_time in date_times
+            for depth in depths
+            for z in range(self.min_zoom, self.max_zoom + 1)
+            for x, y in get_tiles_in_bounds(z, *bounds)
+        ]
+        logger.info(f"Seeding {len(tile_keys)} tiles of {dataset_id} with {self.num_workers} workers")
+
+        with ThreadPoolExecutor(max_workers=self.num_workers, thread_name_prefix='tile_seeder') as executor:
+            num_bytes = sum(executor.map(self.seed_tile, tile_keys))
+
+        tile_seed_report = TileSeedReport(len(tile_keys), num_bytes, time.time() - start_time)
+        logger.info(
+            f"Seeded {tile_seed_report.num_tiles} tiles of {dataset_id} in {tile_seed_report.duration_seconds:.2f} "
+            f"seconds ({tile_seed_report.tiles_per_second:.1f} tiles/s), writing {num_bytes / 2 ** 20:.1f} MiB"
+        )
+        return tile_seed_report
+
+    def seed_tile(self, tile_key: TileKey) -> int:
+        try:
+            tile = render_tile(tile_key)
+        finally:
+            Session.remove()
+        self.tile_store.put(tile_key, tile)
+        return len(tile)
+
+
+def get_tiles_in_bounds(z: int, west: float, south: float, east: float, north: float) -> list[tuple[int, int]]:
+    """
+    Gets the (x, y) of the web mercator tiles at zoom level z that cover the bounds.
+    """
+    min_x, min_y = get_tile(z, west, north)
+    max_x, max_y = get_tile(z, east, south)
+    return [(x, y) for x in range(min_x, max_x + 1) for y in range(min_y, max_y + 1)]
+
+
+def get_tile(z: int, lon: float, lat: float) -> tuple[int, int]:
+    num_tiles = 2 ** z
+    lat = max(-WEB_MERCATOR_MAX_LATITUDE, min(WEB_MERCATOR_MAX_LATITUDE, lat))
+    x = int((lon + 180.0) / 360.0 * num_tiles)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * num_tiles)
+    return min(max(x, 0), num_tiles - 1), min(max(y, 0), num_tiles - 1)
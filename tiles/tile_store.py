@@ -0,0 +1,55 @@
+import logging
+import os
+import shutil
+import tempfile
+
+from .models import TileKey
+
+logger = logging.getLogger(__name__)
+
+
+class TileStore:
+    """
+    Keeps rendered tiles on disk, laid out by TileKey.get_path under the root directory.
+    Tiles are written to a temporary file which is moved into place, so a tile is never read half written.
+    """
+    root_dir: str
+
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+
+    def get_tile_path(self, tile_key: TileKey) -> str:
+        return os.path.join(self.root_dir, tile_key.get_path())
+
+    def get(self, tile_key: TileKey) -> bytes | None:
+        try:
+            with open(self.get_tile_path(tile_key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, tile_key: TileKey, tile: bytes):
+        tile_path = self.get_tile_path(tile_key)
+        os.makedirs(os.path.dirname(tile_path), exist_ok=True)
+
+        fd, temp_tile_path = tempfile.mkstemp(dir=os.path.dirname(tile_path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(tile)
+            os.replace(temp_tile_path, tile_path)
+        except OSError:
+            os.unlink(temp_tile_path)
+            raise
+
+    def prune_generations(self, dataset_id: str, generation: int):
+        """
+        Deletes the tiles of the generations of a dataset other than the given one, which can no longer be served.
+        """
+        dataset_dir = os.path.join(self.root_dir, dataset_id)
+        if not os.path.isdir(dataset_dir):
+            return
+
+        for generation_dir in os.listdir(dataset_dir):
+            if generation_dir != str(generation):
+                logger.info(f"Deleting the tiles of generation {generation_dir} of {dataset_id}")
+                shutil.rmtree(os.path.join(dataset_dir, generation_dir), ignore_errors=True)